@@ -1,7 +1,16 @@
 import sqlite3
 import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict
+
+from app.result_cache import db_version, normalize_sql, result_cache
+from app.resultset import to_records
+from app.singleflight import SingleFlight
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,10 +35,181 @@ else:
     # Default fallback
     DB_PATH = (PROJECT_ROOT / "data" / "northwind.db").resolve()
 
+# Precomputed rollup tables (see rollups.py) live in a sidecar file attached as "rollup"
+env_rollup_path = os.getenv("ROLLUP_DB_PATH")
+if env_rollup_path:
+    candidate = Path(env_rollup_path)
+    ROLLUP_DB_PATH = (candidate if candidate.is_absolute() else PROJECT_ROOT / candidate).resolve()
+else:
+    ROLLUP_DB_PATH = DB_PATH.with_name(f"{DB_PATH.stem}_rollups.db")
+
 logger.info(f"DB_PATH from env: {env_db_path}")
 logger.info(f"Resolved database path: {DB_PATH}")
 logger.info(f"Database file exists: {DB_PATH.exists()}")
 
+# --- Connection pool settings ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "500"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+
+
+def _decode_text(b: bytes) -> str:
+    # Ensure SQLite returns bytes safely
+    return b.decode(errors='ignore')
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only SQLite connections.
+    Connections are opened lazily (URI `mode=ro`, so WAL readers never block
+    the writer), up to `size`, and handed out from a queue; each keeps its own
+    prepared-statement cache of `statement_cache` entries.
+    """
+
+    def __init__(self, db_path: Path, size: int = DB_POOL_SIZE,
+                 attach: Dict[str, Path] | None = None,
+                 timeout: float = DB_POOL_TIMEOUT,
+                 statement_cache: int = DB_STATEMENT_CACHE):
+        self.db_path = db_path
+        self.attach = attach or {}
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache = statement_cache
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._generation = 0
+        self._conn_generation: Dict[int, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{self.db_path.as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=self.statement_cache,
+        )
+        conn.text_factory = _decode_text
+        for name, path in self.attach.items():
+            if path.exists():
+                conn.execute(f"ATTACH DATABASE ? AS {name}", (f"{path.as_uri()}?mode=ro",))
+        conn.execute("PRAGMA query_only = ON")
+        self._conn_generation[id(conn)] = self._generation
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise TimeoutError(f"No database connection available after {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += time.perf_counter() - start
+
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._in_use -= 1
+            stale = self._conn_generation.get(id(conn)) != self._generation
+        if stale:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Connection is unusable; drop it so a fresh one gets opened
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._created -= 1
+            self._conn_generation.pop(id(conn), None)
+        conn.close()
+
+    def recycle(self) -> None:
+        """Reopen every connection (e.g. after an attached database appeared); in-use ones close on release."""
+        with self._lock:
+            self._generation += 1
+        self.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_time_ms": round(self._wait_time * 1000, 3),
+                "timeouts": self._timeouts,
+                "statement_cache": self.statement_cache,
+            }
+
+
+pool = ConnectionPool(DB_PATH, attach={"rollup": ROLLUP_DB_PATH})
+
+# Identical SQL already running on another thread is waited for, not run again
+sql_flight = SingleFlight("sql")
+
+
+def data_version() -> tuple:
+    """Version token covering the main database and the rollup file."""
+    return db_version(DB_PATH) + db_version(ROLLUP_DB_PATH)
+
+
 def init_database():
     """Verify database exists and is accessible"""
     try:
@@ -41,62 +221,127 @@ def init_database():
             logger.error(f"Database file does not exist: {abs_db_path}")
             return False
 
-        conn = sqlite3.connect(str(abs_db_path))
-        # Ensure SQLite returns bytes safely
-        conn.text_factory = lambda b: b.decode(errors='ignore')
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
+        with pool.connection() as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
         logger.info(f"Found {len(tables)} tables in database")
         if tables:
             logger.info(f"Tables: {[t[0] for t in tables[:5]]}")
 
-        conn.close()
         return True
 
     except Exception as e:
         logger.error(f"Error accessing database: {e}")
         return False
 
-def run_sql(query: str):
-    """Execute SQL query and return results safely"""
-    def safe_str(value):
-        if isinstance(value, bytes):
-            return value.decode('utf-8', errors='ignore')
-        return value
+def safe_str(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='ignore')
+    return value
 
-    try:
-        abs_db_path = DB_PATH
-        if not abs_db_path.exists():
-            error_msg = f"Database file not found at: {abs_db_path}"
-            logger.error(error_msg)
-            return {"error": error_msg}
 
-        conn = sqlite3.connect(str(abs_db_path), detect_types=sqlite3.PARSE_DECLTYPES)
-        conn.text_factory = lambda b: b.decode(errors='ignore')
-        cursor = conn.cursor()
-        cursor.execute(query)
+def _sanitize(batch: list[tuple]) -> list[tuple]:
+    # text already comes back decoded via _decode_text; only BLOB cells are still bytes
+    return [
+        tuple(safe_str(val) for val in row) if any(type(val) is bytes for val in row) else row
+        for row in batch
+    ]
+
 
-        if query.strip().upper().startswith("SELECT"):
+def iter_sql(query: str, batch_size: int = SQL_FETCH_SIZE):
+    """
+    Yield (columns, rows) batches straight off the cursor with fetchmany, rows
+    as tuples, so a large result is never held in memory whole. The pooled
+    connection stays checked out until the generator is exhausted or closed.
+    Errors are raised.
+    """
+    with pool.connection() as conn:
+        cursor = conn.execute(query)
+        try:
+            if cursor.description is None:
+                return
             columns = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            sanitized_rows = [
-                {col: safe_str(val) for col, val in zip(columns, row)}
-                for row in rows
-            ]
-            return sanitized_rows
-        else:
-            conn.commit()
-            return {"message": "Query executed successfully", "rows_affected": cursor.rowcount}
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield columns, _sanitize(batch)
+        finally:
+            cursor.close()
+
+
+def run_sql_columnar(query: str, max_rows: int | None = SQL_MAX_ROWS, use_cache: bool = True):
+    """
+    Execute SQL and return {"columns": [...], "rows": [tuple, ...], "truncated": bool}.
+    At most `max_rows` rows are fetched (None = no cap); `truncated` says whether more were available.
+    Statements that return no rows give {"message", "rows_affected"}; failures give {"error"}.
+    Row results are served from / stored in the result cache, keyed on the
+    normalized SQL and invalidated whenever the database file changes; a miss
+    for SQL that is already executing waits for that run (sql_flight).
+    """
+    if not use_cache:
+        return _execute_columnar(query, max_rows)
+
+    key = (normalize_sql(query), max_rows)
+    version = data_version()
+    cached = result_cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    result, _ = sql_flight.do((key, version), _execute_and_cache, query, max_rows, key, version)
+    return result
+
+
+def _execute_and_cache(query: str, max_rows: int | None, key: tuple, version) -> Dict:
+    result = _execute_columnar(query, max_rows)
+    if "columns" in result:
+        result_cache.put(key, version, result)
+    return result
+
+
+def _execute_columnar(query: str, max_rows: int | None):
+    try:
+        with pool.connection() as conn:
+            cursor = conn.execute(query)
+            try:
+                # description is set for anything that returns rows (SELECT, WITH ..., PRAGMA)
+                if cursor.description is None:
+                    return {"message": "Query executed successfully", "rows_affected": cursor.rowcount}
+
+                columns = [col[0] for col in cursor.description]
+                rows = []
+                truncated = False
+                while True:
+                    size = SQL_FETCH_SIZE if max_rows is None else min(SQL_FETCH_SIZE, max_rows - len(rows) + 1)
+                    batch = cursor.fetchmany(size)
+                    if not batch:
+                        break
+                    rows.extend(_sanitize(batch))
+                    if max_rows is not None and len(rows) > max_rows:
+                        del rows[max_rows:]
+                        truncated = True
+                        break
+                return {"columns": columns, "rows": rows, "truncated": truncated}
+            finally:
+                cursor.close()
+
+    except sqlite3.OperationalError as e:
+        if not DB_PATH.exists():
+            error_msg = f"Database file not found at: {DB_PATH}"
+            logger.error(error_msg)
+            return {"error": error_msg}
+        logger.error(f"Error executing SQL query: {e}")
+        return {"error": str(e)}
 
     except Exception as e:
         logger.error(f"Error executing SQL query: {e}")
         return {"error": str(e)}
 
-    finally:
-        if "conn" in locals():
-            conn.close()
 
-# Run a test on import
-init_database()
+def run_sql(query: str, max_rows: int | None = SQL_MAX_ROWS):
+    """Execute SQL query and return results safely"""
+    result = run_sql_columnar(query, max_rows)
+    if "columns" not in result:
+        return result
+    if result["truncated"]:
+        logger.warning(f"Result truncated to {max_rows} rows")
+    return to_records(result)
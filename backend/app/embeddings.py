@@ -1,7 +1,18 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Example embeddings are cached here so restarts skip re-encoding them ("" disables the cache)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".cache"))
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.55"))
 
 intents = {
     "historical": [
@@ -18,21 +29,85 @@ intents = {
     ]
 }
 
-intent_embeddings = {
-    intent: [model.encode(example) for example in examples]
-    for intent, examples in intents.items()
-}
+_model = None
+_labels: list[str] = []
+_matrix: np.ndarray | None = None  # (n_examples, dim), rows L2-normalized, grouped by intent
+_starts: np.ndarray | None = None  # first row of each intent's group, for np.maximum.reduceat
+_lock = threading.Lock()
+
+
+def get_model():
+    """The shared SentenceTransformer, loaded on first use (raises ImportError without sentence-transformers)."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def _cache_path() -> Path | None:
+    if not EMBEDDING_CACHE_DIR:
+        return None
+    key = hashlib.sha1(json.dumps([EMBEDDING_MODEL, intents], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return Path(EMBEDDING_CACHE_DIR) / f"intent_embeddings_{key}.npy"
+
+
+def _load_examples() -> None:
+    """Batch-encode every intent example once (or read them from the disk cache)."""
+    global _labels, _matrix, _starts
+    labels = list(intents)
+    counts = [len(intents[i]) for i in labels]
+    path = _cache_path()
+
+    matrix = None
+    if path is not None and path.exists():
+        try:
+            matrix = np.load(path)
+            if matrix.shape[0] != sum(counts):
+                matrix = None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache {path}: {e}")
+            matrix = None
+    if matrix is None:
+        examples = [example for intent in labels for example in intents[intent]]
+        matrix = np.asarray(get_model().encode(examples, batch_size=64, normalize_embeddings=True), dtype=np.float32)
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                np.save(path, matrix)
+            except OSError as e:
+                logger.warning(f"Could not write embedding cache {path}: {e}")
+
+    _starts = np.cumsum([0] + counts[:-1])
+    _labels = labels
+    _matrix = matrix
+
+
+def warm() -> None:
+    """Load the model and the example matrix now instead of on the first request."""
+    get_model()
+    if _matrix is None:
+        with _lock:
+            if _matrix is None:
+                _load_examples()
+
+
+def classify_intent(user_query: str) -> tuple[str, float]:
+    """
+    (intent, best cosine similarity): one encode and one matrix-vector product
+    against the pre-normalized examples. Below INTENT_THRESHOLD it is "historical".
+    """
+    warm()
+    query = np.asarray(get_model().encode(user_query, normalize_embeddings=True), dtype=np.float32)
+    scores = np.maximum.reduceat(_matrix @ query, _starts)
+    best = int(np.argmax(scores))
+    score = float(scores[best])
+    if score < INTENT_THRESHOLD:
+        return "historical", score
+    return _labels[best], score
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 def detect_intent(user_query: str) -> str:
-    query_embedding = model.encode(user_query)
-    scores = {}
-    for intent, vectors in intent_embeddings.items():
-        sims = [cosine_similarity(query_embedding, v) for v in vectors]
-        scores[intent] = max(sims)
-    best_intent = max(scores, key=scores.get)
-    if scores[best_intent] < 0.55:
-        return "historical"
-    return best_intent
+    return classify_intent(user_query)[0]
@@ -0,0 +1,155 @@
+"""
+Forecasting backends and automatic model selection.
+
+A backend is `fn(values: np.ndarray, horizon: int, season: int) -> (forecast ndarray, info dict)`.
+The NumPy models here cost microseconds to milliseconds; forecast_service
+registers the statsmodels ARIMA backend on top when it is installed.
+`select_and_forecast` backtests the candidates on a holdout within a time
+budget and refits the winner on the full series.
+"""
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORECAST_SELECTION_BUDGET = float(os.getenv("FORECAST_SELECTION_BUDGET", "2.0"))
+
+Backend = Callable[[np.ndarray, int, int], Tuple[np.ndarray, Dict[str, Any]]]
+
+# name -> backend, in the order they are tried (cheapest first)
+BACKENDS: Dict[str, Backend] = {}
+
+
+def register(name: str):
+    def wrap(fn: Backend) -> Backend:
+        BACKENDS[name] = fn
+        return fn
+    return wrap
+
+
+@register("seasonal_naive")
+def seasonal_naive(values: np.ndarray, horizon: int, season: int):
+    """Repeat the last full season (or the last value when history is shorter than a season)."""
+    if season > 1 and len(values) >= season:
+        last = values[-season:]
+        return np.resize(last, horizon), {"season": season}
+    return np.full(horizon, values[-1], dtype=float), {"season": 1}
+
+
+@register("linear_trend")
+def linear_trend(values: np.ndarray, horizon: int, season: int):
+    """Least-squares straight line through the history."""
+    t = np.arange(len(values), dtype=float)
+    slope, intercept = np.polyfit(t, values, 1)
+    future = np.arange(len(values), len(values) + horizon, dtype=float)
+    return intercept + slope * future, {"slope": float(slope)}
+
+
+_ALPHAS = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+_BETAS = np.array([0.01, 0.1, 0.3])
+_GAMMAS = np.array([0.05, 0.2, 0.5])
+
+
+@register("holt_winters")
+def holt_winters(values: np.ndarray, horizon: int, season: int):
+    """
+    Additive Holt-Winters (Holt's linear trend when there are fewer than two
+    seasons of history). Every (alpha, beta, gamma) on a small grid is run at
+    once as NumPy vectors; the combination with the lowest one-step SSE wins.
+    """
+    y = np.asarray(values, dtype=float)
+    seasonal = season > 1 and len(y) >= 2 * season
+    m = season if seasonal else 1
+    gammas = _GAMMAS if seasonal else np.array([0.0])
+
+    a, b, g = (x.ravel() for x in np.meshgrid(_ALPHAS, _BETAS, gammas, indexing="ij"))
+    k = len(a)
+
+    if seasonal:
+        first, second = y[:m], y[m:2 * m]
+        slope = (second.mean() - first.mean()) / m
+        # seasonal offsets from the first two seasons with the trend removed
+        drift = slope * (np.arange(m) - (m - 1) / 2)
+        offsets = ((first - first.mean() - drift) + (second - second.mean() - drift)) / 2
+        level = np.full(k, first.mean() + slope * (m - 1) / 2)
+        trend = np.full(k, slope)
+        seas = np.tile(offsets, (k, 1))
+        start = m
+    else:
+        level = np.full(k, y[0])
+        trend = np.full(k, y[1] - y[0] if len(y) > 1 else 0.0)
+        seas = np.zeros((k, 1))
+        start = 1
+
+    sse = np.zeros(k)
+    for t in range(start, len(y)):
+        s = seas[:, t % m]
+        pred = level + trend + s
+        sse += (y[t] - pred) ** 2
+        new_level = a * (y[t] - s) + (1 - a) * (level + trend)
+        trend = b * (new_level - level) + (1 - b) * trend
+        seas[:, t % m] = g * (y[t] - new_level) + (1 - g) * s
+        level = new_level
+
+    best = int(np.argmin(sse))
+    steps = np.arange(1, horizon + 1)
+    season_idx = (len(y) + steps - 1) % m
+    forecast = level[best] + steps * trend[best] + seas[best, season_idx]
+    info = {"alpha": float(a[best]), "beta": float(b[best]), "seasonal": seasonal}
+    if seasonal:
+        info["gamma"] = float(g[best])
+    return forecast, info
+
+
+def _mae(actual: np.ndarray, predicted: np.ndarray) -> float:
+    return float(np.mean(np.abs(actual - predicted)))
+
+
+def select_and_forecast(values: np.ndarray, horizon: int, season: int = 12,
+                        candidates: List[str] | None = None,
+                        budget: float = FORECAST_SELECTION_BUDGET) -> Dict[str, Any]:
+    """
+    Backtest each candidate on the last `holdout` points (train on the rest),
+    stop trying new candidates once `budget` seconds are spent, then refit
+    the lowest-MAE model on the full series.
+    Returns {"model", "forecast", "fit_time_ms", "info", "backtest"}.
+    """
+    values = np.asarray(values, dtype=float)
+    names = [n for n in (candidates or list(BACKENDS)) if n in BACKENDS]
+    holdout = min(horizon, max(1, len(values) // 5))
+    train, test = values[:-holdout], values[-holdout:]
+
+    start = time.perf_counter()
+    backtest: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        if backtest and time.perf_counter() - start > budget:
+            backtest[name] = {"skipped": "time budget exhausted"}
+            continue
+        t0 = time.perf_counter()
+        try:
+            predicted, _ = BACKENDS[name](train, holdout, season)
+            backtest[name] = {"mae": _mae(test, np.asarray(predicted, dtype=float)),
+                              "time_ms": round((time.perf_counter() - t0) * 1000, 3)}
+        except Exception as e:
+            logger.warning(f"Forecast backend {name} failed in backtest: {e}")
+            backtest[name] = {"error": str(e)}
+
+    scored = [(r["mae"], n) for n, r in backtest.items() if "mae" in r and np.isfinite(r["mae"])]
+    if not scored:
+        raise RuntimeError("no forecasting backend produced a usable backtest")
+    chosen = min(scored)[1]
+
+    t0 = time.perf_counter()
+    forecast, info = BACKENDS[chosen](values, horizon, season)
+    fit_time = (time.perf_counter() - t0) * 1000
+    return {
+        "model": chosen,
+        "forecast": np.asarray(forecast, dtype=float),
+        "fit_time_ms": round(fit_time, 3),
+        "info": info,
+        "backtest": backtest,
+    }
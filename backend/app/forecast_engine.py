@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from app.forecast_service import (
+    _detect_time_and_value_columns,
+    cached_fits,
+    extract_horizon_from_prompt,
+    forecast_arima,
+    series_values,
+    store_fits,
+    take_new_fits,
+)
+from app.result_profile import profile_result
+from app.resultset import as_columnar
+from app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(os.cpu_count() or 2)))
+# Fits submitted but not finished; beyond this new forecasts are refused instead of queueing forever
+FORECAST_QUEUE_SIZE = int(os.getenv("FORECAST_QUEUE_SIZE", str(4 * FORECAST_WORKERS)))
+FORECAST_FIT_TIMEOUT = float(os.getenv("FORECAST_FIT_TIMEOUT", "20"))
+FORECAST_MAX_GROUPS = int(os.getenv("FORECAST_MAX_GROUPS", "20"))
+MIN_GROUP_POINTS = 6
+
+# Forecasts of the same series and horizon already being fitted are waited for, not refitted
+forecast_flight = SingleFlight("forecast")
+
+
+def _detect_dimension(result: Dict[str, Any], profile: Dict[str, Any]) -> Optional[str]:
+    """
+    A category column whose values repeat across periods, e.g. CategoryName in
+    (Month, CategoryName, Sales) — the rows then hold one series per value and
+    must be forecast separately.
+    """
+    columns = result["columns"]
+    rows = result["rows"]
+    periods = {r[columns.index(profile["time"])] for r in rows}
+    if len(periods) == len(rows):
+        return None
+    for col in profile["categories"]:
+        i = columns.index(col)
+        groups = {r[i] for r in rows}
+        if 1 < len(groups) < len(rows):
+            return col
+    return None
+
+
+def _series_profile(tcol: str, vcol: str) -> Dict[str, Any]:
+    """Profile of a (time, value) series split off an already profiled result."""
+    return {
+        "columns": {tcol: {"role": "time"}, vcol: {"role": "measure"}},
+        "time": tcol, "measures": [vcol], "categories": [], "value": vcol,
+    }
+
+
+def _split_groups(result: Dict[str, Any], dimension: str, tcol: str, vcol: str) -> Dict[Any, Dict[str, Any]]:
+    """One (time, value) columnar result per dimension value, largest totals first."""
+    columns = result["columns"]
+    di, ti, vi = columns.index(dimension), columns.index(tcol), columns.index(vcol)
+    groups: Dict[Any, List[tuple]] = {}
+    for r in result["rows"]:
+        groups.setdefault(r[di], []).append((r[ti], r[vi]))
+
+    def total(item):
+        try:
+            return sum(float(v or 0) for _, v in item[1])
+        except (TypeError, ValueError):
+            return 0.0
+
+    ordered = sorted(groups.items(), key=total, reverse=True)
+    return {
+        key: {"columns": [tcol, vcol], "rows": rows, "truncated": False}
+        for key, rows in ordered
+        if len(rows) >= MIN_GROUP_POINTS
+    }
+
+
+def _worker_ready() -> int:
+    # unpickling this in a fresh worker imports app.forecast_engine, i.e. pandas/numpy/statsmodels
+    return os.getpid()
+
+
+def _forecast_job(series: Dict[str, Any], horizon: int, profile: Dict[str, Any],
+                  fits: List[Dict[str, Any]]) -> tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    One series, in a worker: seed the worker's ARIMA cache with the parent's
+    matching fits, forecast, and return the forecast with the fits made meanwhile.
+    """
+    store_fits(fits)
+    return forecast_arima(series, horizon, None, profile), take_new_fits()
+
+
+class ForecastEngine:
+    """
+    Runs forecast_arima (model selection included) in a process pool so fits never hold the request
+    thread's GIL. Pending fits are bounded (FORECAST_QUEUE_SIZE) and each
+    call has a deadline. Results with a dimension column are split into one
+    series per value and the series are fitted in parallel.
+    """
+
+    def __init__(self, workers: int = FORECAST_WORKERS, queue_size: int = FORECAST_QUEUE_SIZE,
+                 timeout: float = FORECAST_FIT_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps worker processes free of the parent's threads and HTTP clients
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def prestart(self) -> None:
+        """
+        Spawn the worker processes now, so a forecast that is known to be
+        coming does not also pay for process start-up and imports.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_worker_ready)
+
+    def _reserve(self, n: int) -> bool:
+        """Claim queue slots for a whole batch; an idle engine always accepts one batch."""
+        with self._lock:
+            if self._pending and self._pending + n > self.queue_size:
+                return False
+            self._pending += n
+            return True
+
+    def _submit_all(self, jobs: List[tuple], horizon: int) -> Optional[List[tuple]]:
+        if not self._reserve(len(jobs)):
+            return None
+        futures = []
+        for i, (key, series, profile) in enumerate(jobs):
+            values = series_values(series, profile)
+            fits = cached_fits(values) if values is not None else []
+            try:
+                future = self._get_executor().submit(_forecast_job, series, horizon, profile, fits)
+            except Exception:
+                for _ in jobs[i:]:
+                    self._release()
+                raise
+            future.add_done_callback(self._finished)
+            futures.append((key, future))
+        return futures
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _finished(self, future) -> None:
+        self._release()
+        # kept even when the caller stopped waiting: the next request for this series reuses the fit
+        if not future.cancelled() and future.exception() is None:
+            store_fits(future.result()[1])
+
+    def _plan(self, rows, horizon: Optional[int], prompt: Optional[str], profile: Optional[Dict[str, Any]]):
+        """Decide what to submit: [(group key or None, series, profile)], plus the dimension column."""
+        result = as_columnar(rows)
+        if horizon is None:
+            horizon = extract_horizon_from_prompt(prompt, default=3)
+        if profile is None:
+            profile = profile_result(result)
+        tcol, vcol = _detect_time_and_value_columns(result, profile)
+        dimension = _detect_dimension(result, profile) if tcol and vcol and result["rows"] else None
+        if dimension is None:
+            return horizon, None, [(None, result, profile)]
+        groups = _split_groups(result, dimension, tcol, vcol)
+        series_profile = _series_profile(tcol, vcol)
+        return horizon, dimension, [(key, series, series_profile)
+                                    for key, series in list(groups.items())[:FORECAST_MAX_GROUPS]]
+
+    @staticmethod
+    def _combine(dimension: Optional[str], outcomes: List[tuple]) -> Dict[str, Any]:
+        if dimension is None:
+            return outcomes[0][1]
+        if not outcomes:
+            return {"note": f"No {dimension} group has enough history to forecast."}
+        return {
+            "group_col": dimension,
+            "series": {str(key): value for key, value in outcomes},
+        }
+
+    @staticmethod
+    def _jobs_key(horizon: int, dimension: Optional[str], jobs: List[tuple]) -> tuple:
+        """forecast_flight key: identical series, profiles and horizon give identical forecasts."""
+        h = hashlib.sha1(repr((dimension, [(key, series["columns"], series["rows"], series_profile)
+                                           for key, series, series_profile in jobs])).encode("utf-8"))
+        return horizon, h.hexdigest()
+
+    def forecast(self, rows, horizon: Optional[int] = None, prompt: Optional[str] = None,
+                 profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Blocking forecast; waits at most `timeout` seconds for all series."""
+        horizon, dimension, jobs = self._plan(rows, horizon, prompt, profile)
+        result, _ = forecast_flight.do(self._jobs_key(horizon, dimension, jobs), self._run, horizon, dimension, jobs)
+        return result
+
+    def _run(self, horizon: int, dimension: Optional[str], jobs: List[tuple]) -> Dict[str, Any]:
+        futures = self._submit_all(jobs, horizon)
+        if futures is None:
+            return {"note": "Forecast queue is full; try again shortly."}
+
+        deadline = monotonic() + self.timeout
+        outcomes = []
+        for key, f in futures:
+            try:
+                outcomes.append((key, f.result(timeout=max(0.0, deadline - monotonic()))[0]))
+            except FutureTimeout:
+                f.cancel()
+                outcomes.append((key, {"note": f"Forecast timed out after {self.timeout:g}s."}))
+            except Exception as e:
+                logging.error(f"[FORECAST ERROR] {e}")
+                outcomes.append((key, {"note": f"Forecast failed: {e}"}))
+        return self._combine(dimension, outcomes)
+
+    async def forecast_async(self, rows, horizon: Optional[int] = None, prompt: Optional[str] = None,
+                             profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """asyncio variant of forecast()."""
+        horizon, dimension, jobs = self._plan(rows, horizon, prompt, profile)
+        result, _ = await forecast_flight.do_async(self._jobs_key(horizon, dimension, jobs), self._run_async,
+                                                   horizon, dimension, jobs)
+        return result
+
+    async def _run_async(self, horizon: int, dimension: Optional[str], jobs: List[tuple]) -> Dict[str, Any]:
+        futures = self._submit_all(jobs, horizon)
+        if futures is None:
+            return {"note": "Forecast queue is full; try again shortly."}
+
+        async def one(key, f):
+            try:
+                return key, (await asyncio.wait_for(asyncio.wrap_future(f), self.timeout))[0]
+            except asyncio.TimeoutError:
+                return key, {"note": f"Forecast timed out after {self.timeout:g}s."}
+            except Exception as e:
+                logging.error(f"[FORECAST ERROR] {e}")
+                return key, {"note": f"Forecast failed: {e}"}
+
+        outcomes = await asyncio.gather(*(one(key, f) for key, f in futures))
+        return self._combine(dimension, list(outcomes))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"workers": self.workers, "pending": self._pending, "queue_size": self.queue_size}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._started = False
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+forecast_engine = ForecastEngine()
@@ -1,55 +1,153 @@
+import hashlib
+import importlib.util
 import logging
-from typing import List, Dict, Any, Optional
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+import numpy as np
 import pandas as pd
 import re
 
+from app.forecast_backends import BACKENDS, register, select_and_forecast
+from app.result_profile import profile_result
+from app.resultset import as_columnar
 
 
 
-#  statsmodels
-try:
+
+#  statsmodels: imported on the first ARIMA fit (in a forecast worker), not at startup
+HAVE_STATSMODELS = importlib.util.find_spec("statsmodels") is not None
+if not HAVE_STATSMODELS:
+    logging.warning("statsmodels not available; ARIMA forecasting will be skipped.")
+
+
+ARIMA_ORDER = (1, 1, 1)
+# "auto" backtests every registered backend; a backend name forces that model
+FORECAST_MODEL = os.getenv("FORECAST_MODEL", "auto")
+FORECAST_SEASON = int(os.getenv("FORECAST_SEASON", "12"))
+ARIMA_CACHE_SIZE = int(os.getenv("ARIMA_CACHE_SIZE", "64"))
+# A cached fit seeds start_params for a series that extends it by at most this many points
+ARIMA_WARM_START_MAX_GROWTH = int(os.getenv("ARIMA_WARM_START_MAX_GROWTH", "6"))
+
+# key -> {"values": ndarray, "order": tuple, "params": ndarray}. Fits run in the
+# forecast_engine worker processes; the parent's copy is the shared one: each job
+# is sent the entries that match its series (cached_fits) and the fits a worker
+# makes come back with its result (take_new_fits -> store_fits), so a repeated or
+# extended series hits whichever worker picks it up.
+_model_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_model_cache_lock = threading.Lock()
+# fits made in this process since the last take_new_fits()
+_new_fits: List[Dict[str, Any]] = []
+
+
+def _series_key(values: np.ndarray, order: tuple) -> str:
+    h = hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    h.update(repr(order).encode())
+    return h.hexdigest()
+
+
+def _fit_arima(values: np.ndarray, order: tuple = ARIMA_ORDER):
+    """
+    Fit ARIMA on `values`, reusing cached parameters when possible:
+      - same series and order seen before -> apply stored params with .filter() (no optimizer run)
+      - series extends a cached one by a few points -> .fit(start_params=cached params)
+      - otherwise a cold .fit()
+    Returns (fitted results, "hit" | "warm_start" | "miss").
+    """
     from statsmodels.tsa.arima.model import ARIMA
-except Exception as e:
-    ARIMA = None
-    logging.warning("statsmodels not available; forecasting will be skipped.")
+
+    key = _series_key(values, order)
+    model = ARIMA(values, order=order)
+
+    with _model_cache_lock:
+        entry = _model_cache.get(key)
+        if entry is not None:
+            _model_cache.move_to_end(key)
+        else:
+            start_params = None
+            for cached in reversed(_model_cache.values()):
+                n = len(cached["values"])
+                if (cached["order"] == order
+                        and 0 < len(values) - n <= ARIMA_WARM_START_MAX_GROWTH
+                        and np.array_equal(values[:n], cached["values"])):
+                    start_params = cached["params"]
+                    break
+
+    if entry is not None:
+        return model.filter(entry["params"]), "hit"
+
+    if start_params is not None:
+        fitted = model.fit(start_params=start_params)
+        mode = "warm_start"
+    else:
+        fitted = model.fit()
+        mode = "miss"
+
+    entry = {"values": values.copy(), "order": order, "params": np.asarray(fitted.params)}
+    with _model_cache_lock:
+        _remember(key, entry)
+        _new_fits.append(entry)
+    return fitted, mode
+
+
+def _remember(key: str, entry: Dict[str, Any]) -> None:
+    # caller holds _model_cache_lock
+    _model_cache[key] = entry
+    _model_cache.move_to_end(key)
+    while len(_model_cache) > ARIMA_CACHE_SIZE:
+        _model_cache.popitem(last=False)
 
 
+def cached_fits(values: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Cache entries whose series is `values` or a prefix of it: everything a
+    forecast of `values` can reuse (the full fit, the backtest fit on its head,
+    warm starts from a shorter history).
+    """
+    values = np.asarray(values, dtype=float)
+    with _model_cache_lock:
+        matches = [key for key, entry in _model_cache.items()
+                   if len(entry["values"]) <= len(values)
+                   and np.array_equal(values[:len(entry["values"])], entry["values"])]
+        for key in matches:
+            _model_cache.move_to_end(key)
+        return [_model_cache[key] for key in matches]
+
+
+def store_fits(entries: List[Dict[str, Any]]) -> None:
+    """Add entries (from cached_fits elsewhere, or take_new_fits in a worker) to this process's cache."""
+    with _model_cache_lock:
+        for entry in entries:
+            _remember(_series_key(entry["values"], entry["order"]), entry)
+
+
+def take_new_fits() -> List[Dict[str, Any]]:
+    """The fits made in this process since the last call, for the parent to store."""
+    with _model_cache_lock:
+        fits = list(_new_fits)
+        _new_fits.clear()
+    return fits
+
+
+if HAVE_STATSMODELS:
+    @register("arima")
+    def _arima_backend(values: np.ndarray, horizon: int, season: int):
+        fitted, cache_mode = _fit_arima(np.asarray(values, dtype=float), ARIMA_ORDER)
+        return np.asarray(fitted.forecast(steps=horizon)), {"order": list(ARIMA_ORDER), "model_cache": cache_mode}
+
 
 
 
-def _detect_time_and_value_columns(rows: List[Dict[str, Any]]) -> tuple[Optional[str], Optional[str]]:
+
+def _detect_time_and_value_columns(rows, profile: Optional[Dict[str, Any]] = None) -> tuple[Optional[str], Optional[str]]:
     """
-    Heuristic: pick the first column that looks like a period/date as time,
-    and the first numeric column as value.
+    The profiled time column and preferred measure (sales/revenue/amount/total/value
+    first) of a result; `profile` is its profile_result(), computed when not passed.
     """
-    if not rows:
-        return None, None
-
-    sample = rows[0]
-    keys = list(sample.keys())
-
-    # time col candidates
-    time_candidates = [k for k in keys if any(s in k.lower() for s in ["date", "year", "month", "period"])]
-    time_col = time_candidates[0] if time_candidates else None
-
-    # value col candidates (numeric-like)
-    def is_num(x):
-        return isinstance(x, (int, float)) or (isinstance(x, str) and x.replace('.', '', 1).isdigit())
-    num_keys = []
-    for k in keys:
-        if all(is_num(r.get(k, None)) for r in rows if r.get(k, None) is not None):
-            num_keys.append(k)
-    value_col = None
-    # prefer sales/revenue/amount/total
-    for pref in ["sales", "revenue", "amount", "total", "value"]:
-        vc = next((k for k in num_keys if pref in k.lower()), None)
-        if vc:
-            value_col = vc
-            break
-    if value_col is None and num_keys:
-        value_col = num_keys[0]
-
-    return time_col, value_col
+    if profile is None:
+        profile = profile_result(rows)
+    return profile["time"], profile["value"]
 
 
 import re
@@ -72,46 +170,69 @@ def extract_horizon_from_prompt(prompt: str, default: int = 3) -> int:
 
 
 
-def forecast_arima(rows: List[Dict[str, Any]],
+def _time_series(rows: Dict[str, Any], tcol: str, vcol: str) -> tuple[pd.Series, pd.Series]:
+    """(time column, numeric values) of a columnar result, in time order."""
+    df = pd.DataFrame.from_records(rows["rows"], columns=rows["columns"])
+    try:
+        df[tcol] = pd.to_datetime(df[tcol])
+        df = df.sort_values(tcol)
+    except Exception:
+        df = df.sort_values(tcol)
+    return df[tcol], pd.to_numeric(df[vcol], errors="coerce").fillna(0.0)
+
+
+def series_values(rows, profile: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
+    """The values forecast_arima would fit for `rows`, or None when it would not get that far."""
+    rows = as_columnar(rows)
+    if not rows["rows"]:
+        return None
+    tcol, vcol = _detect_time_and_value_columns(rows, profile)
+    if not tcol or not vcol:
+        return None
+    try:
+        return _time_series(rows, tcol, vcol)[1].to_numpy(dtype=float)
+    except Exception:
+        return None
+
+
+def forecast_arima(rows,
                     horizon: Optional[int] = None,
-                      prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+                      prompt: Optional[str] = None,
+                      profile: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
 
     """
-    Fit simple ARIMA(1,1,1) and forecast `horizon` future points.
+    Forecast `horizon` future points with the FORECAST_MODEL backend, or with
+    the backend that wins a holdout backtest when FORECAST_MODEL is "auto".
+    `rows` is a columnar result from run_sql_columnar (a list of row dicts is also accepted).
+    `profile` (from profile_result) is recomputed when not passed.
     If horizon is not passed, it will be auto-detected from user prompt.
     Default horizon = 3.
     """
-    if ARIMA is None:
-        return {"note": "statsmodels not installed; cannot run ARIMA."}
+    if FORECAST_MODEL != "auto" and FORECAST_MODEL not in BACKENDS:
+        if FORECAST_MODEL == "arima":
+            return {"note": "statsmodels not installed; cannot run ARIMA."}
+        return {"note": f"Unknown forecast model {FORECAST_MODEL!r}."}
 
-    if not rows:
+    rows = as_columnar(rows)
+    if not rows["rows"]:
         return {"note": "No data to forecast."}
 
     # 🔹 Horizon logic
     if horizon is None:
         horizon = extract_horizon_from_prompt(prompt, default=3)
 
-    tcol, vcol = _detect_time_and_value_columns(rows)
+    tcol, vcol = _detect_time_and_value_columns(rows, profile)
     if not tcol or not vcol:
         return {"note": f"Unable to detect time/value columns. Found time={tcol}, value={vcol}."}
 
     try:
-        df = pd.DataFrame(rows)
-        try:
-            df[tcol] = pd.to_datetime(df[tcol])
-            df = df.sort_values(tcol)
-            idx = df[tcol]
-        except Exception:
-            df = df.sort_values(tcol)
-            idx = df[tcol]
-
-        series = pd.to_numeric(df[vcol], errors="coerce").fillna(0.0)
+        idx, series = _time_series(rows, tcol, vcol)
         if len(series) < 6:
-            return {"note": "Not enough history for ARIMA (need ~6+ points)."}
+            return {"note": "Not enough history to forecast (need ~6+ points)."}
 
-        model = ARIMA(series, order=(1, 1, 1))
-        fitted = model.fit()
-        fc = fitted.forecast(steps=horizon)
+        candidates = None if FORECAST_MODEL == "auto" else [FORECAST_MODEL]
+        selected = select_and_forecast(series.to_numpy(dtype=float), horizon, FORECAST_SEASON, candidates)
+        fc = selected["forecast"]
 
         last_period = list(idx)[-1]
         forecast_points = []
@@ -122,12 +243,18 @@ def forecast_arima(rows: List[Dict[str, Any]],
                 label = f"T+{i}"
             forecast_points.append({"period": label, "value": float(val)})
 
-        return {
+        payload = {
             "horizon": horizon,
             "time_col": tcol,
             "value_col": vcol,
-            "points": forecast_points
+            "points": forecast_points,
+            "model": selected["model"],
+            "fit_time_ms": selected["fit_time_ms"],
+            "backtest": selected["backtest"],
         }
+        if "model_cache" in selected["info"]:
+            payload["model_cache"] = selected["info"]["model_cache"]
+        return payload
     except Exception as e:
-        logging.error(f"[ARIMA ERROR] {e}")
-        return {"note": f"ARIMA failed: {e}"}
+        logging.error(f"[FORECAST ERROR] {e}")
+        return {"note": f"Forecast failed: {e}"}
@@ -0,0 +1,238 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.db import BACKEND_DIR, ROLLUP_DB_PATH, pool
+from app.result_cache import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+INDEX_ADVISOR_MAX_QUERIES = int(os.getenv("INDEX_ADVISOR_MAX_QUERIES", "200"))
+# Creating indexes is opt-in and only ever happens on a copy of the database
+INDEX_ADVISOR_APPLY = os.getenv("INDEX_ADVISOR_APPLY", "0").lower() in {"1", "true", "yes"}
+INDEX_ADVISOR_COPY_PATH = Path(os.getenv("INDEX_ADVISOR_COPY_PATH", str(BACKEND_DIR / ".cache" / "northwind_indexed.db")))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_TABLE_REF = re.compile(
+    r'\b(?:FROM|JOIN)\s+("[^"]+"|\[[^\]]+\]|\w+)'
+    r'(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|GROUP|ORDER|LIMIT|USING|HAVING|UNION)\b)(\w+))?',
+    re.IGNORECASE,
+)
+_OPS = r"(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bBETWEEN\b)"
+_QUALIFIED_LEFT = re.compile(rf'(\w+)\.("?\w+"?)\s*{_OPS}', re.IGNORECASE)
+_QUALIFIED_RIGHT = re.compile(rf'{_OPS}\s*(\w+)\.("?\w+"?)', re.IGNORECASE)
+_UNQUALIFIED = re.compile(rf'(?<![\w.])("?[A-Za-z_]\w*"?)\s*{_OPS}', re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(.+?)(?: AS (\S+))?(?: USING (COVERING )?INDEX .*)?$")
+
+
+def _unquote(name: str) -> str:
+    return name.strip('"[]')
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """alias (or bare table name) -> table, from the FROM/JOIN clauses."""
+    aliases = {}
+    for m in _TABLE_REF.finditer(sql):
+        table = _unquote(m.group(1))
+        aliases[table] = table
+        if m.group(2):
+            aliases[m.group(2)] = table
+    return aliases
+
+
+def _predicate_columns(sql: str, aliases: Dict[str, str], schema_dict: Dict[str, set]) -> Dict[str, set]:
+    """table -> columns that appear in join/filter comparisons."""
+    cols: Dict[str, set] = {}
+    for pattern in (_QUALIFIED_LEFT, _QUALIFIED_RIGHT):
+        for alias, col in pattern.findall(sql):
+            table = aliases.get(alias)
+            col = _unquote(col)
+            if table and col in schema_dict.get(table, ()):
+                cols.setdefault(table, set()).add(col)
+
+    # unqualified columns are only unambiguous when a single table owns them
+    tables = set(aliases.values())
+    for col in {_unquote(c) for c in _UNQUALIFIED.findall(sql)}:
+        owners = [t for t in tables if col in schema_dict.get(t, ())]
+        if len(owners) == 1:
+            cols.setdefault(owners[0], set()).add(col)
+    return cols
+
+
+def _indexed_columns(conn, table: str) -> set:
+    """Columns that already lead an index (or are the rowid alias) on `table`."""
+    leading = set()
+    info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    pks = [r for r in info if r[5]]
+    if len(pks) == 1 and (pks[0][2] or "").upper() == "INTEGER":
+        leading.add(pks[0][1])
+    for idx in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+        first = conn.execute(f'PRAGMA index_info("{idx[1]}")').fetchone()
+        if first is not None:
+            leading.add(first[2])
+    return leading
+
+
+def _index_sql(table: str, column: str) -> str:
+    name = re.sub(r"\W+", "_", f"idx_advisor_{table}_{column}")
+    return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}"("{column}")'
+
+
+def explain(sql: str, schema_dict: Dict[str, set], conn=None) -> Dict[str, Any]:
+    """
+    EXPLAIN QUERY PLAN for one query: plan lines, tables read by full scan,
+    and single-column index recommendations for scanned tables whose
+    join/filter columns have no usable index.
+    """
+    if conn is None:
+        with pool.connection() as pooled:
+            return explain(sql, schema_dict, pooled)
+
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+    stripped = _STRING_LITERAL.sub("''", sql)
+    aliases = _table_aliases(stripped)
+
+    full_scans = []
+    for line in plan:
+        m = _SCAN.match(line)
+        if m and not m.group(3):
+            name = m.group(2) or m.group(1)
+            full_scans.append(aliases.get(name, _unquote(m.group(1))))
+
+    predicates = _predicate_columns(stripped, aliases, schema_dict)
+    recommendations = []
+    for table in dict.fromkeys(full_scans):
+        if table not in schema_dict:
+            continue
+        existing = _indexed_columns(conn, table)
+        for col in sorted(predicates.get(table, set()) - existing):
+            recommendations.append({
+                "table": table,
+                "column": col,
+                "reason": f"full scan of {table} with a predicate on {col}",
+                "sql": _index_sql(table, col),
+            })
+
+    return {
+        "plan": plan,
+        "full_scans": full_scans,
+        "temp_btree": [line for line in plan if "TEMP B-TREE" in line],
+        "recommendations": recommendations,
+    }
+
+
+class IndexAdvisor:
+    """Remembers the SQL that handle_sql executed (bounded, with hit counts) and reports on its plans."""
+
+    def __init__(self, max_queries: int = INDEX_ADVISOR_MAX_QUERIES):
+        self.max_queries = max_queries
+        self._queries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, sql: str) -> None:
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {"sql": sql, "count": 0}
+            entry["count"] += 1
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+
+    def _top_queries(self, limit: int | None = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = sorted(self._queries.values(), key=lambda e: e["count"], reverse=True)
+        return [dict(e) for e in entries[:limit]]
+
+    def report(self, schema_dict: Dict[str, set], limit: int = 50) -> Dict[str, Any]:
+        """Plans and recommendations for the most frequent recorded queries."""
+        queries = []
+        recommended: Dict[str, Dict[str, Any]] = {}
+        with pool.connection() as conn:
+            for entry in self._top_queries(limit):
+                try:
+                    info = explain(entry["sql"], schema_dict, conn)
+                except sqlite3.Error as e:
+                    queries.append({**entry, "error": str(e)})
+                    continue
+                queries.append({**entry, **info})
+                for rec in info["recommendations"]:
+                    agg = recommended.setdefault(rec["sql"], {**rec, "queries": 0, "executions": 0})
+                    agg["queries"] += 1
+                    agg["executions"] += entry["count"]
+        return {
+            "recorded_queries": len(self._queries),
+            "queries": queries,
+            "recommendations": sorted(recommended.values(), key=lambda r: r["executions"], reverse=True),
+        }
+
+    def apply(self, schema_dict: Dict[str, set], target: Path = INDEX_ADVISOR_COPY_PATH,
+              repeat: int = 3) -> Dict[str, Any]:
+        """
+        Copy the database to `target`, time every recorded query there, create
+        the recommended indexes on the copy and time them again. The live
+        database is never modified. The rollup database is attached to the
+        copy read-only, as on the pooled connections; a query that still fails
+        on the copy is reported under "skipped" instead of timed.
+        """
+        report = self.report(schema_dict)
+        statements = [r["sql"] for r in report["recommendations"]]
+        queries = [q["sql"] for q in report["queries"] if "error" not in q]
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)
+        # URI mode, so the ATTACH below can open the rollup file read-only
+        conn = sqlite3.connect(target.as_uri(), uri=True)
+        try:
+            # backup API copies a consistent snapshot, including pages still in the WAL
+            with pool.connection() as src:
+                src.backup(conn)
+            if ROLLUP_DB_PATH.exists():
+                conn.execute("ATTACH DATABASE ? AS rollup", (f"{ROLLUP_DB_PATH.as_uri()}?mode=ro",))
+            before, skipped = {}, []
+            for sql in queries:
+                try:
+                    before[sql] = _time_query(conn, sql, repeat)
+                except sqlite3.Error as e:
+                    skipped.append({"sql": sql, "error": str(e)})
+            queries = list(before)
+            for stmt in statements:
+                conn.execute(stmt)
+            conn.execute("ANALYZE main")  # not the read-only rollup attachment
+            conn.commit()
+            after = {sql: _time_query(conn, sql, repeat) for sql in queries}
+        finally:
+            conn.close()
+
+        timings = [
+            {
+                "sql": sql,
+                "before_ms": before[sql],
+                "after_ms": after[sql],
+                "speedup": round(before[sql] / after[sql], 2) if after[sql] else None,
+            }
+            for sql in queries
+        ]
+        logger.info(f"Index advisor applied {len(statements)} indexes to {target}")
+        return {"database": str(target), "created_indexes": statements, "timings": timings, "skipped": skipped}
+
+
+def _time_query(conn, sql: str, repeat: int) -> float:
+    """Best-of-`repeat` wall time in ms for running `sql` to completion."""
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+index_advisor = IndexAdvisor()
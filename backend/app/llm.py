@@ -2,9 +2,12 @@ import os
 import re
 import json
 import logging
-from groq import Groq
+import threading
+from groq import AsyncGroq, Groq
 from dotenv import load_dotenv
 
+from app.llm_gateway import async_http_client, gateway, http_client
+
 load_dotenv()
 
 logging.basicConfig(
@@ -14,10 +17,56 @@ logging.basicConfig(
 )
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise RuntimeError("GROQ_API_KEY not found. Please set it in your .env file.")
 
-client = Groq(api_key=GROQ_API_KEY)
+# Created on first use (or by warmup.py), so importing the app needs neither the key nor the network stack.
+# Retries, rate limits and deadlines are handled by llm_gateway, so the SDK's own retries are off.
+_client: Groq | None = None
+_async_client: AsyncGroq | None = None
+_client_lock = threading.Lock()
+
+
+def _api_key() -> str:
+    if not GROQ_API_KEY:
+        raise RuntimeError("GROQ_API_KEY not found. Please set it in your .env file.")
+    return GROQ_API_KEY
+
+
+def get_client() -> Groq:
+    """The shared blocking Groq client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Groq(api_key=_api_key(), http_client=http_client(), max_retries=0)
+    return _client
+
+
+def get_async_client() -> AsyncGroq:
+    """The shared asyncio Groq client."""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncGroq(api_key=_api_key(), http_client=async_http_client(), max_retries=0)
+    return _async_client
+
+PLAN_MODEL = "llama-3.1-8b-instant"
+
+
+def complete(call: str, deadline: float | None = None, **kwargs):
+    """
+    Blocking chat completion through llm_gateway (rate limits, retries, deadline).
+    `call` ("plan", "repair", "summary") sets its priority and default deadline and
+    labels its request and token metrics; `deadline` overrides the budget in seconds.
+    """
+    return gateway.complete(call, lambda **kw: get_client().chat.completions.create(**kw),
+                            deadline=deadline, **kwargs)
+
+
+async def complete_async(call: str, deadline: float | None = None, **kwargs):
+    """asyncio version of complete()."""
+    return await gateway.complete_async(call, lambda **kw: get_async_client().chat.completions.create(**kw),
+                                        deadline=deadline, **kwargs)
 
 
 def _strip_code_fences(text: str) -> str:
@@ -29,20 +78,13 @@ def _strip_code_fences(text: str) -> str:
     return t.strip()
 
 
-def generate_plan(
-    user_query: str,
+def _build_plan_prompt(
     schema: str,
     schema_dict: dict,
     relationships: list[dict],
-    date_ranges: dict | None = None
-) -> dict | None:
-    """
-    Ask the LLM to decide:
-      - intent: "historical" or "forecast"
-      - chart_type: "line" | "bar" | "pie" | "table"
-      - sql: single-line SQLite SELECT (not executed here)
-    Returns Python dict or None on failure.
-    """
+    date_ranges: dict | None = None,
+    hints: str | None = None
+) -> str:
     rel_text = "\n".join(
         f"- {r['from_table']}.{r['from_col']} = {r['to_table']}.{r['to_col']}"
         for r in relationships
@@ -102,42 +144,187 @@ schema_dict (for validation hints):
 
 Date ranges (optional):
 {json.dumps(date_ranges or {}, indent=2)[:2000]}
+{hints or ""}
 
 Now output ONLY the JSON plan for this user query. Do NOT include explanations or markdown.
 """
 
+    return system_prompt
+
+
+def _parse_plan(content: str) -> dict | None:
+    content = _strip_code_fences(content)
+
+    # try parse JSON
+    plan = json.loads(content)
+
+    # basic shape check
+    if not isinstance(plan, dict):
+        return None
+    if "intent" not in plan or "chart_type" not in plan or "sql" not in plan:
+        return None
+
+    # normalize whitespace and force single line
+    plan["sql"] = re.sub(r'\s+', ' ', plan["sql"]).strip()
+    # safety guard
+    if re.search(r'\b(UPDATE|DELETE|DROP|INSERT|ALTER)\b', plan["sql"], re.IGNORECASE):
+        logging.warning(f"[BLOCKED SQL by LLM plan] {plan['sql']}")
+        return None
+
+    return plan
+
+
+def generate_plan(
+    user_query: str,
+    schema: str,
+    schema_dict: dict,
+    relationships: list[dict],
+    date_ranges: dict | None = None,
+    hints: str | None = None
+) -> dict | None:
+    """
+    Ask the LLM to decide:
+      - intent: "historical" or "forecast"
+      - chart_type: "line" | "bar" | "pie" | "table"
+      - sql: single-line SQLite SELECT (not executed here)
+    Returns Python dict or None on failure.
+    """
+    system_prompt = _build_plan_prompt(schema, schema_dict, relationships, date_ranges, hints)
+    try:
+        chat = complete(
+            "plan",
+            model=PLAN_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_query}
+            ],
+            temperature=0
+        )
+        return _parse_plan(chat.choices[0].message.content)
+
+    except Exception as e:
+        logging.error(f"[LLM PLAN ERROR] {e}")
+        return None
+
+
+async def generate_plan_async(
+    user_query: str,
+    schema: str,
+    schema_dict: dict,
+    relationships: list[dict],
+    date_ranges: dict | None = None,
+    hints: str | None = None
+) -> dict | None:
+    """Same as generate_plan, but awaits the Groq call instead of blocking a thread."""
+    system_prompt = _build_plan_prompt(schema, schema_dict, relationships, date_ranges, hints)
     try:
-        chat = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        chat = await complete_async(
+            "plan",
+            model=PLAN_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_query}
             ],
             temperature=0
         )
+        return _parse_plan(chat.choices[0].message.content)
+
+    except Exception as e:
+        logging.error(f"[LLM PLAN ERROR] {e}")
+        return None
+
 
-        content = chat.choices[0].message.content
-        content = _strip_code_fences(content)
 
-        # try parse JSON
-        plan = json.loads(content)
+def _build_repair_prompt(
+    schema: str,
+    relationships: list[dict],
+    hints: str | None = None
+) -> str:
+    rel_text = "\n".join(
+        f"- {r['from_table']}.{r['from_col']} = {r['to_table']}.{r['to_col']}"
+        for r in relationships
+    )
+    return f"""
+You fix SQLite SELECT statements for the Northwind database that failed to compile.
+Keep the query's meaning; change only what the error requires. Use only tables and columns from the schema.
+Table names with spaces MUST be in double quotes, e.g., "Order Details". UnitPrice for sales lives in "Order Details".
+
+Relationships:
+{rel_text or "(none provided)"}
 
-        # basic shape check
-        if not isinstance(plan, dict):
-            return None
-        if "intent" not in plan or "chart_type" not in plan or "sql" not in plan:
-            return None
+Schema (tables and columns):
+{schema}
+{hints or ""}
 
-        # normalize whitespace and force single line
-        plan["sql"] = re.sub(r'\s+', ' ', plan["sql"]).strip()
-        # safety guard
-        if re.search(r'\b(UPDATE|DELETE|DROP|INSERT|ALTER)\b', plan["sql"], re.IGNORECASE):
-            logging.warning(f"[BLOCKED SQL by LLM plan] {plan['sql']}")
-            return None
+Output ONLY the corrected SQL on one line. No explanations, no markdown.
+"""
 
-        return plan
+
+def _parse_repaired_sql(content: str) -> str | None:
+    sql = re.sub(r'\s+', ' ', _strip_code_fences(content)).strip().rstrip(";")
+    if not re.match(r'^(SELECT|WITH)\b', sql, re.IGNORECASE):
+        return None
+    if re.search(r'\b(UPDATE|DELETE|DROP|INSERT|ALTER)\b', sql, re.IGNORECASE):
+        logging.warning(f"[BLOCKED SQL by LLM repair] {sql}")
+        return None
+    return sql
+
+
+def _repair_messages(user_query, sql, error, schema, relationships, hints) -> list[dict]:
+    return [
+        {"role": "system", "content": _build_repair_prompt(schema, relationships, hints)},
+        {"role": "user", "content": f"Question: {user_query}\nSQL: {sql}\nSQLite error: {error}"},
+    ]
+
+
+def repair_sql(
+    user_query: str,
+    sql: str,
+    error: str,
+    schema: str,
+    schema_dict: dict,
+    relationships: list[dict],
+    date_ranges: dict | None = None,
+    hints: str | None = None
+) -> str | None:
+    """
+    One targeted LLM call to fix SQL that failed validation (sql_validator).
+    Returns the corrected single-line SELECT, or None.
+    """
+    try:
+        chat = complete(
+            "repair",
+            model=PLAN_MODEL,
+            messages=_repair_messages(user_query, sql, error, schema, relationships, hints),
+            temperature=0
+        )
+        return _parse_repaired_sql(chat.choices[0].message.content)
 
     except Exception as e:
-        logging.error(f"[LLM PLAN ERROR] {e}")
+        logging.error(f"[LLM REPAIR ERROR] {e}")
         return None
 
+
+async def repair_sql_async(
+    user_query: str,
+    sql: str,
+    error: str,
+    schema: str,
+    schema_dict: dict,
+    relationships: list[dict],
+    date_ranges: dict | None = None,
+    hints: str | None = None
+) -> str | None:
+    """Same as repair_sql, but awaits the Groq call."""
+    try:
+        chat = await complete_async(
+            "repair",
+            model=PLAN_MODEL,
+            messages=_repair_messages(user_query, sql, error, schema, relationships, hints),
+            temperature=0
+        )
+        return _parse_repaired_sql(chat.choices[0].message.content)
+
+    except Exception as e:
+        logging.error(f"[LLM REPAIR ERROR] {e}")
+        return None
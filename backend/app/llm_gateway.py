@@ -0,0 +1,386 @@
+"""
+Shared gateway for every Groq chat completion (plan, repair, summary).
+
+    chat = gateway.complete("plan", create, model=..., messages=...)
+
+- Pooled HTTP: the Groq clients in llm.py share one httpx connection pool
+  per flavour (blocking / asyncio) with keep-alive, and their own SDK
+  retries are off so only this module retries.
+- Rate limits: requests-per-minute and tokens-per-minute token buckets
+  (GROQ_RPM / GROQ_TPM, the account's limits; 0 = unlimited). Calls that
+  would exceed them wait here instead of getting a 429.
+- Priority: waiting calls are served lowest priority value first, so under
+  pressure plan and repair calls go before summaries.
+- Retries: 429, 408/409, 5xx, timeouts and connection errors are retried
+  with full-jitter exponential backoff; a 429's retry-after pauses every
+  caller, not just the one that got it.
+- Deadlines: each call has a budget (LLM_*_DEADLINE seconds) covering the
+  queue wait, every attempt and the backoff in between; a call that cannot
+  finish in time fails with DeadlineExceeded instead of waiting on.
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from time import monotonic
+from typing import Any, Callable, Dict, Optional
+
+from app.metrics import LLM_QUEUE_SECONDS, LLM_RETRIES, record_llm
+
+logger = logging.getLogger(__name__)
+
+# Off (0) by default: limits depend on the account tier and model, and a wrong guess
+# throttles a paid account. Set them to the RPM / TPM shown for the model under
+# Settings -> Limits in the Groq console (e.g. GROQ_RPM=30 GROQ_TPM=6000 on the free
+# tier for llama-3.1-8b-instant); without them a 429's retry-after still paces every caller.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "0"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "0"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_RETRY_BASE = float(os.getenv("GROQ_RETRY_BASE", "0.5"))
+GROQ_RETRY_MAX = float(os.getenv("GROQ_RETRY_MAX", "8"))
+
+# Seconds per call from entering the gateway to the answer, retries included
+LLM_DEADLINES = {
+    "plan": float(os.getenv("LLM_PLAN_DEADLINE", "30")),
+    "repair": float(os.getenv("LLM_REPAIR_DEADLINE", "20")),
+    "summary": float(os.getenv("LLM_SUMMARY_DEADLINE", "20")),
+}
+# Lower is served first when calls queue for rate-limit capacity
+PRIORITIES = {"plan": 0, "repair": 0, "summary": 1}
+
+# Completion tokens assumed for a call without max_tokens, until the response reports usage
+COMPLETION_TOKENS_ESTIMATE = 256
+# Longest a queued caller sleeps before re-checking (others may have left the queue meanwhile)
+MAX_SLEEP = 0.25
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call could not be answered within its deadline."""
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Prompt (~4 characters per token) plus expected completion tokens of a chat.completions.create call."""
+    prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+    return prompt_chars // 4 + (kwargs.get("max_tokens") or COMPLETION_TOKENS_ESTIMATE)
+
+
+def _used_tokens(chat) -> Optional[int]:
+    usage = getattr(chat, "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    if total is None:
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        if prompt is None or completion is None:
+            return None
+        total = prompt + completion
+    return int(total)
+
+
+def _retry_reason(e: Exception) -> Optional[str]:
+    """Why `e` is worth retrying, or None."""
+    status = getattr(e, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status in (408, 409) or (isinstance(status, int) and status >= 500):
+        return "server_error"
+    # groq.APITimeoutError subclasses APIConnectionError
+    names = {cls.__name__ for cls in type(e).__mro__}
+    if "APITimeoutError" in names:
+        return "timeout"
+    if "APIConnectionError" in names:
+        return "connection"
+    return None
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Seconds from the error response's retry-after header, if any."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by threads and the
+    event loop. Waiting callers are ordered by (priority, arrival); a caller only
+    takes capacity that is left after everyone ahead of it has been served, so a
+    newly arrived plan call overtakes queued summaries.
+    """
+
+    def __init__(self, rpm: float = GROQ_RPM, tpm: float = GROQ_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        # sorted (priority, seq, tokens) tickets of waiting callers
+        self._queue: list[tuple[int, int, int]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.deadline_misses = 0
+
+    def _refill(self, now: float) -> None:
+        # caller holds the lock
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, ticket: tuple[int, int, int]) -> tuple[float, bool]:
+        """(0, True) once capacity is taken for `ticket`, else (seconds until it may be, is head of queue)."""
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            i = self._queue.index(ticket)
+            ahead = self._queue[:i + 1]
+            wait = self._paused_until - now
+            if self.rpm and self._requests < len(ahead):
+                wait = max(wait, (len(ahead) - self._requests) * 60 / self.rpm)
+            if self.tpm:
+                # a prompt larger than the whole bucket still goes once the bucket is full
+                needed = sum(min(t[2], self.tpm) for t in ahead)
+                if self._tokens < needed:
+                    wait = max(wait, (needed - self._tokens) * 60 / self.tpm)
+            if wait > 0:
+                return wait, i == 0
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= ticket[2]
+            del self._queue[i]
+            return 0.0, True
+
+    def _enqueue(self, priority: int, tokens: int) -> tuple[int, int, int]:
+        ticket = (priority, next(self._seq), tokens)
+        with self._lock:
+            bisect.insort(self._queue, ticket)
+        return ticket
+
+    def _leave(self, ticket: tuple[int, int, int]) -> None:
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+
+    def _next_sleep(self, ticket: tuple[int, int, int], deadline: float) -> float:
+        """0 once capacity is taken, else how long to sleep before trying again."""
+        wait, head = self._try_acquire(ticket)
+        if not wait:
+            return 0.0
+        remaining = deadline - monotonic()
+        if remaining <= 0 or (head and wait > remaining):
+            with self._lock:
+                self.deadline_misses += 1
+            raise DeadlineExceeded(f"Groq rate limit: no capacity within the deadline (needs {wait:.1f}s)")
+        return min(wait, remaining, MAX_SLEEP)
+
+    def acquire(self, priority: int, tokens: int, deadline: float) -> float:
+        """Block until a request of `tokens` may be sent; returns the seconds waited."""
+        start = monotonic()
+        ticket = self._enqueue(priority, tokens)
+        try:
+            delay = self._next_sleep(ticket, deadline)
+            if delay:
+                with self._lock:
+                    self.waits += 1
+            while delay:
+                time.sleep(delay)
+                delay = self._next_sleep(ticket, deadline)
+        except BaseException:
+            self._leave(ticket)
+            raise
+        return monotonic() - start
+
+    async def acquire_async(self, priority: int, tokens: int, deadline: float) -> float:
+        """asyncio variant of acquire(); a cancelled caller leaves the queue."""
+        start = monotonic()
+        ticket = self._enqueue(priority, tokens)
+        try:
+            delay = self._next_sleep(ticket, deadline)
+            if delay:
+                with self._lock:
+                    self.waits += 1
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self._next_sleep(ticket, deadline)
+        except BaseException:
+            self._leave(ticket)
+            raise
+        return monotonic() - start
+
+    def settle(self, estimated: int, used: int) -> None:
+        """Correct the token bucket once the real usage of a call (0 if it failed) is known."""
+        if self.tpm:
+            with self._lock:
+                self._tokens = min(self.tpm, self._tokens + estimated - used)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds`, e.g. the retry-after of a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "available_requests": round(self._requests, 2) if self.rpm else None,
+                "available_tokens": round(self._tokens) if self.tpm else None,
+                "queued": len(self._queue),
+                "paused_for": round(max(0.0, self._paused_until - now), 3),
+                "waits": self.waits,
+                "deadline_misses": self.deadline_misses,
+            }
+
+
+class LLMGateway:
+    """Runs chat completions through the rate limiter with retries and a deadline; see the module docstring."""
+
+    def __init__(self, limiter: RateLimiter, max_retries: int = GROQ_MAX_RETRIES):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def _budget(self, call: str, deadline: Optional[float]) -> float:
+        return monotonic() + (deadline if deadline is not None else LLM_DEADLINES.get(call, LLM_DEADLINES["plan"]))
+
+    def _backoff(self, call: str, e: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before retrying after `e`, or None when the call should fail now."""
+        reason = _retry_reason(e)
+        if reason is None or attempt >= self.max_retries:
+            return None
+        retry_after = _retry_after(e)
+        if retry_after is not None:
+            if monotonic() + retry_after >= deadline:
+                return None
+            # the pause holds everyone; the jitter spreads the retries that follow it
+            self.limiter.pause(retry_after)
+            delay = random.uniform(0, GROQ_RETRY_BASE)
+        else:
+            delay = random.uniform(0, min(GROQ_RETRY_MAX, GROQ_RETRY_BASE * 2 ** attempt))
+        if monotonic() + delay >= deadline:
+            return None
+        LLM_RETRIES.inc(call=call, reason=reason)
+        with self._lock:
+            self.retries += 1
+        logger.warning(f"[LLM RETRY] {call} attempt {attempt + 1} failed ({reason}: {e}); retrying in {delay:.2f}s")
+        return delay
+
+    def complete(self, call: str, create: Callable[..., Any], deadline: Optional[float] = None, **kwargs):
+        """
+        create(**kwargs, timeout=...) under the rate limits, retried on transient
+        errors until `deadline` seconds (default LLM_DEADLINES[call]) run out.
+        """
+        end = self._budget(call, deadline)
+        priority = PRIORITIES.get(call, 1)
+        tokens = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                LLM_QUEUE_SECONDS.observe(self.limiter.acquire(priority, tokens, end), call=call)
+                sent = True
+                chat = create(**kwargs, timeout=max(0.001, end - monotonic()))
+            except Exception as e:
+                if sent:
+                    self.limiter.settle(tokens, 0)
+                delay = self._backoff(call, e, attempt, end) if sent else None
+                if delay is None:
+                    record_llm(call)
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            used = _used_tokens(chat)
+            if used is not None:
+                self.limiter.settle(tokens, used)
+            record_llm(call, chat)
+            return chat
+
+    async def complete_async(self, call: str, create: Callable[..., Any], deadline: Optional[float] = None,
+                             **kwargs):
+        """asyncio variant of complete(); `create` returns an awaitable."""
+        end = self._budget(call, deadline)
+        priority = PRIORITIES.get(call, 1)
+        tokens = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                LLM_QUEUE_SECONDS.observe(await self.limiter.acquire_async(priority, tokens, end), call=call)
+                sent = True
+                chat = await create(**kwargs, timeout=max(0.001, end - monotonic()))
+            except Exception as e:
+                if sent:
+                    self.limiter.settle(tokens, 0)
+                delay = self._backoff(call, e, attempt, end) if sent else None
+                if delay is None:
+                    record_llm(call)
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            used = _used_tokens(chat)
+            if used is not None:
+                self.limiter.settle(tokens, used)
+            record_llm(call, chat)
+            return chat
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retries = self.retries
+        return {**self.limiter.stats(), "retries": retries, "max_retries": self.max_retries}
+
+
+# Shared httpx pools for the Groq clients; created with them (llm.get_client / get_async_client)
+_http_client = None
+_async_http_client = None
+_http_lock = threading.Lock()
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+                        keepalive_expiry=60)
+
+
+def http_client():
+    """The pooled httpx.Client behind the blocking Groq client."""
+    global _http_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                import httpx
+                _http_client = httpx.Client(limits=_limits(), timeout=httpx.Timeout(60.0, connect=5.0))
+    return _http_client
+
+
+def async_http_client():
+    """The pooled httpx.AsyncClient behind the asyncio Groq client."""
+    global _async_http_client
+    if _async_http_client is None:
+        with _http_lock:
+            if _async_http_client is None:
+                import httpx
+                _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=httpx.Timeout(60.0, connect=5.0))
+    return _async_http_client
+
+
+gateway = LLMGateway(RateLimiter())
@@ -4,9 +4,12 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Import db for health checks
 from app.db import init_database
+from app import pipeline, warmup
+import asyncio
 import logging
 
 # Configure logging
@@ -39,6 +42,14 @@ async def health_check():
         "database": "connected"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: 503 until startup warm-up has the required components up, then per-component timings"""
+    report = warmup.status()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
 @app.get("/debug")
 async def debug_info():
     """Debug endpoint to check paths and file structure"""
@@ -74,11 +85,14 @@ app.include_router(router)
 async def startup_event():
     """Run on application startup"""
     logger.info("Application starting up...")
-    # Test database connection
-    if init_database():
-        logger.info("Database connection successful")
-    else:
-        logger.error("Database connection failed!")
+    # Warm-up runs in the background so the server accepts connections (and answers /health) right away;
+    # /ready reports when it is done and how long each component took
+    app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warmup.run)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pipeline executors (SQL threads, forecast processes)"""
+    pipeline.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,276 @@
+"""
+Request metrics in Prometheus text format, from a small in-process registry
+(no client library needed).
+
+    with span("execute"):
+        result = run_sql_columnar(sql)
+
+observes the block's duration in salesbot_stage_duration_seconds{stage=...}
+and, inside collect_timings(), adds it to that request's timings dict (ms).
+The dict lives in a ContextVar, so asyncio tasks created during the request
+share it; work handed to a thread pool goes through timed() to keep it.
+
+Cache, template, pool, single-flight and rate-limiter state already kept by their own modules are read
+at scrape time (see _component_samples) rather than duplicated here.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# Seconds; from a warm cache hit to a slow LLM call or ARIMA fit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+logger = logging.getLogger(__name__)
+
+_LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[_LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self._series: Dict[_LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        # (name, help, type, fn) where fn() -> [(labels dict, value), ...], read at scrape time
+        self._callbacks: List[Tuple[str, str, str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, help: str, kind: str, fn: Callable[[], List[Tuple[Dict[str, str], float]]]) -> None:
+        self._callbacks.append((name, help, kind, fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for name, help, kind, fn in self._callbacks:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(labels, labels.values())} {_number(value)}" for labels, value in fn()]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "salesbot_stage_duration_seconds", "Time spent per query pipeline stage.", ("stage",)))
+QUERY_SECONDS = registry.register(Histogram(
+    "salesbot_query_duration_seconds", "End-to-end /query and /query/stream latency.", ("endpoint",)))
+QUERIES = registry.register(Counter(
+    "salesbot_queries_total", "Queries handled, by endpoint and outcome (ok or error).", ("endpoint", "outcome")))
+PLAN_SOURCE = registry.register(Counter(
+    "salesbot_plan_source_total", "Where each query plan came from: cache, template, llm or shared (an identical in-flight LLM plan).", ("source",)))
+RESULT_ROWS = registry.register(Histogram(
+    "salesbot_result_rows", "Rows returned by executed queries.", buckets=ROW_BUCKETS))
+LLM_REQUESTS = registry.register(Counter(
+    "salesbot_llm_requests_total", "Groq chat completions, by call and outcome (ok or error).", ("call", "outcome")))
+LLM_TOKENS = registry.register(Counter(
+    "salesbot_llm_tokens_total", "Tokens reported by Groq, by call and kind (prompt or completion).", ("call", "kind")))
+LLM_PROMPT_TOKENS = registry.register(Histogram(
+    "salesbot_llm_prompt_tokens", "Prompt tokens per Groq call.", ("call",), buckets=TOKEN_BUCKETS))
+LLM_RETRIES = registry.register(Counter(
+    "salesbot_llm_retries_total", "Groq calls retried, by call and reason.", ("call", "reason")))
+LLM_QUEUE_SECONDS = registry.register(Histogram(
+    "salesbot_llm_queue_seconds", "Time Groq calls waited for RPM/TPM capacity.", ("call",)))
+
+_timings: contextvars.ContextVar[Dict[str, float] | None] = contextvars.ContextVar("timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the block as `stage`: histogram observation plus the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
+
+
+def timed(stage: str, fn: Callable) -> Callable:
+    """`fn` wrapped in span(stage), bound to the caller's context so a worker thread records into its timings."""
+    context = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        def run():
+            with span(stage):
+                return fn(*args, **kwargs)
+        return context.run(run)
+    return call
+
+
+@contextmanager
+def collect_timings(endpoint: str = "query"):
+    """
+    Collect the spans of one request; yields the timings dict, whose "total"
+    is filled in on exit. Also counts the request, observes its end-to-end
+    latency and logs the timings.
+    """
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield timings
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        try:
+            _timings.reset(token)
+        except ValueError:
+            # a streaming body closed from another context (client went away)
+            _timings.set(None)
+        timings["total"] = round(elapsed * 1000, 3)
+        QUERY_SECONDS.observe(elapsed, endpoint=endpoint)
+        QUERIES.inc(endpoint=endpoint, outcome=outcome)
+        logger.info(f"[TIMINGS] {endpoint} {outcome}: {timings}")
+
+
+def record_llm(call: str, chat=None) -> None:
+    """Count a Groq completion (None = the call failed) and the token usage it reports."""
+    if chat is None:
+        LLM_REQUESTS.inc(call=call, outcome="error")
+        return
+    LLM_REQUESTS.inc(call=call, outcome="ok")
+    usage = getattr(chat, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is not None:
+        LLM_TOKENS.inc(prompt, call=call, kind="prompt")
+        LLM_PROMPT_TOKENS.observe(prompt, call=call)
+    if completion is not None:
+        LLM_TOKENS.inc(completion, call=call, kind="completion")
+
+
+def _component_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    from app.plan_cache import plan_cache
+    from app.result_cache import result_cache
+    from app.template_planner import template_planner
+
+    template = template_planner.stats()
+    sources = {
+        "plan": plan_cache.stats(),
+        "result": result_cache.stats(),
+        "template": {"hits": template["matches"], "misses": template["attempts"] - template["matches"],
+                     "hit_rate": template["match_rate"]},
+    }
+    return [({"cache": name}, s[field]) for name, s in sources.items()]
+
+
+def _pool_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    from app.db import pool
+    return [({}, pool.stats()[field])]
+
+
+def _singleflight_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    from app import singleflight
+    return [({"group": name}, s[field]) for name, s in singleflight.stats().items()]
+
+
+def _llm_gateway_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    from app.llm_gateway import gateway
+    value = gateway.stats()[field]
+    return [] if value is None else [({}, value)]
+
+
+registry.callback("salesbot_cache_hits_total", "Cache hits (template = template planner matches).", "counter",
+                  lambda: _component_samples("hits"))
+registry.callback("salesbot_cache_misses_total", "Cache misses.", "counter", lambda: _component_samples("misses"))
+registry.callback("salesbot_cache_hit_ratio", "Hits / lookups since start.", "gauge",
+                  lambda: _component_samples("hit_rate"))
+registry.callback("salesbot_db_pool_in_use", "Pooled SQLite connections checked out.", "gauge",
+                  lambda: _pool_samples("in_use"))
+registry.callback("salesbot_db_pool_waits_total", "Connection checkouts that had to wait.", "counter",
+                  lambda: _pool_samples("waits"))
+registry.callback("salesbot_llm_available_requests", "Requests left in the Groq RPM bucket.", "gauge",
+                  lambda: _llm_gateway_samples("available_requests"))
+registry.callback("salesbot_llm_available_tokens", "Tokens left in the Groq TPM bucket.", "gauge",
+                  lambda: _llm_gateway_samples("available_tokens"))
+registry.callback("salesbot_llm_queued", "Groq calls waiting for rate-limit capacity.", "gauge",
+                  lambda: _llm_gateway_samples("queued"))
+registry.callback("salesbot_singleflight_shared_total", "Calls answered by an identical call already in flight.",
+                  "counter", lambda: _singleflight_samples("shared"))
+registry.callback("salesbot_singleflight_in_flight", "Distinct calls currently running per coalescing group.",
+                  "gauge", lambda: _singleflight_samples("in_flight"))
+
+
+def render() -> str:
+    return registry.render()
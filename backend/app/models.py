@@ -1,15 +1,23 @@
     
 from pydantic import BaseModel
-from typing import Any, List, Optional, Dict
+from typing import Any, List, Literal, Optional, Dict
 
 class QueryRequest(BaseModel):
     prompt: str
+    # "columnar" returns `columns` + one array per column in `column_data` instead of per-row dicts in `data`
+    format: Literal["rows", "columnar"] = "rows"
+    # include per-stage timings (ms) in the response
+    timings: bool = False
 
 class QueryResponse(BaseModel):
     intent: str
     query: Optional[str] = None
     data: Optional[List[Dict[str, Any]]] = None
+    columns: Optional[List[str]] = None
+    column_data: Optional[List[List[Any]]] = None
     chart: Optional[Dict[str, Any]] = None
     summary: Optional[str] = None
     forecast: Optional[Dict[str, Any]] = None
     message: Optional[str] = None
+    truncated: Optional[bool] = None
+    timings: Optional[Dict[str, float]] = None
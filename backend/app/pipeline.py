@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from app.db import DB_POOL_SIZE, SQL_MAX_ROWS, iter_sql, run_sql_columnar
+from app.result_profile import profile_result
+from app.resultset import to_columns, to_records
+from app.forecast_engine import forecast_engine
+from app.llm import generate_plan_async, repair_sql_async
+from app.index_advisor import index_advisor
+from app.metrics import PLAN_SOURCE, RESULT_ROWS, span, timed
+from app.plan_cache import normalize_prompt, plan_cache
+from app.schema_catalog import schema_catalog
+from app.schema_retriever import schema_retriever
+from app.template_planner import template_planner
+from app.sql_validator import SQL_REPAIR_LLM, SQL_VALIDATE, validate_sql
+from app.singleflight import SingleFlight
+from app.sql_generator import (
+    FORECAST_TIMEOUT,
+    SUMMARY_TIMEOUT,
+    apply_check,
+    as_result,
+    build_chart_config,
+    finish_response,
+    make_response,
+    plan_context,
+    plan_fingerprint,
+    predict_intent,
+    read_plan,
+    route_intent,
+)
+from app.summarizer import summarize_data_async
+
+logger = logging.getLogger(__name__)
+
+# Rows kept in memory while streaming, for the chart/summary/forecast built after the last chunk
+STREAM_RETAIN_ROWS = int(os.getenv("STREAM_RETAIN_ROWS", "5000"))
+
+# Max in-flight work per stage; requests beyond the limit queue on the semaphore
+STAGE_LIMITS = {
+    "plan": int(os.getenv("PLAN_CONCURRENCY", "64")),
+    "sql": int(os.getenv("SQL_CONCURRENCY", str(DB_POOL_SIZE))),
+    "summary": int(os.getenv("SUMMARY_CONCURRENCY", "64")),
+    "forecast": int(os.getenv("FORECAST_CONCURRENCY", str(forecast_engine.queue_size))),
+}
+
+# Identical questions asked while one is already being answered share its work:
+# whole requests, and separately the LLM plan (+ validation) for a prompt
+query_flight = SingleFlight("query")
+plan_flight = SingleFlight("plan", stage="plan")
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_sql_executor = ThreadPoolExecutor(max_workers=STAGE_LIMITS["sql"], thread_name_prefix="sql")
+
+# Event loop that runs handle_sql() for blocking callers; the stage semaphores bind to one loop
+_sync_loop: asyncio.AbstractEventLoop | None = None
+_sync_loop_lock = threading.Lock()
+
+
+def _stage(name: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(name)
+    if sem is None:
+        sem = _semaphores[name] = asyncio.Semaphore(STAGE_LIMITS[name])
+    return sem
+
+
+async def run_sql_async(sql: str):
+    """Run a query on the bounded SQL thread pool; returns the columnar result."""
+    async with _stage("sql"):
+        loop = asyncio.get_running_loop()
+        with span("execute"):
+            return await loop.run_in_executor(_sql_executor, run_sql_columnar, sql)
+
+
+async def summarize_async(user_prompt: str, rows, profile: Dict[str, Any] | None = None) -> str | None:
+    async with _stage("summary"):
+        with span("summarize"):
+            return await summarize_data_async(user_prompt, rows, profile)
+
+
+async def forecast_async(rows, prompt: str, profile: Dict[str, Any] | None = None,
+                         horizon: int | None = None) -> Dict[str, Any] | None:
+    """
+    Fit forecasts on the forecast engine's process pool so the event loop and GIL stay free.
+    `horizon` (e.g. from a template plan) overrides the one read from the prompt.
+    """
+    async with _stage("forecast"):
+        with span("forecast"):
+            return await forecast_engine.forecast_async(rows, horizon=horizon, prompt=prompt, profile=profile)
+
+
+async def _llm_plan_async(user_prompt: str, catalog: Dict[str, Any], fingerprint: str) -> Dict[str, Any] | None:
+    """Generate, validate and cache a plan with the LLM (run once per prompt by plan_flight)."""
+    context = plan_context(catalog)
+    loop = asyncio.get_running_loop()
+    with span("plan"):
+        # in a thread: the first call loads the embedding model, and every call encodes the prompt
+        pruned = await loop.run_in_executor(None, schema_retriever.prune, user_prompt, context, fingerprint)
+        async with _stage("plan"):
+            plan = await generate_plan_async(user_query=user_prompt, **pruned)
+    if plan:
+        with span("validate"):
+            plan = await _check_plan_async(user_prompt, plan, context)
+        if "sql_error" not in plan:
+            plan_cache.put(user_prompt, fingerprint, plan)
+    return plan
+
+
+async def _get_plan_async(user_prompt: str) -> Dict[str, Any] | None:
+    # its own stage: "plan" is the LLM call (or the wait for a shared one), observed once per request
+    with span("plan_lookup"):
+        catalog = schema_catalog.current()
+        fingerprint = plan_fingerprint(catalog)
+        plan, source = plan_cache.get(user_prompt, fingerprint, catalog["schema_dict"]), "cache"
+        if plan is None:
+            # on the SQL executor: vetting a template against a new schema runs EXPLAIN
+            loop = asyncio.get_running_loop()
+            plan, source = await loop.run_in_executor(_sql_executor, template_planner.match,
+                                                      user_prompt, fingerprint), "template"
+    if plan is None:
+        plan, shared = await plan_flight.do_async((fingerprint, normalize_prompt(user_prompt)), _llm_plan_async,
+                                                  user_prompt, catalog, fingerprint)
+        source = "shared" if shared else "llm"
+    if plan:
+        PLAN_SOURCE.inc(source=source)
+    return plan
+
+
+async def _check_plan_async(user_prompt: str, plan: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a freshly generated plan before it is cached or run: local fixes
+    first (sql_validator, EXPLAIN on the SQL executor), then at most one LLM repair call.
+    """
+    if not SQL_VALIDATE:
+        return plan
+    loop = asyncio.get_running_loop()
+    async with _stage("sql"):
+        check = await loop.run_in_executor(_sql_executor, validate_sql, plan["sql"], context["schema_dict"])
+    repaired = False
+    if not check["ok"] and SQL_REPAIR_LLM:
+        async with _stage("plan"):
+            sql = await repair_sql_async(user_prompt, check["sql"], check["error"], **context)
+        if sql:
+            async with _stage("sql"):
+                check = await loop.run_in_executor(_sql_executor, validate_sql, sql, context["schema_dict"])
+            repaired = True
+    return apply_check(plan, check, repaired)
+
+
+async def _plan_and_intent_async(user_prompt: str):
+    """Plan and local intent prediction side by side: the classifier never waits on the LLM."""
+    loop = asyncio.get_running_loop()
+    predicted = loop.run_in_executor(None, timed("classify", predict_intent), user_prompt)
+    plan = await _get_plan_async(user_prompt)
+    return plan, await predicted
+
+
+async def handle_sql_async(user_prompt: str, fmt: str = "rows") -> Dict[str, Any]:
+    """
+    Single entry point, used by the /query route:
+      - Classify intent locally (embeddings) alongside planning; a likely forecast prestarts the forecast workers
+      - Ask LLM for plan (intent + chart_type + sql), unless the plan cache has it
+        or a template_planner template matches;
+        new plans are validated/repaired (sql_validator) before they are cached
+      - Execute SQL
+      - Build chart JSON, while concurrently:
+          - Summarize
+          - If forecast intent: forecast returned historical series (one per group
+            when the rows hold several series, e.g. per category) in the forecast process pool
+      - A summary/forecast branch that exceeds its timeout is left out (partial response)
+    Concurrent calls with the same prompt and format share one computation (query_flight).
+    """
+    response, _ = await query_flight.do_async((normalize_prompt(user_prompt), fmt), _handle_sql_async,
+                                              user_prompt, fmt)
+    # shared by every coalesced caller; /query adds its own "timings" to the copy
+    return dict(response)
+
+
+async def _handle_sql_async(user_prompt: str, fmt: str) -> Dict[str, Any]:
+    plan, predicted = await _plan_and_intent_async(user_prompt)
+    if not plan:
+        return make_response("historical", "LLM failed to produce a plan.")
+
+    intent, chart_type, sql, blocked = read_plan(plan)
+    if blocked:
+        return blocked
+    intent = route_intent(intent, predicted)
+
+    result = await run_sql_async(sql)
+    if "error" in result:
+        return make_response(intent, f"SQL Error: {result['error']}", query=sql)
+    index_advisor.record(sql)
+    result = as_result(result)
+    RESULT_ROWS.observe(len(result["rows"]))
+    data = to_records(result) if fmt == "rows" else None
+    profile = profile_result(result)
+
+    # Fan out summary/forecast, build the chart meanwhile, then fan in with per-branch timeouts
+    branches = {"summary": asyncio.create_task(
+        asyncio.wait_for(summarize_async(user_prompt, result, profile), SUMMARY_TIMEOUT))}
+    if intent == "forecast":
+        branches["forecast"] = asyncio.create_task(
+            asyncio.wait_for(forecast_async(result, user_prompt, profile, plan.get("horizon")), FORECAST_TIMEOUT))
+
+    with span("chart"):
+        chart = build_chart_config(chart_type, result, table_rows=data, profile=profile)
+
+    results = dict(zip(branches, await asyncio.gather(*branches.values(), return_exceptions=True)))
+    timed_out = [name for name, res in results.items() if isinstance(res, asyncio.TimeoutError)]
+    for name, res in results.items():
+        if isinstance(res, BaseException) and name not in timed_out:
+            logging.error(f"[{name.upper()} ERROR] {res}")
+            results[name] = None
+
+    return finish_response(intent, sql, result, chart, results.get("summary"), results.get("forecast"), timed_out,
+                   fmt=fmt, data=data)
+
+
+async def _fetch_batches(sql: str, batches: asyncio.Queue, max_rows: int = SQL_MAX_ROWS) -> bool:
+    """
+    Drive db.iter_sql on the SQL executor, one fetchmany batch per hop, and put
+    each (columns, rows) batch on `batches`, then None. Runs at SQLite speed
+    rather than the client's: the stage slot and pooled connection are given
+    back as soon as the last row is read, not when the client has consumed it.
+    At most `max_rows` rows are fetched; returns whether more were available.
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+    truncated = False
+    try:
+        async with _stage("sql"):
+            with span("execute"):
+                cursor = iter_sql(sql)
+                try:
+                    fetched = 0
+                    while True:
+                        batch = await loop.run_in_executor(_sql_executor, next, cursor, done)
+                        if batch is done:
+                            break
+                        columns, rows = batch
+                        if fetched + len(rows) > max_rows:
+                            rows = rows[:max_rows - fetched]
+                            truncated = True
+                        fetched += len(rows)
+                        if rows:
+                            batches.put_nowait((columns, rows))
+                        if truncated:
+                            break
+                finally:
+                    # returns the pooled connection even if the stream was cancelled mid-query
+                    await loop.run_in_executor(_sql_executor, cursor.close)
+    finally:
+        batches.put_nowait(None)
+    return truncated
+
+
+async def stream_sql_async(user_prompt: str, fmt: str = "rows"):
+    """
+    Staged variant of handle_sql_async. Yields events as soon as each is ready:
+      plan -> rows (one per fetchmany batch, SQL_MAX_ROWS in all) -> chart -> summary / forecast (as they finish) -> done
+    Row batches carry `data` (per-row dicts) or, with fmt="columnar", `columns` + `column_data`.
+    An "error" event ends the stream early.
+    """
+    plan, predicted = await _plan_and_intent_async(user_prompt)
+    if not plan:
+        yield {"event": "error", "message": "LLM failed to produce a plan."}
+        return
+
+    intent, chart_type, sql, blocked = read_plan(plan)
+    if blocked:
+        yield {"event": "error", "intent": intent, "message": blocked["message"]}
+        return
+    intent = route_intent(intent, predicted)
+    yield {"event": "plan", "intent": intent, "chart_type": chart_type, "query": sql}
+
+    retained = {"columns": [], "rows": [], "truncated": False}
+    row_count = 0
+    batches: asyncio.Queue = asyncio.Queue()
+    fetch = asyncio.create_task(_fetch_batches(sql, batches))
+    try:
+        while (batch := await batches.get()) is not None:
+            columns, rows = batch
+            row_count += len(rows)
+            retained["columns"] = columns
+            if len(retained["rows"]) < STREAM_RETAIN_ROWS:
+                retained["rows"].extend(rows[:STREAM_RETAIN_ROWS - len(retained["rows"])])
+            if fmt == "columnar":
+                yield {"event": "rows", "columns": columns,
+                       "column_data": list(to_columns({"columns": columns, "rows": rows}).values())}
+            else:
+                yield {"event": "rows", "data": to_records({"columns": columns, "rows": rows})}
+        truncated = await fetch
+    except Exception as e:
+        logging.error(f"Error executing SQL query: {e}")
+        yield {"event": "error", "intent": intent, "query": sql, "message": f"SQL Error: {e}"}
+        return
+    finally:
+        fetch.cancel()
+    RESULT_ROWS.observe(row_count)
+
+    profile = profile_result(retained)
+    branches = [asyncio.create_task(_named("summary", SUMMARY_TIMEOUT, summarize_async(user_prompt, retained, profile)))]
+    if intent == "forecast":
+        branches.append(asyncio.create_task(
+            _named("forecast", FORECAST_TIMEOUT, forecast_async(retained, user_prompt, profile, plan.get("horizon")))))
+
+    with span("chart"):
+        chart = build_chart_config(chart_type, retained, profile=profile)
+    yield {"event": "chart", "chart": chart}
+
+    timed_out = []
+    try:
+        for next_done in asyncio.as_completed(branches):
+            name, value, ok = await next_done
+            if not ok:
+                timed_out.append(name)
+            yield {"event": name, name: value}
+    finally:
+        for task in branches:
+            task.cancel()
+
+    message = "Query executed successfully."
+    if timed_out:
+        message = f"Query executed successfully (partial: {', '.join(timed_out)} timed out)."
+    yield {"event": "done", "message": message, "row_count": row_count, "truncated": truncated,
+           "truncated_for_analysis": row_count > len(retained["rows"])}
+
+
+async def _named(name: str, timeout: float, coro):
+    """Await a branch with a timeout; returns (name, value, ok) so as_completed callers know which finished."""
+    try:
+        return name, await asyncio.wait_for(coro, timeout), True
+    except asyncio.TimeoutError:
+        if name == "forecast":
+            return name, {"note": f"Forecast timed out after {timeout:g}s."}, False
+        return name, None, False
+
+
+def _loop_for_sync_callers() -> asyncio.AbstractEventLoop:
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="pipeline-loop", daemon=True).start()
+        return _sync_loop
+
+
+def handle_sql(user_prompt: str, fmt: str = "rows") -> Dict[str, Any]:
+    """
+    Blocking handle_sql_async for callers outside an event loop (scripts, the
+    bench's thread mode). Every such call runs on one shared background loop,
+    so the stage limits hold across threads; the caller's metrics context comes along.
+    """
+    return asyncio.run_coroutine_threadsafe(handle_sql_async(user_prompt, fmt), _loop_for_sync_callers()).result()
+
+
+def shutdown() -> None:
+    global _sync_loop
+    with _sync_loop_lock:
+        loop, _sync_loop = _sync_loop, None
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+    _sql_executor.shutdown(wait=False, cancel_futures=True)
+    forecast_engine.shutdown()
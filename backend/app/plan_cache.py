@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+PLAN_CACHE_SEMANTIC = os.getenv("PLAN_CACHE_SEMANTIC", "0").lower() in {"1", "true", "yes"}
+PLAN_CACHE_SIMILARITY = float(os.getenv("PLAN_CACHE_SIMILARITY", "0.92"))
+
+# Words that don't name anything in the data: rewording them never changes the SQL
+_FILLER = frozenset("""
+    a an the of for in on at to from by per with within and or vs versus all each every any
+    me us my our i we you show list display give get find tell return see what which who whose
+    how many much is are was were be there do does did can could would please
+""".split())
+# Analytics words the embedding already tells apart; not entity names either
+_QUERY_WORDS = frozenset("""
+    total sum average avg mean count number top bottom first last highest lowest most least best
+    worst largest smallest biggest rank ranking trend growth share percent percentage ratio compare
+    comparison breakdown over time day daily week weekly month monthly quarter quarterly year
+    yearly annual sales revenue amount value spend spending forecast predict next previous
+""".split())
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial rewordings share a key."""
+    text = (prompt or "").lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _stem(word: str) -> str:
+    # plural and singular name the same thing ("customers" / "customer")
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def schema_vocabulary(schema_dict: Dict[str, Any]) -> frozenset:
+    """Stemmed words of every table and column name ("OrderDate" -> order, date)."""
+    words = set()
+    for table, columns in schema_dict.items():
+        for name in (table, *columns):
+            for part in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+", name):
+                words.add(_stem(part.lower()))
+    return frozenset(words)
+
+
+def entity_slots(norm: str, vocabulary: frozenset = frozenset()) -> frozenset:
+    """
+    Words of a normalized prompt that are neither filler, analytics vocabulary,
+    schema names nor numbers: what is left names values in the data ("germany",
+    "exotic liquids"), which the SQL filters on literally.
+    """
+    slots = set()
+    for word in norm.split():
+        stem = _stem(word)
+        if word.isdigit() or word in _FILLER or word in _QUERY_WORDS or stem in vocabulary:
+            continue
+        slots.add(stem)
+    return frozenset(slots)
+
+
+def schema_fingerprint(schema: str, relationships: list[dict]) -> str:
+    """Short hash of the schema text and relationships; plans are only valid for the schema they were built on."""
+    h = hashlib.sha1(schema.encode("utf-8"))
+    for r in relationships:
+        h.update(f"{r['from_table']}.{r['from_col']}={r['to_table']}.{r['to_col']};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class PlanCache:
+    """
+    LRU + TTL cache of LLM plans keyed on (schema fingerprint, normalized prompt).
+    With `semantic=True`, an exact miss falls back to a cosine-similarity lookup
+    over cached prompt embeddings (same SentenceTransformer as embeddings.py),
+    among entries with the same numbers and entity slots as the prompt: the
+    embedding barely separates "customers from Germany" and "... from France".
+    """
+
+    def __init__(self,
+                 max_size: int = PLAN_CACHE_SIZE,
+                 ttl: float = PLAN_CACHE_TTL,
+                 semantic: bool = PLAN_CACHE_SEMANTIC,
+                 similarity: float = PLAN_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: "OrderedDict[tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # fingerprint -> schema_vocabulary(), only the latest schema's
+        self._vocabularies: Dict[str, frozenset] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    def _embed(self, text: str):
+        try:
+            from app.embeddings import get_model
+            return get_model().encode(text, normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Semantic plan cache disabled: {e}")
+            self.semantic = False
+            return None
+
+    def _semantic_lookup(self, norm: str, fingerprint: str, now: float,
+                         vocabulary: frozenset) -> Optional[Dict[str, Any]]:
+        import numpy as np
+
+        query_vec = self._embed(norm)
+        if query_vec is None:
+            return None
+        # numbers ("top 5" vs "top 10", years) and data values ("germany" vs "france")
+        # change the SQL, so they must match exactly
+        numbers = re.findall(r"\d+", norm)
+        slots = entity_slots(norm, vocabulary)
+
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == fingerprint
+                and entry.get("embedding") is not None
+                and not self._expired(entry, now)
+                and re.findall(r"\d+", key[1]) == numbers
+                and entity_slots(key[1], vocabulary) == slots
+            ]
+        if not candidates:
+            return None
+
+        matrix = np.stack([entry["embedding"] for _, entry in candidates])
+        scores = matrix @ query_vec
+        best = int(np.argmax(scores))
+        if float(scores[best]) < self.similarity:
+            return None
+
+        key, entry = candidates[best]
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return entry
+
+    def get(self, prompt: str, fingerprint: str,
+            schema_dict: Dict[str, Any] | None = None) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the cached plan for this prompt, or None. `schema_dict`
+        (the schema behind `fingerprint`) lets semantic lookups tell table and
+        column words apart from data values; without it every unknown word counts as a value.
+        """
+        norm = normalize_prompt(prompt)
+        key = (fingerprint, norm)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry["plan"])
+
+        if self.semantic:
+            entry = self._semantic_lookup(norm, fingerprint, now, self._vocabulary(fingerprint, schema_dict))
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                return dict(entry["plan"])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _vocabulary(self, fingerprint: str, schema_dict: Dict[str, Any] | None) -> frozenset:
+        if not schema_dict:
+            return frozenset()
+        with self._lock:
+            vocabulary = self._vocabularies.get(fingerprint)
+        if vocabulary is None:
+            vocabulary = schema_vocabulary(schema_dict)
+            with self._lock:
+                self._vocabularies = {fingerprint: vocabulary}
+        return vocabulary
+
+    def put(self, prompt: str, fingerprint: str, plan: Dict[str, Any]) -> None:
+        norm = normalize_prompt(prompt)
+        embedding = self._embed(norm) if self.semantic else None
+        with self._lock:
+            self._entries[(fingerprint, norm)] = {
+                "plan": dict(plan),
+                "created": time.time(),
+                "embedding": embedding,
+            }
+            self._entries.move_to_end((fingerprint, norm))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "semantic": self.semantic,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+plan_cache = PlanCache()
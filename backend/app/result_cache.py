@@ -0,0 +1,133 @@
+import logging
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop a trailing semicolon, leaving quoted literals/identifiers untouched."""
+    parts = _LITERAL.split(sql.strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def db_version(db_path: Path) -> tuple:
+    """
+    Cheap version token for the database: mtime and size of the main file and
+    its WAL. Any committed write changes at least one of them.
+    """
+    token = []
+    for p in (db_path, Path(f"{db_path}-wal")):
+        try:
+            st = p.stat()
+            token.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            token.append(None)
+    return tuple(token)
+
+
+def _estimate_size(result: Dict[str, Any]) -> int:
+    """Approximate in-memory size of a columnar result, extrapolated from the first rows."""
+    rows = result["rows"]
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(c) for c in result["columns"])
+    if not rows:
+        return size
+    sample = rows[:100]
+    sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in sample)
+    return size + sample_size * len(rows) // len(sample)
+
+
+class ResultCache:
+    """
+    LRU cache of columnar query results, bounded by approximate byte size.
+    Entries belong to one database version; seeing a new version drops them all.
+    Cached results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, enabled: bool = RESULT_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: "OrderedDict[tuple, tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version) -> None:
+        # caller holds the lock
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                logger.info(f"Database changed; dropping {len(self._entries)} cached results")
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key: tuple, version) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key: tuple, version, result: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        size = _estimate_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,103 @@
+"""
+Column roles for a query result, inferred once and shared by chart building,
+forecasting and summarization.
+
+    profile_result(result) -> {
+        "rows": int,
+        "columns": {name: {"role": "time" | "measure" | "category", "dtype": str}},
+        "time": first time column or None,
+        "measures": [...], "categories": [...],
+        "value": preferred measure or None,
+    }
+
+SQLite cursors carry no column types, so the checks run on the values sqlite
+returned: pandas' infer_dtype per column, with pd.to_numeric / str.fullmatch
+over whole columns for text. The profile holds only names, so it is cheap to
+pickle into forecast worker processes. Like resultset, no database imports.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.resultset import as_columnar
+
+TIME_HINTS = ("date", "month", "year", "period", "quarter", "week")
+MEASURE_PREFERENCE = ("sales", "revenue", "amount", "total", "value", "freight")
+# 1997, 1997-03, 1997-03-14, 1997-03-14 00:00:00, 1997-Q1
+_PERIOD_PATTERN = r"\d{4}(?:-\d{2}(?:-\d{2}(?:[ T][\d:.]+)?)?|-?Q[1-4])?"
+_NUMERIC_DTYPES = {"integer", "floating", "mixed-integer-float", "decimal", "boolean"}
+
+
+def _is_id(name: str) -> bool:
+    # CustomerID / OrderId / product_id are keys, not quantities
+    return name.lower() == "id" or name.endswith(("ID", "Id", "_id"))
+
+
+def _column_role(name: str, series: pd.Series) -> tuple[str, str]:
+    values = series.dropna()
+    dtype = pd.api.types.infer_dtype(values, skipna=True) if len(values) else "empty"
+    lower = name.lower()
+
+    # "MonthlySales" / "AvgFreightPerYear" are measures despite the hint
+    named_measure = any(p in lower for p in MEASURE_PREFERENCE) or dtype == "floating"
+    if any(h in lower for h in TIME_HINTS) and not named_measure:
+        return "time", dtype
+    if dtype == "string" and values.str.fullmatch(_PERIOD_PATTERN).all():
+        return "time", dtype
+
+    if dtype in _NUMERIC_DTYPES:
+        numeric = True
+    elif dtype == "string":
+        numeric = bool(pd.to_numeric(values, errors="coerce").notna().all())
+    else:
+        numeric = False
+    if numeric and not _is_id(name):
+        return "measure", dtype
+    return "category", dtype
+
+
+def profile_result(result) -> Dict[str, Any]:
+    """Infer column roles for a columnar result (a list of row dicts is also accepted)."""
+    result = as_columnar(result)
+    columns = list(result["columns"])
+    if not result["rows"]:
+        return {"rows": 0, "columns": {}, "time": None, "measures": [], "categories": [], "value": None}
+
+    df = pd.DataFrame.from_records(result["rows"], columns=columns, coerce_float=False)
+    roles = {}
+    for i, name in enumerate(columns):
+        role, dtype = _column_role(name, df.iloc[:, i])
+        roles[name] = {"role": role, "dtype": dtype}
+
+    times = [c for c in columns if roles[c]["role"] == "time"]
+    measures = [c for c in columns if roles[c]["role"] == "measure"]
+    value = next((m for pref in MEASURE_PREFERENCE for m in measures if pref in m.lower()), None)
+    return {
+        "rows": len(result["rows"]),
+        "columns": roles,
+        "time": times[0] if times else None,
+        "measures": measures,
+        "categories": [c for c in columns if roles[c]["role"] == "category"],
+        "value": value or (measures[0] if measures else None),
+    }
+
+
+def label_column(profile: Dict[str, Any], columns: List[str]) -> Optional[str]:
+    """Column to label chart points with: the time column, else the first category, else the first column."""
+    if profile["time"]:
+        return profile["time"]
+    if profile["categories"]:
+        return profile["categories"][0]
+    return columns[0] if columns else None
+
+
+def column_values(result: Dict[str, Any], column: str) -> List[Any]:
+    i = result["columns"].index(column)
+    return [row[i] for row in result["rows"]]
+
+
+def numeric_values(result: Dict[str, Any], column: str) -> np.ndarray:
+    """One column as float64; values that are not numbers become 0.0."""
+    series = pd.to_numeric(pd.Series(column_values(result, column), dtype=object), errors="coerce")
+    return series.fillna(0.0).to_numpy(dtype=float)
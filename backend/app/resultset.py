@@ -0,0 +1,41 @@
+"""
+Helpers for the columnar result shape produced by db.run_sql_columnar:
+    {"columns": [name, ...], "rows": [tuple, ...], "truncated": bool}
+Kept free of database imports so forecast worker processes can use it.
+"""
+from typing import Any, Dict, List
+
+
+def from_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """List of per-row dicts -> columnar result (for callers still passing the old shape)."""
+    if not records:
+        return {"columns": [], "rows": [], "truncated": False}
+    columns = list(records[0].keys())
+    return {"columns": columns, "rows": [tuple(r.get(c) for c in columns) for r in records], "truncated": False}
+
+
+def as_columnar(result) -> Dict[str, Any]:
+    """Accept either a columnar result or a list of dicts."""
+    if isinstance(result, dict) and "columns" in result:
+        return result
+    return from_records(result or [])
+
+
+def to_records(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Columnar result -> list of per-row dicts (the original run_sql shape)."""
+    columns = result["columns"]
+    return [dict(zip(columns, row)) for row in result["rows"]]
+
+
+def to_columns(result: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Columnar result -> {column: [values...]} with one array per column."""
+    columns = result["columns"]
+    if not result["rows"]:
+        return {c: [] for c in columns}
+    return dict(zip(columns, map(list, zip(*result["rows"]))))
+
+
+def row_count(result) -> int:
+    if isinstance(result, dict):
+        return len(result.get("rows") or [])
+    return len(result or [])
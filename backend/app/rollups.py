@@ -0,0 +1,304 @@
+"""
+Materialized monthly sales rollups built from the Northwind tables.
+
+The rollup tables live in a separate SQLite file (db.ROLLUP_DB_PATH) so the
+source database stays read-only; every pooled connection ATTACHes it as
+`rollup`, so the planner can query e.g. `rollup.sales_by_month_category`
+instead of aggregating every "Order Details" row.
+
+Sales = Quantity * UnitPrice * (1 - Discount), bucketed by strftime('%Y-%m', OrderDate).
+
+Rollups are only offered to the planner while they match the source: once
+the source database's version (result_cache.db_version) moves past the one
+they were built from, describe() leaves them out and a refresh runs in the
+background.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+from app.db import DB_PATH, ROLLUP_DB_PATH, pool
+from app.result_cache import db_version
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1").lower() in {"1", "true", "yes"}
+
+_SALES = 'SUM(od.Quantity * od.UnitPrice * (1 - od.Discount))'
+_BASE_FROM = 'src.Orders AS o JOIN src."Order Details" AS od ON o.OrderID = od.OrderID'
+_MONTH = "strftime('%Y-%m', o.OrderDate)"
+
+# name -> (dimension column definitions, SELECT expressions, extra joins, GROUP BY)
+ROLLUPS: Dict[str, Dict[str, Any]] = {
+    "sales_by_month": {
+        "columns": [],
+        "select": [],
+        "joins": "",
+        "group": [],
+        "requires": [],
+    },
+    "sales_by_month_category": {
+        "columns": ["CategoryID INTEGER", "CategoryName TEXT"],
+        "select": ["c.CategoryID", "c.CategoryName"],
+        "joins": "JOIN src.Products AS p ON od.ProductID = p.ProductID JOIN src.Categories AS c ON p.CategoryID = c.CategoryID",
+        "group": ["c.CategoryID", "c.CategoryName"],
+        "requires": ["Products", "Categories"],
+    },
+    "sales_by_month_product": {
+        "columns": ["ProductID INTEGER", "ProductName TEXT"],
+        "select": ["p.ProductID", "p.ProductName"],
+        "joins": "JOIN src.Products AS p ON od.ProductID = p.ProductID",
+        "group": ["p.ProductID", "p.ProductName"],
+        "requires": ["Products"],
+    },
+    "sales_by_month_customer": {
+        "columns": ["CustomerID TEXT", "CompanyName TEXT"],
+        "select": ["cu.CustomerID", "cu.CompanyName"],
+        "joins": "JOIN src.Customers AS cu ON o.CustomerID = cu.CustomerID",
+        "group": ["cu.CustomerID", "cu.CompanyName"],
+        "requires": ["Customers"],
+    },
+    "sales_by_month_employee": {
+        "columns": ["EmployeeID INTEGER", "EmployeeName TEXT"],
+        "select": ["e.EmployeeID", "e.FirstName || ' ' || e.LastName"],
+        "joins": "JOIN src.Employees AS e ON o.EmployeeID = e.EmployeeID",
+        "group": ["e.EmployeeID"],
+        "requires": ["Employees"],
+    },
+    "sales_by_month_country": {
+        "columns": ["Country TEXT"],
+        "select": ["cu.Country"],
+        "joins": "JOIN src.Customers AS cu ON o.CustomerID = cu.CustomerID",
+        "group": ["cu.Country"],
+        "requires": ["Customers"],
+    },
+}
+
+_METRICS = ["Sales REAL", "Quantity INTEGER", "Orders INTEGER"]
+
+# Totals over the order lines already rolled up (OrderID <= the stored max_order_id). Appending
+# orders leaves them as they were; editing or deleting rolled-up lines moves at least one of them.
+_TOTALS = f"COUNT(*), SUM(od.Quantity), {_SALES}, SUM(julianday(o.OrderDate))"
+# Dimension tables whose names end up in a rollup; a change in their row count forces a full rebuild
+_DIMENSIONS = ["Products", "Categories", "Customers", "Employees"]
+
+_lock = threading.Lock()
+_last_report: Dict[str, Any] = {}
+_description: Dict[str, Any] | None = None
+# source_version the rollup file was built from; None = not read yet
+_built_version: str | None = None
+_refresh_running = threading.Lock()
+
+
+def _dim_names(spec: Dict[str, Any]) -> List[str]:
+    return [c.split()[0] for c in spec["columns"]]
+
+
+def _insert_sql(name: str, spec: Dict[str, Any], where: str = "") -> str:
+    cols = ["Month"] + _dim_names(spec) + ["Sales", "Quantity", "Orders"]
+    select = [f"{_MONTH}"] + spec["select"] + [_SALES, "SUM(od.Quantity)", "COUNT(DISTINCT o.OrderID)"]
+    group = [_MONTH] + spec["group"]
+    return (
+        f'INSERT INTO {name} ({", ".join(cols)}) '
+        f'SELECT {", ".join(select)} FROM {_BASE_FROM} {spec["joins"]} '
+        f'WHERE o.OrderDate IS NOT NULL {where} '
+        f'GROUP BY {", ".join(group)}'
+    )
+
+
+def _create_sql(name: str, spec: Dict[str, Any]) -> str:
+    cols = ["Month TEXT NOT NULL"] + spec["columns"] + _METRICS
+    return f'CREATE TABLE IF NOT EXISTS {name} ({", ".join(cols)})'
+
+
+def _meta(conn, key: str):
+    row = conn.execute("SELECT value FROM _rollup_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn, key: str, value) -> None:
+    conn.execute("INSERT OR REPLACE INTO _rollup_meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _source_version() -> str:
+    return repr(db_version(DB_PATH))
+
+
+def _totals(conn, last_order: int) -> List[Any]:
+    """_TOTALS of the order lines with OrderID <= last_order."""
+    return list(conn.execute(f"SELECT {_TOTALS} FROM {_BASE_FROM} WHERE o.OrderID <= ?", (last_order,)).fetchone())
+
+
+def _dimension_counts(conn, src_tables: set) -> Dict[str, int]:
+    return {t: conn.execute(f"SELECT COUNT(*) FROM src.{t}").fetchone()[0] for t in _DIMENSIONS if t in src_tables}
+
+
+def refresh(full: bool = False) -> Dict[str, Any]:
+    """
+    Build or update the rollup tables. Incremental (append-only) when the
+    order lines already rolled up still have the stored row count and sums
+    and the dimension tables still have their row counts: only the months of
+    orders past max_order_id are re-aggregated. Any other change, or `full`,
+    rebuilds every rollup. Edits that keep all those totals (e.g. renaming a
+    category) need a full refresh.
+    """
+    global _last_report, _description, _built_version
+    start = time.perf_counter()
+    with _lock:
+        existed = ROLLUP_DB_PATH.exists()
+        conn = sqlite3.connect(str(ROLLUP_DB_PATH), uri=True)
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (f"{DB_PATH.as_uri()}?mode=ro",))
+            conn.execute("CREATE TABLE IF NOT EXISTS _rollup_meta (key TEXT PRIMARY KEY, value)")
+            src_tables = {r[0] for r in conn.execute("SELECT name FROM src.sqlite_master WHERE type='table'")}
+            src_token = _source_version()
+            max_order = conn.execute("SELECT MAX(OrderID) FROM src.Orders").fetchone()[0] or 0
+            last_order = _meta(conn, "max_order_id")
+            last_token = _meta(conn, "source_version")
+            last_totals = _meta(conn, "totals")
+            last_dimensions = _meta(conn, "dimensions")
+
+            totals = dimensions = None
+            if not full and last_token == src_token:
+                mode, months = "unchanged", []
+            else:
+                dimensions = json.dumps(_dimension_counts(conn, src_tables))
+                appended = (not full and last_order is not None and max_order >= last_order
+                            and dimensions == last_dimensions
+                            and json.dumps(_totals(conn, last_order)) == last_totals)
+                if appended:
+                    months = [r[0] for r in conn.execute(
+                        f"SELECT DISTINCT {_MONTH} FROM src.Orders AS o WHERE o.OrderID > ? AND o.OrderDate IS NOT NULL",
+                        (last_order,))]
+                    mode = "incremental" if months else "unchanged"
+                else:
+                    mode, months = "full", None
+                totals = _totals(conn, max_order)
+
+            built = []
+            if mode != "unchanged":
+                for name, spec in ROLLUPS.items():
+                    if not set(spec["requires"]) <= src_tables:
+                        continue
+                    conn.execute(_create_sql(name, spec))
+                    if months is None:
+                        conn.execute(f"DELETE FROM {name}")
+                        conn.execute(_insert_sql(name, spec))
+                    elif months:
+                        marks = ", ".join("?" * len(months))
+                        conn.execute(f"DELETE FROM {name} WHERE Month IN ({marks})", months)
+                        conn.execute(_insert_sql(name, spec, f"AND {_MONTH} IN ({marks})"), months)
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}_month" ON {name}(Month)')
+                    built.append(name)
+            if totals is not None:
+                _set_meta(conn, "max_order_id", max_order)
+                _set_meta(conn, "totals", json.dumps(totals))
+                _set_meta(conn, "dimensions", dimensions)
+            _set_meta(conn, "source_version", src_token)
+            conn.commit()
+        finally:
+            conn.close()
+
+        _description = None
+        _built_version = src_token
+        _last_report = {
+            "mode": mode,
+            "months_refreshed": months if months is not None else "all",
+            "tables": built,
+            "database": str(ROLLUP_DB_PATH),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        report = _last_report
+
+    if not existed:
+        # pooled connections opened before the file existed have nothing attached yet
+        pool.recycle()
+    logger.info(f"Rollups refresh ({mode}) in {report['duration_ms']} ms")
+    return report
+
+
+def available() -> bool:
+    return ROLLUPS_ENABLED and ROLLUP_DB_PATH.exists()
+
+
+def _background_refresh() -> None:
+    try:
+        refresh()
+    except Exception as e:
+        logger.error(f"Rollups background refresh failed: {e}")
+    finally:
+        _refresh_running.release()
+
+
+def current() -> bool:
+    """
+    Whether the rollups were built from the source as it is now (a stat() call).
+    When not, a refresh is started in the background and False is returned until it finishes.
+    """
+    global _built_version
+    if not available():
+        return False
+    if _built_version is None:
+        try:
+            with pool.connection() as conn:
+                row = conn.execute("SELECT value FROM rollup._rollup_meta WHERE key = 'source_version'").fetchone()
+            version = row[0] if row else ""
+        except sqlite3.Error:
+            version = ""
+        with _lock:
+            # a refresh that finished meanwhile has set the newer value
+            if _built_version is None:
+                _built_version = version
+    if _built_version == _source_version():
+        return True
+    if _refresh_running.acquire(blocking=False):
+        logger.info("Source database changed; rollups withheld until the background refresh finishes")
+        threading.Thread(target=_background_refresh, name="rollups-refresh", daemon=True).start()
+    return False
+
+
+def describe() -> Dict[str, Any]:
+    """
+    Schema text, schema_dict entries and planner guidance for the rollup tables
+    that actually exist. Empty when rollups are disabled, not built yet, or
+    stale (see current()).
+    """
+    global _description
+    if not current():
+        return {"schema": "", "schema_dict": {}, "hints": ""}
+    built_version = _built_version
+    description = _description
+    if description is not None:
+        return description
+    with pool.connection() as conn:
+        existing = {r[0] for r in conn.execute("SELECT name FROM rollup.sqlite_master WHERE type='table'")}
+    schema_lines, schema_dict = [], {}
+    for name, spec in ROLLUPS.items():
+        if name not in existing:
+            continue
+        cols = ["Month"] + _dim_names(spec) + ["Sales", "Quantity", "Orders"]
+        schema_lines.append(f"rollup.{name}({', '.join(cols)})")
+        schema_dict[f"rollup.{name}"] = set(cols)
+    hints = (
+        "Precomputed monthly rollups (attached database `rollup`): Month is 'YYYY-MM', "
+        "Sales = Quantity * UnitPrice * (1 - Discount) already summed, Orders = distinct orders.\n"
+        "PREFER these tables for monthly/quarterly/yearly sales trends, forecasts and totals "
+        "by category, product, customer, employee or country; aggregate them further with SUM() "
+        "(e.g. substr(Month, 1, 4) for years). Use the raw tables only for order-level detail.\n"
+        + "\n".join(schema_lines)
+    )
+    description = {"schema": "\n".join(schema_lines), "schema_dict": schema_dict, "hints": hints}
+    with _lock:
+        # built from the rollup file as it was when this call started; keep it only if no refresh ran since
+        if built_version == _built_version:
+            _description = description
+    return description
+
+
+def status() -> Dict[str, Any]:
+    return {"enabled": ROLLUPS_ENABLED, "available": available(), "current": current(),
+            "last_refresh": _last_report}
@@ -1,10 +1,101 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from app.models import QueryRequest, QueryResponse
-from app.sql_generator import handle_sql
+from app import metrics, rollups
+from app.db import pool
+from app.index_advisor import INDEX_ADVISOR_APPLY, index_advisor
+from app.llm_gateway import gateway
+from app.pipeline import handle_sql_async, stream_sql_async
+from app.plan_cache import plan_cache
+from app.result_cache import result_cache
+from app.schema_catalog import schema_catalog
+from app.schema_retriever import schema_retriever
+from app.template_planner import template_planner
+from app import singleflight, sql_validator
 
 router = APIRouter()
 
 @router.post("/query", response_model=QueryResponse)
-def query_handler(req: QueryRequest):
-    result = handle_sql(req.prompt)
+async def query_handler(req: QueryRequest):
+    with metrics.collect_timings("query") as timings:
+        result = await handle_sql_async(req.prompt, fmt=req.format)
+    if req.timings:
+        result["timings"] = timings
     return result
+
+
+@router.post("/query/stream")
+async def query_stream_handler(req: QueryRequest, transport: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    """
+    Streaming variant of /query. Emits plan, row batches, chart, summary and
+    forecast as separate events, as NDJSON lines or Server-Sent Events
+    (`transport`); row batches follow the body's `format` like /query does.
+    """
+    async def body():
+        with metrics.collect_timings("stream") as timings:
+            async for event in stream_sql_async(req.prompt, fmt=req.format):
+                if event["event"] == "done" and req.timings:
+                    event["timings"] = dict(timings)
+                payload = json.dumps(event, default=str)
+                if transport == "sse":
+                    yield f"event: {event['event']}\ndata: {payload}\n\n"
+                else:
+                    yield payload + "\n"
+
+    media_type = "text/event-stream" if transport == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the plan and result caches, DB pool usage, SQL validation outcomes, prompt-token savings, template match rate, coalesced in-flight calls and Groq rate-limiter state."""
+    return {
+        "plan_cache": plan_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "db_pool": pool.stats(),
+        "sql_validator": sql_validator.stats(),
+        "schema_retriever": schema_retriever.stats(),
+        "template_planner": template_planner.stats(),
+        "singleflight": singleflight.stats(),
+        "llm_gateway": gateway.stats(),
+    }
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Stage latency histograms, row counts, Groq token usage and cache hit rates in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.post("/admin/schema/refresh")
+def schema_refresh(force: bool = False):
+    """Re-read schema and date ranges without a restart; force=true re-scans every table."""
+    return schema_catalog.refresh(force=force)
+
+
+@router.get("/admin/index-advisor")
+def index_advisor_report(limit: int = 50):
+    """EXPLAIN QUERY PLAN of recently executed SQL, full scans and recommended indexes."""
+    return index_advisor.report(schema_catalog.current()["schema_dict"], limit=limit)
+
+
+@router.post("/admin/index-advisor/apply")
+def index_advisor_apply():
+    """Create the recommended indexes on a copy of the database and report before/after timings."""
+    if not INDEX_ADVISOR_APPLY:
+        raise HTTPException(status_code=403, detail="Set INDEX_ADVISOR_APPLY=1 to allow building an indexed copy.")
+    return index_advisor.apply(schema_catalog.current()["schema_dict"])
+
+
+@router.get("/admin/rollups")
+def rollups_status():
+    return rollups.status()
+
+
+@router.post("/admin/rollups/refresh")
+def rollups_refresh(full: bool = False):
+    """Incrementally update the monthly sales rollups; full=true rebuilds them."""
+    if not rollups.ROLLUPS_ENABLED:
+        raise HTTPException(status_code=403, detail="Rollups are disabled (ROLLUPS_ENABLED=0).")
+    return rollups.refresh(full=full)
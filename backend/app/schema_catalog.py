@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from app.db import BACKEND_DIR, DB_PATH, pool
+from app.plan_cache import schema_fingerprint
+from app.result_cache import db_version
+from app.schema_extractor import (
+    _list_tables,
+    _table_columns,
+    _table_date_ranges,
+    _table_relationships,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 3
+SCHEMA_SNAPSHOT_DIR = Path(os.getenv("SCHEMA_SNAPSHOT_DIR", str(BACKEND_DIR / ".cache")))
+# How often (seconds) a request may stat the DB file to notice changes
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "30"))
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _table_token(cursor, table: str) -> list:
+    """
+    Cheap per-table change marker: [COUNT(*), MAX(rowid)]. Inserts and deletes
+    move it; UPDATEs in place do not.
+    """
+    try:
+        cursor.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{table}"')
+        return list(cursor.fetchone())
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID tables
+        cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+        return [cursor.fetchone()[0], None]
+
+
+class SchemaCatalog:
+    """
+    Schema, relationships and date ranges for the database, persisted to a JSON
+    snapshot keyed by DB path so restarts skip introspection entirely while the
+    file is unchanged. Loaded on first use; when the file changes (db_version),
+    only tables whose CREATE statement moved are re-introspected, and date
+    ranges are re-scanned only for tables whose _table_token moved. When no
+    token moved (an UPDATE in place), every table's date ranges are re-scanned.
+    Refreshes triggered by a request run in the background; readers keep the
+    previous view meanwhile.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH, snapshot_dir: Path = SCHEMA_SNAPSHOT_DIR,
+                 check_interval: float = SCHEMA_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_dir / f"schema_{_sha1(str(db_path))}.json"
+        self.check_interval = check_interval
+        self._snapshot: Dict[str, Any] | None = None
+        self._view: Dict[str, Any] | None = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    # --- persistence ---
+    def _load_snapshot(self) -> Dict[str, Any] | None:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            if snap.get("format") != SNAPSHOT_FORMAT or snap.get("db_path") != str(self.db_path):
+                return None
+            return snap
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema snapshot {self.snapshot_path}: {e}")
+            return None
+
+    def _save_snapshot(self, snap: Dict[str, Any]) -> None:
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.snapshot_path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Could not write schema snapshot {self.snapshot_path}: {e}")
+
+    # --- introspection ---
+    def _refresh(self, previous: Dict[str, Any] | None, force: bool) -> tuple[Dict[str, Any], list[str]]:
+        """Build a new snapshot, reusing entries of `previous` for tables that did not change."""
+        old_tables = (previous or {}).get("tables", {})
+        tables: Dict[str, Any] = {}
+        refreshed = []
+
+        # taken before reading, so writes made during the scan trigger another refresh
+        token = self._current_token()
+        data_changed = previous is None or previous.get("db_version") != token
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table';")
+            create_sql = dict(cursor.fetchall())
+            names = _list_tables(cursor)
+            table_tokens = {t: _table_token(cursor, t) for t in names} if data_changed else {}
+            # the file changed but no table's rows were added or removed: an UPDATE in place somewhere
+            in_place = data_changed and all(
+                t in old_tables and old_tables[t].get("token") == table_tokens[t] for t in names)
+
+            for table in names:
+                sql_hash = _sha1(create_sql.get(table) or "")
+                old = old_tables.get(table)
+                if not force and old and old["sql_hash"] == sql_hash:
+                    if not data_changed or (not in_place and old.get("token") == table_tokens[table]):
+                        tables[table] = {**old, "token": table_tokens.get(table, old.get("token"))}
+                        continue
+                    # data-only change: structure is the same, rescan the date ranges
+                    columns, rels = old["columns"], old["relationships"]
+                else:
+                    columns = _table_columns(cursor, table)
+                    rels = _table_relationships(cursor, table)
+                tables[table] = {
+                    "sql_hash": sql_hash,
+                    "token": table_tokens.get(table) or _table_token(cursor, table),
+                    "columns": columns,
+                    "relationships": rels,
+                    "date_ranges": _table_date_ranges(cursor, table, columns),
+                }
+                refreshed.append(table)
+            cursor.close()
+
+        snap = {
+            "format": SNAPSHOT_FORMAT,
+            "db_path": str(self.db_path),
+            "db_version": token,
+            "tables": tables,
+        }
+        return snap, refreshed
+
+    def _build_view(self, snap: Dict[str, Any]) -> Dict[str, Any]:
+        tables = snap["tables"]
+        schema = "\n".join(f"{t}({', '.join(info['columns'])})" for t, info in tables.items())
+        relationships = [r for info in tables.values() for r in info["relationships"]]
+        return {
+            "schema": schema,
+            "schema_dict": {t: set(info["columns"]) for t, info in tables.items()},
+            "relationships": relationships,
+            "date_ranges": {t: info["date_ranges"] for t, info in tables.items() if info["date_ranges"]},
+            "fingerprint": schema_fingerprint(schema, relationships),
+        }
+
+    def _current_token(self) -> list:
+        return [list(t) if t else None for t in db_version(self.db_path)]
+
+    # --- public API ---
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Re-check the database now (force=True re-introspects every table). Returns a short report."""
+        start = time.perf_counter()
+        with self._lock:
+            previous = self._snapshot if self._snapshot is not None else self._load_snapshot()
+            snap, refreshed = self._refresh(previous, force)
+            self._snapshot = snap
+            self._view = self._build_view(snap)
+            self._last_check = time.monotonic()
+            self._save_snapshot(snap)
+        duration = (time.perf_counter() - start) * 1000
+        logger.info(f"Schema catalog refreshed in {duration:.1f} ms; re-scanned tables: {refreshed or 'none'}")
+        return {
+            "fingerprint": self._view["fingerprint"],
+            "tables": len(snap["tables"]),
+            "refreshed_tables": refreshed,
+            "duration_ms": round(duration, 3),
+        }
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Schema catalog refresh failed, keeping previous snapshot: {e}")
+        finally:
+            self._refreshing.release()
+
+    def _refresh_in_background(self) -> None:
+        """Start a refresh thread unless one is already running."""
+        if self._refreshing.acquire(blocking=False):
+            threading.Thread(target=self._background_refresh, name="schema-refresh", daemon=True).start()
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._view is not None:
+                return
+            snap = self._load_snapshot()
+            if snap is not None:
+                # serve the snapshot right away, even if the file moved on since it was taken
+                self._snapshot = snap
+                self._view = self._build_view(snap)
+                self._last_check = time.monotonic()
+                logger.info(f"Loaded schema snapshot {self.snapshot_path}")
+                if snap["db_version"] != self._current_token():
+                    self._refresh_in_background()
+                return
+        # nothing to serve yet (first start; warmup normally does this before any request)
+        self.refresh()
+
+    def current(self) -> Dict[str, Any]:
+        """
+        {"schema", "schema_dict", "relationships", "date_ranges", "fingerprint"}.
+        Loads lazily; at most every `check_interval` seconds, stats the DB file
+        and, if it changed, refreshes on a background thread. The request never
+        waits for the re-scan: the previous view is returned until it finishes.
+        """
+        if self._view is None:
+            self._ensure_loaded()
+        elif time.monotonic() - self._last_check > self.check_interval:
+            self._last_check = time.monotonic()
+            if self._current_token() != self._snapshot["db_version"]:
+                self._refresh_in_background()
+        return self._view
+
+
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,258 @@
+"""
+Per-question schema pruning for the planner prompt.
+
+Each table is described once per schema fingerprint (name, columns, FK
+neighbours, plus a few words for the Northwind tables) and embedded with the
+SentenceTransformer from embeddings.py. For a question, the top-k tables by
+cosine similarity — plus any table or column named outright — are kept, then
+the tables on the FK join paths between them are added back so the planner
+can still join, along with the path to a table with a date column when the
+question is about time. Without sentence-transformers the lexical matches
+(table and column names, and the TABLE_NOTES words) pick the tables.
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, List, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_RETRIEVAL = os.getenv("SCHEMA_RETRIEVAL", "1").lower() in {"1", "true", "yes"}
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "5"))
+
+# Words users say about a table that its column names do not
+TABLE_NOTES = {
+    "Order Details": "order line items: sales, revenue, order value, amount, quantity sold, unit price, discount",
+    "Orders": "orders placed: order date (day, month, year, monthly, yearly), shipping, freight, ship country, "
+              "customer and employee",
+    "Customers": "customers / clients: company, contact, city, country, region",
+    "Products": "products: name, price, stock, discontinued, category and supplier",
+    "Categories": "product categories",
+    "Suppliers": "suppliers / vendors who supplied or supply products: company, country",
+    "Employees": "employees / staff / reps: name, title, hire date, manager",
+    "Shippers": "shipping companies",
+    "Territories": "territories of employees",
+    "Region": "regions of territories",
+}
+
+# Questions with these words (or a year) need a date column to filter or group on
+_TIME_WORDS = set("""
+    date dates day daily week weekly month months monthly quarter quarterly year years yearly annual
+    trend trends time since until during period history historical forecast predict seasonal recent
+    january february march april may june july august september october november december
+""".split())
+
+
+def _words(text: str) -> Set[str]:
+    """Lowercase word set, CamelCase split, with a naive singular form for each word."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    words = set(re.findall(r"[a-z0-9]+", text.lower()))
+    singular = {w[:-3] + "y" if w.endswith("ies") else w[:-1]
+                for w in words if len(w) > 3 and w.endswith("s") and not w.endswith("ss")}
+    return words | singular
+
+
+def _graph(relationships: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    graph: Dict[str, Set[str]] = {}
+    for r in relationships:
+        graph.setdefault(r["from_table"], set()).add(r["to_table"])
+        graph.setdefault(r["to_table"], set()).add(r["from_table"])
+    return graph
+
+
+def _join_path(graph: Dict[str, Set[str]], start: str, goal: str) -> List[str]:
+    """Shortest FK path start -> goal (BFS), inclusive; empty if not connected."""
+    return _path_to_any(graph, start, {goal})
+
+
+def _path_to_any(graph: Dict[str, Set[str]], start: str, goals: Set[str]) -> List[str]:
+    """Shortest FK path from start to the nearest of `goals` (BFS), inclusive; empty if none is connected."""
+    previous = {start: None}
+    todo = deque([start])
+    while todo:
+        node = todo.popleft()
+        if node in goals:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path[::-1]
+        for nxt in graph.get(node, ()):
+            if nxt not in previous:
+                previous[nxt] = node
+                todo.append(nxt)
+    return []
+
+
+def _distinctive_notes(tables: List[str]) -> Dict[str, Set[str]]:
+    """Per table, the TABLE_NOTES words no other table's notes use ("supplied", "monthly", not "country")."""
+    notes = {t: {w for w in _words(TABLE_NOTES.get(t, "")) if len(w) > 3} for t in tables}
+    return {t: {w for w in words if not any(w in other for u, other in notes.items() if u != t)}
+            for t, words in notes.items()}
+
+
+def _asks_about_time(question: str) -> bool:
+    return bool(_words(question) & _TIME_WORDS or re.search(r"\b(19|20)\d\d\b", question))
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, close enough for llama tokenizers on English/SQL."""
+    return (len(text) + 3) // 4
+
+
+class SchemaRetriever:
+    def __init__(self, top_k: int = SCHEMA_TOP_K, enabled: bool = SCHEMA_RETRIEVAL):
+        self.top_k = top_k
+        self.enabled = enabled
+        self._index: Dict[str, Any] | None = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "pruned": 0, "full_tokens": 0, "prompt_tokens": 0}
+        # (fingerprint, tokens of the unpruned planner prompt): the same for every question
+        self._full_tokens: tuple[str, int] | None = None
+
+    def _describe(self, context: Dict[str, Any]) -> Dict[str, str]:
+        graph = _graph(context["relationships"])
+        descriptions = {}
+        for table, columns in context["schema_dict"].items():
+            if "." in table:
+                continue  # rollup tables travel in the hints and are always offered
+            parts = [f"table {table}", TABLE_NOTES.get(table, ""), "columns: " + ", ".join(sorted(columns))]
+            if graph.get(table):
+                parts.append("joins " + ", ".join(sorted(graph[table])))
+            descriptions[table] = ". ".join(p for p in parts if p)
+        return descriptions
+
+    def _build_index(self, context: Dict[str, Any], fingerprint: str) -> Dict[str, Any]:
+        with self._lock:
+            if self._index is not None and self._index["fingerprint"] == fingerprint:
+                return self._index
+            descriptions = self._describe(context)
+            tables = list(descriptions)
+            matrix = None
+            try:
+                from app.embeddings import get_model
+                matrix = get_model().encode([descriptions[t] for t in tables], normalize_embeddings=True)
+            except Exception as e:
+                logger.warning(f"Schema retrieval falling back to lexical matching: {e}")
+            self._index = {
+                "fingerprint": fingerprint,
+                "tables": tables,
+                "matrix": matrix,
+                "words": {t: _words(f"{t} {TABLE_NOTES.get(t, '')} {' '.join(context['schema_dict'][t])}")
+                          for t in tables},
+                "notes": _distinctive_notes(tables),
+                "names": {t: _words(t) for t in tables},
+                "dated": {t for t in tables if any("date" in c.lower() for c in context["schema_dict"][t])},
+                "graph": _graph(context["relationships"]),
+            }
+            return self._index
+
+    def select_tables(self, question: str, context: Dict[str, Any], fingerprint: str) -> List[str]:
+        index = self._build_index(context, fingerprint)
+        tables = index["tables"]
+        asked = _words(question)
+
+        # a table named outright always stays
+        chosen = [t for t in tables if index["names"][t] <= asked]
+        if index["matrix"] is not None:
+            from app.embeddings import get_model
+            query = get_model().encode(question, normalize_embeddings=True)
+            scores = index["matrix"] @ query
+            ranked = [tables[i] for i in np.argsort(-scores)]
+        else:
+            # terms shared by many tables ("id", "name") say little: weight by inverse document frequency
+            terms = [_words(w) for w in re.findall(r"\w+", question)]
+            hits = {t: [i for i, variants in enumerate(terms) if variants & index["words"][t]] for t in tables}
+            df = [sum(i in h for h in hits.values()) for i in range(len(terms))]
+            score = {t: sum(np.log(len(tables) / df[i]) for i in hits[t]) for t in tables}
+            best = max(score.values(), default=0.0)
+            # a table whose notes name something asked about ("supplied", "monthly") stays a candidate
+            noted = {t for t in tables if index["notes"][t] & asked}
+            ranked = [t for t in sorted(tables, key=lambda t: -score[t])
+                      if score[t] > 0 and (score[t] >= best / 2 or t in noted)]
+        for t in ranked:
+            if len(chosen) >= self.top_k:
+                break
+            if t not in chosen:
+                chosen.append(t)
+        if not chosen:
+            return tables
+
+        # add back the tables on the join paths between the chosen ones
+        selected = list(chosen)
+        for a in chosen:
+            for b in chosen:
+                if a < b:
+                    for t in _join_path(index["graph"], a, b):
+                        if t not in selected:
+                            selected.append(t)
+
+        # "monthly sales" picks Order Details, but the dates live in Orders
+        if index["dated"] and not index["dated"] & set(selected) and _asks_about_time(question):
+            paths = [p for p in (_path_to_any(index["graph"], t, index["dated"]) for t in selected) if p]
+            for t in min(paths, key=len, default=[]):
+                if t not in selected:
+                    selected.append(t)
+        return selected
+
+    def prune(self, question: str, context: Dict[str, Any], fingerprint: str) -> Dict[str, Any]:
+        """
+        `context` (from sql_generator.plan_context) restricted to the tables
+        relevant to `question`. Returned unchanged when retrieval is off or the
+        schema is already small.
+        """
+        from app.llm import _build_plan_prompt
+
+        base_tables = [t for t in context["schema_dict"] if "." not in t]
+        if not self.enabled:
+            return context
+        pruned = context
+        if len(base_tables) > self.top_k:
+            keep = set(self.select_tables(question, context, fingerprint))
+            if len(keep) < len(base_tables):
+                lines = [line for line in context["schema"].splitlines()
+                         if line.split("(", 1)[0].strip().strip('"') in keep]
+                pruned = {
+                    "schema": "\n".join(lines),
+                    "schema_dict": {t: c for t, c in context["schema_dict"].items() if t in keep or "." in t},
+                    "relationships": [r for r in context["relationships"]
+                                      if r["from_table"] in keep and r["to_table"] in keep],
+                    "date_ranges": {t: v for t, v in (context["date_ranges"] or {}).items() if t in keep},
+                    "hints": context["hints"],
+                }
+                logger.info(f"Schema retrieval kept {sorted(keep)} of {len(base_tables)} tables")
+
+        full = self._full_prompt_tokens(context, fingerprint)
+        reduced = full if pruned is context else estimate_tokens(_build_plan_prompt(**pruned))
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["pruned"] += pruned is not context
+            self._stats["full_tokens"] += full
+            self._stats["prompt_tokens"] += reduced
+        return pruned
+
+    def _full_prompt_tokens(self, context: Dict[str, Any], fingerprint: str) -> int:
+        from app.llm import _build_plan_prompt
+
+        cached = self._full_tokens
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        full = estimate_tokens(_build_plan_prompt(**context))
+        self._full_tokens = (fingerprint, full)
+        return full
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["enabled"] = self.enabled
+        s["top_k"] = self.top_k
+        s["tokens_saved"] = s["full_tokens"] - s["prompt_tokens"]
+        s["saved_ratio"] = round(s["tokens_saved"] / s["full_tokens"], 4) if s["full_tokens"] else 0.0
+        return s
+
+
+schema_retriever = SchemaRetriever()
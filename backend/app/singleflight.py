@@ -0,0 +1,132 @@
+"""
+Request coalescing ("single flight"): concurrent calls with the same key share
+one in-flight computation instead of each running it.
+
+    plan, shared = plan_flight.do(key, generate, prompt)          # threads
+    plan, shared = await plan_flight.do_async(key, agenerate, prompt)
+
+The first caller for a key (the leader) runs the function; callers arriving
+while it runs wait for it and get the same value or exception (shared=True).
+Nothing is kept once the call finishes, so this is not a cache: it only
+collapses bursts such as a dashboard refresh firing one prompt from many users.
+
+Shared values are the very same object for every caller; callers that modify
+a result must copy it first.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.metrics import span
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1").lower() in {"1", "true", "yes"}
+
+# name -> SingleFlight, for stats()
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """
+    One coalescing group (e.g. "plan"). With `stage` set, a follower's wait is
+    timed as that metrics span, so its timings still show where the time went;
+    the leader's own spans come from the function it runs.
+    """
+
+    def __init__(self, name: str, stage: str | None = None, enabled: bool = SINGLEFLIGHT_ENABLED):
+        self.name = name
+        self.stage = stage
+        self.enabled = enabled
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        _groups[name] = self
+
+    def _wait_span(self):
+        return span(self.stage) if self.stage else nullcontext()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> tuple[Any, bool]:
+        """(fn(*args, **kwargs), shared), running fn once for all threads asking for `key` at the same time."""
+        if not self.enabled:
+            return fn(*args, **kwargs), False
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            logger.debug(f"[SINGLEFLIGHT] {self.name}: sharing in-flight call")
+            with self._wait_span():
+                return future.result(), True
+
+        try:
+            value = fn(*args, **kwargs)
+        except BaseException as e:
+            self._forget_call(key)
+            future.set_exception(e)
+            raise
+        self._forget_call(key)
+        future.set_result(value)
+        return value, False
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> tuple[Any, bool]:
+        """
+        asyncio variant of do(): the leader's coroutine runs as its own task, so a
+        caller that is cancelled (client went away) does not cancel it for the others.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs), False
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None or task.get_loop() is not loop
+            if leader:
+                task = self._tasks[key] = loop.create_task(fn(*args, **kwargs))
+                task.add_done_callback(lambda t: self._forget_task(key, t))
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if leader:
+            return await asyncio.shield(task), False
+        logger.debug(f"[SINGLEFLIGHT] {self.name}: sharing in-flight task")
+        with self._wait_span():
+            return await asyncio.shield(task), True
+
+    def _forget_call(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def _forget_task(self, key: Hashable, task: asyncio.Task) -> None:
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        # every waiter may have been cancelled; don't let asyncio log the exception as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.leaders + self.shared
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "shared_rate": round(self.shared / calls, 4) if calls else 0.0,
+            }
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in _groups.items()}
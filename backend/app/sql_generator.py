@@ -1,92 +1,74 @@
+"""
+Building blocks of the query pipeline (pipeline.py) that do not depend on how
+it is driven: plan inputs and the final SQL check, intent routing, the chart
+config and the response dict.
+"""
 import logging
-import json
-import re
+import os
 from typing import Dict, Any, List
 
-from app.llm import generate_plan
-from app.db import run_sql
-from app.schema_extractor import extract_schema, get_table_date_ranges
-from app.summarizer import summarize_data
-from app.forecast_service import forecast_arima
-
-# load schema
-schema, schema_dict, relationships = extract_schema()
-date_ranges = get_table_date_ranges()
-
-
-def _build_chart_config(chart_type: str, rows: List[Dict[str, Any]]) -> Dict[str, Any] | None:
+from app.embeddings import classify_intent
+from app.result_profile import column_values, label_column, numeric_values, profile_result
+from app.resultset import as_columnar, to_columns, to_records
+from app.forecast_engine import forecast_engine
+from app.plan_cache import schema_fingerprint
+from app.sql_validator import record as record_validation
+from app import rollups
+
+# Per-branch budgets for the post-SQL fan-out; a branch that overruns is dropped from the response
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "20"))
+FORECAST_TIMEOUT = float(os.getenv("FORECAST_TIMEOUT", "30"))
+
+# Local embeddings intent classifier; at or above INTENT_OVERRIDE_SCORE it decides the intent over the plan's
+INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "1").lower() in {"1", "true", "yes"}
+INTENT_OVERRIDE_SCORE = float(os.getenv("INTENT_OVERRIDE_SCORE", "0.8"))
+_classifier_available = True
+
+def build_chart_config(chart_type: str, result, table_rows: List[Dict[str, Any]] | None = None,
+                        profile: Dict[str, Any] | None = None) -> Dict[str, Any] | None:
     """
     Produce a generic chart config that your frontend can consume directly.
+    `result` is the columnar result from run_sql_columnar (a list of row dicts is also accepted);
+    `profile` is its profile_result(), computed here when not passed.
     Heuristics:
       - if a date/period-like column exists + one numeric metric → line
       - if two columns (label, value) → bar/pie depending on chart_type
-      - else → table
+      - else → table (with `table_rows` inlined when given)
     """
-    if not rows:
+    result = as_columnar(result)
+    if not result["rows"]:
         return None
+    if profile is None:
+        profile = profile_result(result)
 
-    # detect label and numeric value
-    keys = list(rows[0].keys())
-
-    # find likely label
-    label_key = None
-    for k in keys:
-        if any(s in k.lower() for s in ["date", "month", "year", "period", "category", "region", "product", "name"]):
-            label_key = k
-            break
-    if label_key is None:
-        label_key = keys[0]
+    keys = list(result["columns"])
 
-    # find likely numeric
-    def is_num(x):
-        return isinstance(x, (int, float)) or (isinstance(x, str) and x.replace('.', '', 1).isdigit())
-
-    num_keys = []
-    for k in keys:
-        if any(is_num(r.get(k)) for r in rows):
-            if k != label_key:
-                num_keys.append(k)
+    def table():
+        config = {"type": "table", "columns": keys}
+        if table_rows is not None:
+            config["rows"] = table_rows
+        return config
 
+    label_key = label_column(profile, keys)
+    num_keys = [k for k in profile["measures"] if k != label_key]
     if not num_keys:
         # fallback to table
-        return {
-            "type": "table",
-            "columns": keys,
-            "rows": rows
-        }
+        return table()
 
-    value_key = None
-    for pref in ["sales", "revenue", "amount", "total", "value", "freight"]:
-        vk = next((k for k in num_keys if pref in k.lower()), None)
-        if vk:
-            value_key = vk
-            break
-    if value_key is None:
-        value_key = num_keys[0]
-
-    labels = [str(r.get(label_key)) for r in rows]
-    values = []
-    for r in rows:
-        v = r.get(value_key)
-        try:
-            values.append(float(v))
-        except Exception:
-            values.append(0.0)
+    value_key = profile["value"] if profile["value"] in num_keys else num_keys[0]
+    labels = [str(v) for v in column_values(result, label_key)]
+    values = numeric_values(result, value_key).tolist()
 
     # normalize chart_type choice
     cht = chart_type.lower()
     if cht not in {"line", "bar", "pie", "table"}:
-        if any(s in label_key.lower() for s in ["date", "month", "year", "period"]):
+        if label_key == profile["time"]:
             cht = "line"
         else:
             cht = "bar"
 
     if cht == "table":
-        return {
-            "type": "table",
-            "columns": keys,
-            "rows": rows
-        }
+        return table()
 
     if cht == "pie":
         # frontends often want label/value pairs
@@ -117,33 +99,89 @@ def _build_chart_config(chart_type: str, rows: List[Dict[str, Any]]) -> Dict[str
     }
 
 
-def handle_sql(user_prompt: str) -> Dict[str, Any]:
+def make_response(intent: str, message: str, query: str | None = None, data=None,
+              chart=None, summary=None, forecast=None, truncated: bool | None = None,
+              columns: List[str] | None = None, column_data: List[List[Any]] | None = None) -> Dict[str, Any]:
+    return {
+        "intent": intent,
+        "query": query,
+        "data": data,
+        "columns": columns,
+        "column_data": column_data,
+        "chart": chart,
+        "summary": summary,
+        "forecast": forecast,
+        "message": message,
+        "truncated": truncated
+    }
+
+
+def plan_context(catalog: Dict[str, Any]) -> Dict[str, Any]:
+    """Schema inputs passed to generate_plan / generate_plan_async, including rollup tables when built."""
+    extra = rollups.describe()
+    return {
+        # rollup table definitions travel in `hints`, next to the guidance on when to use them
+        "schema": catalog["schema"],
+        "schema_dict": {**catalog["schema_dict"], **extra["schema_dict"]},
+        "relationships": catalog["relationships"],
+        "date_ranges": catalog["date_ranges"],
+        "hints": extra["hints"],
+    }
+
+
+def plan_fingerprint(catalog: Dict[str, Any]) -> str:
+    """Plan cache key part: plans built with rollup tables are not valid without them."""
+    extra = rollups.describe()
+    if not extra["schema"]:
+        return catalog["fingerprint"]
+    return f"{catalog['fingerprint']}+{schema_fingerprint(extra['schema'], [])}"
+
+
+def predict_intent(user_prompt: str) -> tuple[str, float] | None:
     """
-    Single entry point:
-      - Ask LLM for plan (intent + chart_type + sql)
-      - Execute SQL
-      - Build chart JSON
-      - Summarize
-      - If forecast intent: run ARIMA on returned historical series
+    (intent, score) from the local classifier, or None when it is off or
+    sentence-transformers is missing. A forecast prediction prestarts the
+    forecast workers while the plan is still being generated.
     """
-    plan = generate_plan(
-        user_query=user_prompt,
-        schema=schema,
-        schema_dict=schema_dict,
-        relationships=relationships,
-        date_ranges=date_ranges
-    )
-    if not plan:
-        return {
-            "intent": "historical",
-            "query": None,
-            "data": None,
-            "chart": None,
-            "summary": None,
-            "forecast": None,
-            "message": "LLM failed to produce a plan."
-        }
+    global _classifier_available
+    if not (INTENT_CLASSIFIER and _classifier_available):
+        return None
+    try:
+        predicted = classify_intent(user_prompt)
+    except ImportError as e:
+        logging.warning(f"Intent classifier unavailable: {e}")
+        _classifier_available = False
+        return None
+    if predicted[0] == "forecast":
+        forecast_engine.prestart()
+    return predicted
+
+
+def route_intent(plan_intent: str, predicted: tuple[str, float] | None) -> str:
+    """The plan's intent, unless the classifier is confident enough to decide on its own."""
+    if predicted is not None and predicted[1] >= INTENT_OVERRIDE_SCORE and predicted[0] != plan_intent:
+        logging.info(f"[INTENT] classifier routes to {predicted[0]} (score {predicted[1]:.2f}) over plan intent {plan_intent}")
+        return predicted[0]
+    return plan_intent
+
 
+def apply_check(plan: Dict[str, Any], check: Dict[str, Any], repaired: bool) -> Dict[str, Any]:
+    """Plan with the validated SQL; SQL that still fails to compile is kept with its "sql_error"."""
+    plan = {**plan, "sql": check["sql"]}
+    if check["ok"]:
+        record_validation("repaired_llm" if repaired else "fixed_locally" if check["fixes"] else "valid")
+    else:
+        record_validation("failed")
+        plan["sql_error"] = check["error"]
+    return plan
+
+
+def read_plan(plan: Dict[str, Any]) -> tuple[str, str, str, Dict[str, Any] | None]:
+    """
+    Pull intent/chart_type/sql out of a plan and run the final SQL sanity check.
+    Returns (intent, chart_type, sql, error_response); error_response is None if the SQL may run
+    (not blocked, and not left failing by plan validation).
+    """
     intent = (plan.get("intent") or "historical").lower()
     chart_type = plan.get("chart_type", "table")
     sql = plan.get("sql", "")
@@ -152,48 +190,42 @@ def handle_sql(user_prompt: str) -> Dict[str, Any]:
     forbidden = ["UPDATE", "DELETE", "DROP", "INSERT", "ALTER"]
     if any(word in sql.upper() for word in forbidden):
         logging.warning(f"[BLOCKED SQL] {sql}")
-        return {
-            "intent": intent,
-            "query": None,
-            "data": None,
-            "chart": None,
-            "summary": None,
-            "forecast": None,
-            "message": "Blocked unsafe SQL."
-        }
+        return intent, chart_type, sql, make_response(intent, "Blocked unsafe SQL.")
+    if plan.get("sql_error"):
+        return intent, chart_type, sql, make_response(intent, f"SQL Error: {plan['sql_error']}", query=sql)
 
-    # Execute SQL
-    data = run_sql(sql)
-    if isinstance(data, dict) and "error" in data:
-        return {
-            "intent": intent,
-            "query": sql,
-            "data": None,
-            "chart": None,
-            "summary": None,
-            "forecast": None,
-            "message": f"SQL Error: {data['error']}"
-        }
-
-    # Chart
-    chart = _build_chart_config(chart_type, data)
+    return intent, chart_type, sql, None
 
-    # Summary
-    summary = summarize_data(user_prompt, data)
 
-    # Forecast if requested
-    forecast = None
-    if intent == "forecast":
-        forecast = forecast_arima(data, prompt=user_prompt)
+def as_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize run_sql_columnar output; statements without rows become an empty result."""
+    if "columns" in result:
+        return result
+    return {"columns": [], "rows": [], "truncated": False}
 
-        #forecast = forecast_arima(data, horizon=3)
 
-    return {
-        "intent": intent,
-        "query": sql,
-        "data": data,
-        "chart": chart,
-        "summary": summary,
-        "forecast": forecast,
-        "message": "Query executed successfully."
-    }
+def finish_response(intent: str, sql: str, result: Dict[str, Any], chart, summary, forecast,
+            timed_out: List[str], fmt: str = "rows", data: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
+    """
+    Assemble the final response, noting any branch that was dropped after its timeout.
+    fmt="rows" puts per-row dicts in `data`; fmt="columnar" sends `columns` + one array per column instead.
+    """
+    if "summary" in timed_out:
+        summary = None
+    if "forecast" in timed_out:
+        forecast = {"note": f"Forecast timed out after {FORECAST_TIMEOUT:g}s."}
+    message = "Query executed successfully."
+    if timed_out:
+        message = f"Query executed successfully (partial: {', '.join(timed_out)} timed out)."
+    truncated = result.get("truncated", False)
+    if truncated:
+        message += f" Showing the first {len(result['rows'])} rows."
+
+    if fmt == "columnar":
+        return make_response(intent, message, query=sql, chart=chart, summary=summary,
+                         forecast=forecast, truncated=truncated, columns=result["columns"],
+                         column_data=list(to_columns(result).values()))
+    if data is None:
+        data = to_records(result)
+    return make_response(intent, message, query=sql, data=data, chart=chart,
+                     summary=summary, forecast=forecast, truncated=truncated)
@@ -0,0 +1,164 @@
+"""
+Pre-execution checks for planner SQL.
+
+validate_sql() resolves the FROM/JOIN aliases, checks every alias.column
+reference against schema_dict, applies deterministic fixes for the mistakes the
+planner is known to make, then compiles the result with EXPLAIN on a pooled
+read-only connection (SQLite's own parser and name resolution, nothing is run).
+Only SQL that still fails is worth a repair call to the LLM (llm.repair_sql).
+
+Deterministic fixes:
+  - unquoted table names containing spaces:   Order Details -> "Order Details"
+  - raw table name used after aliasing it:    Orders.OrderDate -> o.OrderDate
+  - column taken from the wrong alias, when exactly one other table in the
+    query has it:                             o.UnitPrice -> od.UnitPrice
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+from app.db import pool
+
+logger = logging.getLogger(__name__)
+
+SQL_VALIDATE = os.getenv("SQL_VALIDATE", "1").lower() in {"1", "true", "yes"}
+# One LLM repair attempt for SQL the local fixes could not make compile
+SQL_REPAIR_LLM = os.getenv("SQL_REPAIR_LLM", "1").lower() in {"1", "true", "yes"}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NAME = r'(?:"[^"]+"|\[[^\]]+\]|[A-Za-z_]\w*)'
+_KEYWORDS = r"(?:ON|WHERE|JOIN|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|GROUP|ORDER|LIMIT|USING|HAVING|UNION|WINDOW)\b"
+_TABLE_REF = re.compile(
+    rf"\b(?:FROM|JOIN)\s+((?:[A-Za-z_]\w*\.)?{_NAME})(?:\s+(?:AS\s+)?(?!{_KEYWORDS})([A-Za-z_]\w*))?",
+    re.IGNORECASE,
+)
+_COLUMN_REF = re.compile(rf'(?<![\w."\]])({_NAME})\.({_NAME})')
+
+_stats = {"checked": 0, "valid": 0, "fixed_locally": 0, "repaired_llm": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+def _unquote(name: str) -> str:
+    return name.strip('"[]')
+
+
+def _mask_literals(sql: str) -> str:
+    """Blank out string literal contents, keeping offsets, so regexes never match inside them."""
+    return _STRING_LITERAL.sub(lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+
+
+def _apply_edits(sql: str, edits: List[Tuple[int, int, str]]) -> str:
+    for start, end, text in sorted(edits, reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+
+def _quote_spaced_tables(sql: str, schema_dict: Dict[str, set]) -> Tuple[str, List[str]]:
+    fixes = []
+    for table in schema_dict:
+        if " " not in table:
+            continue
+        pattern = re.compile(rf'(?<!["\[\w]){re.escape(table)}(?!["\]\w])', re.IGNORECASE)
+        edits = [(m.start(), m.end(), f'"{table}"') for m in pattern.finditer(_mask_literals(sql))]
+        if edits:
+            sql = _apply_edits(sql, edits)
+            fixes.append(f'quoted table name "{table}"')
+    return sql, fixes
+
+
+def _aliases(masked: str, tables: Dict[str, str]) -> Dict[str, Tuple[str, str]]:
+    """alias (lowercase) -> (schema_dict key, alias as written), for FROM/JOIN references to known tables."""
+    aliases = {}
+    for m in _TABLE_REF.finditer(masked):
+        ref = m.group(1)
+        prefix, name = ("", ref) if ref.startswith(('"', "[")) else ref.rpartition(".")[::2]
+        key = f"{prefix}.{_unquote(name)}" if prefix else _unquote(name)
+        table = tables.get(key.lower())
+        if table is not None:
+            alias = m.group(2) or _unquote(name)
+            aliases[alias.lower()] = (table, alias)
+    return aliases
+
+
+def _fix_references(sql: str, schema_dict: Dict[str, set]) -> Tuple[str, List[str], List[str]]:
+    """Rewrite raw-table and wrong-alias column references; returns (sql, fixes, unresolved problems)."""
+    tables = {t.lower(): t for t in schema_dict}
+    columns = {t: {c.lower() for c in cols} for t, cols in schema_dict.items()}
+    masked = _mask_literals(sql)
+    aliases = _aliases(masked, tables)
+    # attached database names (e.g. "rollup") prefix table references, not columns
+    prefixes = {t.split(".", 1)[0].lower() for t in schema_dict if "." in t} | {"main", "temp"}
+
+    edits, fixes, problems = [], [], []
+    for m in _COLUMN_REF.finditer(masked):
+        qualifier, column = _unquote(m.group(1)), _unquote(m.group(2))
+        q = qualifier.lower()
+        if q in prefixes:
+            continue
+        replacement = None
+        if q in aliases:
+            table = aliases[q][0]
+        else:
+            aliased_as = [a for a, (t, _) in aliases.items() if t.lower() == q]
+            if len(aliased_as) != 1:
+                continue  # subquery/CTE alias or unknown name: left to EXPLAIN
+            # raw table name used after the table was given an alias
+            replacement = aliased_as[0]
+            table = aliases[replacement][0]
+
+        if column.lower() not in columns[table]:
+            owners = sorted({a for a, (t, _) in aliases.items() if column.lower() in columns[t]})
+            if len(owners) != 1:
+                problems.append(f"{qualifier}.{column}: {table} has no column {column}")
+                continue
+            replacement = owners[0]
+
+        if replacement is not None and replacement != q:
+            spelling = aliases[replacement][1]
+            edits.append((m.start(1), m.end(1), spelling))
+            fixes.append(f"{qualifier}.{column} -> {spelling}.{column}")
+    return _apply_edits(sql, edits), fixes, problems
+
+
+def explain_error(sql: str) -> str | None:
+    """Compile `sql` with EXPLAIN on a pooled read-only connection; the sqlite error message, or None."""
+    try:
+        with pool.connection() as conn:
+            conn.execute(f"EXPLAIN {sql}").fetchall()
+        return None
+    except sqlite3.Error as e:
+        return str(e)
+
+
+def validate_sql(sql: str, schema_dict: Dict[str, set]) -> Dict[str, Any]:
+    """
+    Check and locally fix `sql`.
+    Returns {"ok": bool, "sql": possibly rewritten SQL, "fixes": [...], "error": str | None}.
+    """
+    sql, fixes = _quote_spaced_tables(sql, schema_dict)
+    sql, ref_fixes, problems = _fix_references(sql, schema_dict)
+    fixes += ref_fixes
+    error = explain_error(sql)
+    if error is None and problems:
+        # EXPLAIN accepted it, so the reference check was wrong (e.g. a shadowing subquery alias)
+        logger.info(f"[SQL VALIDATE] ignoring unresolved references accepted by SQLite: {problems}")
+    if error is not None and problems:
+        error = f"{error} ({'; '.join(problems)})"
+    if fixes:
+        logger.info(f"[SQL VALIDATE] local fixes: {fixes}")
+    return {"ok": error is None, "sql": sql, "fixes": fixes, "error": error}
+
+
+def record(outcome: str) -> None:
+    """Count a validation outcome: "valid", "fixed_locally", "repaired_llm" or "failed"."""
+    with _stats_lock:
+        _stats["checked"] += 1
+        _stats[outcome] += 1
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {"enabled": SQL_VALIDATE, "llm_repair": SQL_REPAIR_LLM, **_stats}
@@ -1,31 +1,86 @@
+import hashlib
 import json
 import logging
-import os
-from groq import Groq
-from dotenv import load_dotenv
 
-load_dotenv()
+from app.llm import complete, complete_async
+from app.result_profile import profile_result
+from app.resultset import row_count
+from app.singleflight import SingleFlight
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+
+# Requests that would send the same prompt share one completion
+summary_flight = SingleFlight("summary")
+
+
+def _describe_roles(profile: dict) -> str:
+    """One line naming the time/measure/category columns so the model need not guess them from raw rows."""
+    parts = []
+    if profile["time"]:
+        parts.append(f"time={profile['time']}")
+    if profile["measures"]:
+        parts.append(f"measures={', '.join(profile['measures'])}")
+    if profile["categories"]:
+        parts.append(f"categories={', '.join(profile['categories'])}")
+    return f"Column roles: {'; '.join(parts)}\n" if parts else ""
+
+
+def _build_messages(user_query: str, rows, profile: dict | None = None) -> list[dict]:
+    if profile is None:
+        profile = profile_result(rows)
+    if isinstance(rows, dict):
+        # columnar result: column names once, then row arrays — packs more rows into the prompt budget
+        sample = {"columns": rows["columns"], "rows": rows["rows"][:200]}  # cap to avoid huge prompts
+        label = "JSON with column names then rows, truncated"
+    else:
+        sample = rows[:200]  # cap to avoid huge prompts
+        label = "JSON rows, truncated"
+    return [
+        {"role": "system", "content": "You summarize analytical SQL results briefly and clearly for business users."},
+        {"role": "user", "content": f"User question: {user_query}\n\n{_describe_roles(profile)}Data ({label}):\n{json.dumps(sample, default=str)[:6000]}\n\nWrite 3-5 concise bullet points highlighting the key insights. Avoid restating raw rows; compute relevant totals or top items if obvious."}
+    ]
 
-def summarize_data(user_query: str, rows: list[dict]) -> str | None:
-    """Summarize up to first 200 rows compactly."""
-    if not rows:
-        return "No rows returned."
 
-    sample = rows[:200]  # cap to avoid huge prompts
+def _prompt_key(messages: list[dict]) -> str:
+    return hashlib.sha1(json.dumps(messages).encode("utf-8")).hexdigest()
+
+
+def _complete_summary(messages: list[dict]) -> str | None:
     try:
-        messages = [
-            {"role": "system", "content": "You summarize analytical SQL results briefly and clearly for business users."},
-            {"role": "user", "content": f"User question: {user_query}\n\nData (JSON rows, truncated):\n{json.dumps(sample)[:6000]}\n\nWrite 3-5 concise bullet points highlighting the key insights. Avoid restating raw rows; compute relevant totals or top items if obvious."}
-        ]
-        chat = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=messages,
-            temperature=0.2
-        )
+        chat = complete("summary", model=SUMMARY_MODEL, messages=messages, temperature=0.2)
         return chat.choices[0].message.content.strip()
     except Exception as e:
         logging.error(f"[SUMMARY ERROR] {e}")
         return None
+
+
+async def _complete_summary_async(messages: list[dict]) -> str | None:
+    try:
+        chat = await complete_async("summary", model=SUMMARY_MODEL, messages=messages, temperature=0.2)
+        return chat.choices[0].message.content.strip()
+    except Exception as e:
+        logging.error(f"[SUMMARY ERROR] {e}")
+        return None
+
+
+def summarize_data(user_query: str, rows, profile: dict | None = None) -> str | None:
+    """
+    Summarize up to first 200 rows compactly. `rows` is a columnar result or a list of dicts;
+    `profile` is its profile_result(), computed when not passed.
+    """
+    if not row_count(rows):
+        return "No rows returned."
+
+    messages = _build_messages(user_query, rows, profile)
+    summary, _ = summary_flight.do(_prompt_key(messages), _complete_summary, messages)
+    return summary
+
+
+async def summarize_data_async(user_query: str, rows, profile: dict | None = None) -> str | None:
+    """Async variant of summarize_data for the asyncio request pipeline."""
+    if not row_count(rows):
+        return "No rows returned."
+
+    messages = _build_messages(user_query, rows, profile)
+    summary, _ = await summary_flight.do_async(_prompt_key(messages), _complete_summary_async, messages)
+    return summary
@@ -0,0 +1,329 @@
+"""
+Deterministic fast path for the questions users ask most (see Query_NL2SQL.txt).
+
+Each template is a regex over the normalized prompt (plan_cache.normalize_prompt)
+with named slots — n, country, year, category, horizon — and vetted SQL that
+the slots are substituted into. A match returns a plan in the same shape
+generate_plan produces, without any LLM call; anything else falls through to
+the LLM. Country and category slots must name a value that exists in the
+database (looked up once per schema), so free text never reaches the SQL.
+
+Templates are compiled once per schema with EXPLAIN (sql_validator.explain_error),
+so a database that lacks, say, Shippers simply never matches that template.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.db import pool
+from app.plan_cache import normalize_prompt
+from app.sql_validator import explain_error
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PLANNER = os.getenv("TEMPLATE_PLANNER", "1").lower() in {"1", "true", "yes"}
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20,
+}
+N = rf"(?P<n>\d+|{'|'.join(_NUMBER_WORDS)})"
+HORIZON = rf"(?P<horizon>\d+|{'|'.join(_NUMBER_WORDS)})"
+YEAR = r"(?:in|for|during) (?P<year>(?:19|20)\d{2})"
+COUNTRY = r"(?!each\b|every\b|all\b)(?P<country>[a-z][a-z ]*?)"
+CATEGORY = r"(?:the )?(?P<category>[a-z][a-z ]*?)(?: category)?"
+_ARTICLE = re.compile(r"^(?:the|a|an) ")
+
+# slot -> queries whose values the slot may take
+_SLOT_VALUE_QUERIES = {
+    "country": ["SELECT DISTINCT Country FROM Customers", "SELECT DISTINCT Country FROM Suppliers"],
+    "category": ["SELECT DISTINCT CategoryName FROM Categories"],
+}
+
+# Polite/imperative openings stripped before the templates are matched
+_LEAD_IN = re.compile(
+    r"^(?:(?:please|can you|could you) )?"
+    r"(?:show(?: me)?|list|give me|find|get|tell me|display|what (?:are|is|were|was)|what s|who (?:are|is|were)) "
+    r"(?:(?:the|all) )?"
+)
+
+_SALES = "od.Quantity * od.UnitPrice * (1 - od.Discount)"
+_YEAR_FILTER = "strftime('%Y', o.OrderDate) = '{year}'"
+_CATEGORY_FILTER = "c.CategoryName = '{category}'"
+_CATEGORY_JOINS = "JOIN Products AS p ON od.ProductID = p.ProductID JOIN Categories AS c ON p.CategoryID = c.CategoryID"
+
+# name -> regex body (fullmatch after the lead-in), SQL, chart_type, intent.
+# `where` / `joins` hold the filters and joins added only when their slot is filled.
+TEMPLATES: List[Dict[str, Any]] = [
+    {
+        "name": "top_expensive_products",
+        "pattern": rf"top(?: {N})? (?:most expensive|highest priced) products",
+        "sql": "SELECT ProductName, UnitPrice FROM Products ORDER BY UnitPrice DESC LIMIT {n}",
+        "chart_type": "bar",
+    },
+    {
+        "name": "out_of_stock_products",
+        "pattern": r"(?:which )?products (?:are |that are )?(?:currently )?out of stock",
+        "sql": "SELECT ProductName, UnitsInStock FROM Products WHERE UnitsInStock = 0 ORDER BY ProductName",
+        "chart_type": "table",
+    },
+    {
+        "name": "avg_price_by_category",
+        "pattern": r"(?:the )?average (?:unit )?price of products (?:in|by|per|for) (?:each )?category",
+        "sql": ("SELECT c.CategoryName, AVG(p.UnitPrice) AS AvgPrice FROM Products AS p "
+                "JOIN Categories AS c ON p.CategoryID = c.CategoryID GROUP BY c.CategoryName ORDER BY AvgPrice DESC"),
+        "chart_type": "bar",
+    },
+    {
+        "name": "category_most_products",
+        "pattern": r"which category has the most products",
+        "sql": ("SELECT c.CategoryName, COUNT(p.ProductID) AS ProductCount FROM Categories AS c "
+                "JOIN Products AS p ON p.CategoryID = c.CategoryID GROUP BY c.CategoryName ORDER BY ProductCount DESC"),
+        "chart_type": "bar",
+    },
+    {
+        "name": "top_customers_by_value",
+        "pattern": rf"top(?: {N})? customers by (?:total )?(?:order value|sales|revenue|spend|spending)(?: {YEAR})?",
+        "sql": ("SELECT c.CompanyName, SUM({sales}) AS TotalSales FROM Customers AS c "
+                "JOIN Orders AS o ON c.CustomerID = o.CustomerID JOIN \"Order Details\" AS od ON o.OrderID = od.OrderID "
+                "{where} GROUP BY c.CustomerID, c.CompanyName ORDER BY TotalSales DESC LIMIT {n}"),
+        "where": {"year": _YEAR_FILTER},
+        "chart_type": "bar",
+    },
+    {
+        "name": "customers_per_country",
+        "pattern": r"how many customers (?:are there )?(?:in|per|by) (?:each )?country",
+        "sql": "SELECT Country, COUNT(*) AS CustomerCount FROM Customers GROUP BY Country ORDER BY CustomerCount DESC",
+        "chart_type": "bar",
+    },
+    {
+        "name": "customers_from_country",
+        "pattern": rf"(?:which )?customers (?:are )?(?:from|in|based in|located in) {COUNTRY}",
+        "sql": "SELECT CustomerID, CompanyName, Country FROM Customers WHERE Country = '{country}' ORDER BY CompanyName",
+        "chart_type": "table",
+    },
+    {
+        "name": "customers_without_orders",
+        "pattern": (r"(?:who are )?(?:the )?customers (?:that|who) (?:haven t|have not|never|did not|didn t) "
+                    r"(?:placed|place|make|made) any orders|customers (?:with|without) no orders|customers without orders"),
+        "sql": ("SELECT c.CustomerID, c.CompanyName FROM Customers AS c LEFT JOIN Orders AS o "
+                "ON c.CustomerID = o.CustomerID WHERE o.OrderID IS NULL ORDER BY c.CompanyName"),
+        "chart_type": "table",
+    },
+    {
+        "name": "top_employees_by_sales",
+        "pattern": rf"(?:who are )?(?:the )?top(?: {N})? employees by (?:total )?(?:sales(?: revenue)?|revenue)(?: {YEAR})?",
+        "sql": ("SELECT e.FirstName || ' ' || e.LastName AS EmployeeName, SUM({sales}) AS TotalSales FROM Employees AS e "
+                "JOIN Orders AS o ON e.EmployeeID = o.EmployeeID JOIN \"Order Details\" AS od ON o.OrderID = od.OrderID "
+                "{where} GROUP BY e.EmployeeID ORDER BY TotalSales DESC LIMIT {n}"),
+        "where": {"year": _YEAR_FILTER},
+        "chart_type": "bar",
+    },
+    {
+        "name": "orders_per_employee",
+        "pattern": rf"how many orders did each employee (?:handle|process|take)(?: {YEAR})?",
+        "sql": ("SELECT e.FirstName || ' ' || e.LastName AS EmployeeName, COUNT(o.OrderID) AS OrderCount "
+                "FROM Employees AS e JOIN Orders AS o ON e.EmployeeID = o.EmployeeID {where} "
+                "GROUP BY e.EmployeeID ORDER BY OrderCount DESC"),
+        "where": {"year": _YEAR_FILTER},
+        "chart_type": "bar",
+    },
+    {
+        "name": "revenue_by_category",
+        "pattern": rf"(?:the )?total (?:revenue|sales) (?:by|per) category(?: {YEAR})?",
+        "sql": ("SELECT c.CategoryName, SUM({sales}) AS TotalSales FROM Categories AS c "
+                "JOIN Products AS p ON p.CategoryID = c.CategoryID JOIN \"Order Details\" AS od ON od.ProductID = p.ProductID "
+                "JOIN Orders AS o ON o.OrderID = od.OrderID {where} GROUP BY c.CategoryName ORDER BY TotalSales DESC"),
+        "where": {"year": _YEAR_FILTER},
+        "chart_type": "pie",
+    },
+    {
+        "name": "top_countries_by_sales",
+        "pattern": rf"(?:the )?top(?: {N})? countries by (?:total )?(?:sales|revenue)(?: {YEAR})?",
+        "sql": ("SELECT c.Country, SUM({sales}) AS TotalSales FROM Customers AS c "
+                "JOIN Orders AS o ON c.CustomerID = o.CustomerID JOIN \"Order Details\" AS od ON o.OrderID = od.OrderID "
+                "{where} GROUP BY c.Country ORDER BY TotalSales DESC LIMIT {n}"),
+        "where": {"year": _YEAR_FILTER},
+        "chart_type": "bar",
+    },
+    {
+        "name": "monthly_sales",
+        "pattern": (rf"(?:the )?(?:monthly (?:sales|revenue)(?: trends?)?|(?:sales|revenue) (?:by|per) month)"
+                    rf"(?: for {CATEGORY})?(?: {YEAR})?"),
+        "sql": ("SELECT strftime('%Y-%m', o.OrderDate) AS Month, SUM({sales}) AS Sales FROM Orders AS o "
+                "JOIN \"Order Details\" AS od ON o.OrderID = od.OrderID {joins} "
+                "{where} GROUP BY Month ORDER BY Month"),
+        "where": {"year": _YEAR_FILTER, "category": _CATEGORY_FILTER},
+        "joins": {"category": _CATEGORY_JOINS},
+        "chart_type": "line",
+    },
+    {
+        "name": "forecast_monthly_sales",
+        "pattern": (rf"(?:forecast|predict|project) (?:the )?(?:monthly )?(?:sales|revenue)(?: for {CATEGORY})?"
+                    rf"(?: (?:for|over) the next {HORIZON} months)?"),
+        "sql": ("SELECT strftime('%Y-%m', o.OrderDate) AS Month, SUM({sales}) AS Sales FROM Orders AS o "
+                "JOIN \"Order Details\" AS od ON o.OrderID = od.OrderID {joins} "
+                "{where} GROUP BY Month ORDER BY Month"),
+        "where": {"category": _CATEGORY_FILTER},
+        "joins": {"category": _CATEGORY_JOINS},
+        "chart_type": "line",
+        "intent": "forecast",
+    },
+    {
+        "name": "suppliers_in_country",
+        "pattern": rf"(?:all )?suppliers (?:that are )?(?:based |located )?(?:in|from) {COUNTRY}",
+        "sql": "SELECT SupplierID, CompanyName, Country FROM Suppliers WHERE Country = '{country}' ORDER BY CompanyName",
+        "chart_type": "table",
+    },
+    {
+        "name": "suppliers_most_products",
+        "pattern": r"which suppliers? provides? the most products",
+        "sql": ("SELECT s.CompanyName, COUNT(p.ProductID) AS ProductCount FROM Suppliers AS s "
+                "JOIN Products AS p ON p.SupplierID = s.SupplierID GROUP BY s.SupplierID ORDER BY ProductCount DESC"),
+        "chart_type": "bar",
+    },
+    {
+        "name": "shipper_most_orders",
+        "pattern": r"which shipper (?:handled|shipped|delivered) the most orders",
+        "sql": ("SELECT s.CompanyName, COUNT(o.OrderID) AS OrderCount FROM Shippers AS s "
+                "JOIN Orders AS o ON o.ShipVia = s.ShipperID GROUP BY s.ShipperID ORDER BY OrderCount DESC"),
+        "chart_type": "bar",
+    },
+]
+
+for _t in TEMPLATES:
+    _t["regex"] = re.compile(_t["pattern"])
+
+
+# Every optional slot filled, so vetting compiles the optional joins and filters too
+_PROBE_SLOTS = {"n": "10", "year": "1997", "country": "x", "category": "x"}
+
+
+def _literal(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def _number(value: str) -> int:
+    return int(_NUMBER_WORDS.get(value, value))
+
+
+def _distinct_values(queries: List[str]) -> Dict[str, str]:
+    """lowercased value -> value as stored, over every query that runs on this database."""
+    values: Dict[str, str] = {}
+    with pool.connection() as conn:
+        for sql in queries:
+            try:
+                rows = conn.execute(sql).fetchall()
+            except sqlite3.Error as e:
+                logger.info(f"Template slot values unavailable ({sql}): {e}")
+                continue
+            values.update({str(r[0]).lower(): str(r[0]) for r in rows if r[0]})
+    return values
+
+
+def _render(template: Dict[str, Any], slots: Dict[str, str]) -> str:
+    values = {
+        "n": _number(slots.get("n") or "10"),
+        "year": slots.get("year") or "",
+        "country": _literal(slots["country"]) if slots.get("country") else "",
+        "category": _literal(slots["category"]) if slots.get("category") else "",
+    }
+    clauses = [clause.format(**values) for slot, clause in template.get("where", {}).items() if slots.get(slot)]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    joins = " ".join(join for slot, join in template.get("joins", {}).items() if slots.get(slot))
+    sql = template["sql"].format(sales=_SALES, where=where, joins=joins, **values)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class TemplatePlanner:
+    def __init__(self, templates: List[Dict[str, Any]] = TEMPLATES, enabled: bool = TEMPLATE_PLANNER):
+        self.templates = templates
+        self.enabled = enabled
+        self._vetted: Dict[tuple, bool] = {}
+        # fingerprint -> {slot: {lowercased value: stored value}}, for the current schema only
+        self._slot_values: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.matches = 0
+        self.rejected = 0
+        self.unknown_values = 0
+        self.by_template: Dict[str, int] = {}
+
+    def _usable(self, template: Dict[str, Any], sql: str, fingerprint: str) -> bool:
+        """Whether the template compiles against this schema; checked once per schema."""
+        key = (template["name"], fingerprint)
+        ok = self._vetted.get(key)
+        if ok is None:
+            error = explain_error(sql)
+            if error:
+                logger.info(f"Template {template['name']} unusable on this schema: {error}")
+            ok = self._vetted[key] = error is None
+        return ok
+
+    def _resolve(self, slot: str, value: str, fingerprint: str) -> Optional[str]:
+        """The database value a country/category slot names ("the usa" -> "USA"), or None."""
+        values = self._slot_values.get(fingerprint)
+        if values is None:
+            values = {name: _distinct_values(queries) for name, queries in _SLOT_VALUE_QUERIES.items()}
+            with self._lock:
+                self._slot_values = {fingerprint: values}
+        return values[slot].get(_ARTICLE.sub("", value))
+
+    def match(self, user_prompt: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """A plan for `user_prompt` if a template fits, else None (ask the LLM)."""
+        if not self.enabled:
+            return None
+        text = _LEAD_IN.sub("", normalize_prompt(user_prompt))
+        plan = None
+        for template in self.templates:
+            m = template["regex"].fullmatch(text)
+            if m is None:
+                continue
+            slots = {k: v.strip() for k, v in m.groupdict().items() if v}
+            for slot in _SLOT_VALUE_QUERIES.keys() & slots.keys():
+                slots[slot] = self._resolve(slot, slots[slot], fingerprint)
+            if not all(slots.values()):
+                # e.g. "customers from germany sorted by name": the LLM can read what the regex can't
+                with self._lock:
+                    self.unknown_values += 1
+                continue
+            sql = _render(template, slots)
+            if not self._usable(template, _render(template, _PROBE_SLOTS), fingerprint):
+                with self._lock:
+                    self.rejected += 1
+                continue
+            plan = {
+                "intent": template.get("intent", "historical"),
+                "chart_type": template["chart_type"],
+                "sql": sql,
+                "template": template["name"],
+            }
+            if slots.get("horizon"):
+                plan["horizon"] = _number(slots["horizon"])
+            break
+
+        with self._lock:
+            self.attempts += 1
+            if plan is not None:
+                self.matches += 1
+                self.by_template[plan["template"]] = self.by_template.get(plan["template"], 0) + 1
+        return plan
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "templates": len(self.templates),
+                "attempts": self.attempts,
+                "matches": self.matches,
+                "match_rate": round(self.matches / self.attempts, 4) if self.attempts else 0.0,
+                "rejected_for_schema": self.rejected,
+                "unknown_slot_values": self.unknown_values,
+                "by_template": dict(self.by_template),
+            }
+
+
+template_planner = TemplatePlanner()
@@ -0,0 +1,131 @@
+"""
+Startup warm-up.
+
+Importing the app does no I/O: the Groq clients, the schema catalog, the
+embedding model and the forecast workers are all created on first use. run()
+makes that first use happen up front, one component at a time, and records how
+long each took. The app starts accepting connections immediately; /ready
+answers 503 until the REQUIRED components are up, then 200 with the timings.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Encode the intent examples at startup rather than on the first classified request
+WARMUP_EMBEDDINGS = os.getenv("WARMUP_EMBEDDINGS", "1").lower() in {"1", "true", "yes"}
+# Spawn the forecast worker processes at startup (off by default: they cost memory while idle)
+WARMUP_FORECAST_WORKERS = os.getenv("WARMUP_FORECAST_WORKERS", "0").lower() in {"1", "true", "yes"}
+
+# /ready stays 503 until these succeeded; the others only speed up first requests
+REQUIRED = ("database", "schema", "llm")
+
+
+class Skipped(Exception):
+    """Raised by a component that is disabled or whose optional dependency is missing."""
+
+
+def _database() -> str:
+    from app.db import DB_PATH, init_database
+    if not init_database():
+        raise RuntimeError(f"Database not accessible at {DB_PATH}")
+    return "connected"
+
+
+def _schema() -> str:
+    from app.schema_catalog import schema_catalog
+    catalog = schema_catalog.current()
+    return f"{len(catalog['schema_dict'])} tables"
+
+
+def _llm() -> str:
+    from app.llm import get_async_client, get_client
+    get_client()
+    get_async_client()
+    return "clients created"
+
+
+def _rollups() -> str:
+    from app import rollups
+    if not rollups.ROLLUPS_ENABLED:
+        raise Skipped("ROLLUPS_ENABLED is off")
+    # incremental: a no-op when the source database has not changed since the last build
+    report = rollups.refresh()
+    return report["mode"]
+
+
+def _embeddings() -> str:
+    if not WARMUP_EMBEDDINGS:
+        raise Skipped("WARMUP_EMBEDDINGS is off")
+    from app import embeddings
+    try:
+        embeddings.warm()
+    except ImportError as e:
+        raise Skipped(f"sentence-transformers not installed ({e})")
+    return embeddings.EMBEDDING_MODEL
+
+
+def _forecast_workers() -> str:
+    if not WARMUP_FORECAST_WORKERS:
+        raise Skipped("WARMUP_FORECAST_WORKERS is off")
+    from app.forecast_engine import forecast_engine
+    if not forecast_engine.workers:
+        raise Skipped("forecasts run in-process")
+    forecast_engine.prestart()
+    return f"{forecast_engine.workers} workers starting"
+
+
+# Run in this order: the required ones first so readiness is reached as early as possible
+COMPONENTS: List[Tuple[str, Callable[[], str]]] = [
+    ("database", _database),
+    ("schema", _schema),
+    ("llm", _llm),
+    ("rollups", _rollups),
+    ("embeddings", _embeddings),
+    ("forecast_workers", _forecast_workers),
+]
+
+_components: Dict[str, Dict[str, Any]] = {}
+_state = {"started": False, "finished": False, "duration_ms": None}
+_lock = threading.Lock()
+
+
+def run() -> Dict[str, Any]:
+    """Initialize every component in COMPONENTS, timing each; failures are recorded, never raised."""
+    with _lock:
+        already = _state["started"]
+        _state["started"] = True
+    if already:
+        return status()
+    start = time.perf_counter()
+    for name, init in COMPONENTS:
+        t0 = time.perf_counter()
+        try:
+            entry = {"status": "ok", "detail": init()}
+        except Skipped as e:
+            entry = {"status": "skipped", "detail": str(e)}
+        except Exception as e:
+            logger.error(f"[WARMUP ERROR] {name}: {e}")
+            entry = {"status": "error", "detail": str(e)}
+        entry["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        logger.info(f"Warm-up {name}: {entry['status']} in {entry['duration_ms']} ms")
+        with _lock:
+            _components[name] = entry
+    with _lock:
+        _state["finished"] = True
+        _state["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return status()
+
+
+def ready() -> bool:
+    with _lock:
+        return all(_components.get(name, {}).get("status") == "ok" for name in REQUIRED)
+
+
+def status() -> Dict[str, Any]:
+    is_ready = ready()
+    with _lock:
+        return {"ready": is_ready, **_state, "components": {k: dict(v) for k, v in _components.items()}}
@@ -0,0 +1,79 @@
+"""
+Deterministic stand-in for the Groq SDK clients, for offline benchmarks.
+
+Plan calls answer with the recorded plan for the question (recorded_plans.json),
+repair calls echo the SQL back, summary calls return fixed bullets. Each call
+can sleep a fixed time to mimic network latency, and reports token usage like
+the real API (~4 characters per token), so the metrics code paths run too.
+
+    fake = FakeGroq(plans, latency_ms={"plan": 250, "summary": 400})
+    llm._client, llm._async_client = fake, fake.async_client()
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+SUMMARY_TEXT = "- Totals computed from the returned rows.\n- The top item leads the rest.\n- No anomalies spotted."
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _response(content: str, messages) -> SimpleNamespace:
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    usage = SimpleNamespace(prompt_tokens=(prompt_chars + 3) // 4, completion_tokens=(len(content) + 3) // 4)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class FakeGroq:
+    """Drop-in for groq.Groq: `.chat.completions.create(model=..., messages=...)`."""
+
+    def __init__(self, plans: Dict[str, Dict[str, Any]], latency_ms: Dict[str, float] | None = None):
+        # normalized question -> {"intent", "chart_type", "sql"}
+        self.plans = {normalize_question(q): p for q, p in plans.items()}
+        self.latency_ms = {"plan": 0.0, "repair": 0.0, "summary": 0.0, **(latency_ms or {})}
+        self.calls = {"plan": 0, "repair": 0, "summary": 0, "unknown_question": 0}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, messages) -> tuple[str, str]:
+        system, user = messages[0]["content"], messages[-1]["content"]
+        if system.startswith("You summarize"):
+            return "summary", SUMMARY_TEXT
+        if "You fix SQLite" in system:
+            match = re.search(r"^SQL: (.*)$", user, re.MULTILINE)
+            return "repair", f"```sql\n{match.group(1) if match else ''}\n```"
+        plan = self.plans.get(normalize_question(user))
+        if plan is None:
+            with self._lock:
+                self.calls["unknown_question"] += 1
+            raise LookupError(f"No recorded plan for {user!r}")
+        return "plan", json.dumps(plan)
+
+    def _count(self, kind: str) -> float:
+        with self._lock:
+            self.calls[kind] += 1
+        return self.latency_ms[kind] / 1000
+
+    def create(self, model: str, messages, **kwargs):
+        kind, content = self._answer(messages)
+        delay = self._count(kind)
+        if delay:
+            time.sleep(delay)
+        return _response(content, messages)
+
+    async def acreate(self, model: str, messages, **kwargs):
+        kind, content = self._answer(messages)
+        delay = self._count(kind)
+        if delay:
+            await asyncio.sleep(delay)
+        return _response(content, messages)
+
+    def async_client(self) -> SimpleNamespace:
+        """The groq.AsyncGroq counterpart, sharing plans, latency and call counts."""
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.acreate)))
@@ -0,0 +1,415 @@
+"""
+Synthetic Northwind databases at production scale.
+
+Writes a SQLite file with the Northwind schema (same tables, columns and
+foreign keys as the bundled northwind.db, so schema_extractor, the templates
+and the recorded bench plans all work) holding about --order-details rows in
+"Order Details", e.g. 1M-100M. The data is skewed the way real sales are:
+
+  - customers and products: Zipf-like popularity (--customer-skew /
+    --product-skew), and ~1% of customers never order
+  - order dates: yearly growth (--growth), a Q4 peak, quieter weekends;
+    OrderID increases with OrderDate like in the real database
+  - 1-6 lines per order, mostly undiscounted, small quantities
+
+Rows are generated with numpy one chunk of orders at a time and written with
+executemany in one transaction per chunk, so memory stays flat at any scale.
+
+Run from backend/:
+
+    python -m bench.generate_northwind --order-details 1000000 --out ../data/northwind_1m.db
+    python -m bench.run_bench --db ../data/northwind_1m.db
+"""
+import argparse
+import json
+import logging
+import math
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE Categories (
+    CategoryID INTEGER PRIMARY KEY AUTOINCREMENT, CategoryName TEXT, Description TEXT, Picture BLOB
+);
+CREATE TABLE CustomerCustomerDemo (
+    CustomerID TEXT NOT NULL, CustomerTypeID TEXT NOT NULL,
+    PRIMARY KEY ("CustomerID", "CustomerTypeID"),
+    FOREIGN KEY (CustomerID) REFERENCES Customers (CustomerID),
+    FOREIGN KEY (CustomerTypeID) REFERENCES CustomerDemographics (CustomerTypeID)
+);
+CREATE TABLE CustomerDemographics (CustomerTypeID TEXT NOT NULL, CustomerDesc TEXT, PRIMARY KEY ("CustomerTypeID"));
+CREATE TABLE Customers (
+    CustomerID TEXT, CompanyName TEXT, ContactName TEXT, ContactTitle TEXT, Address TEXT, City TEXT,
+    Region TEXT, PostalCode TEXT, Country TEXT, Phone TEXT, Fax TEXT, PRIMARY KEY (CustomerID)
+);
+CREATE TABLE Employees (
+    EmployeeID INTEGER PRIMARY KEY AUTOINCREMENT, LastName TEXT, FirstName TEXT, Title TEXT,
+    TitleOfCourtesy TEXT, BirthDate DATE, HireDate DATE, Address TEXT, City TEXT, Region TEXT,
+    PostalCode TEXT, Country TEXT, HomePhone TEXT, Extension TEXT, Photo BLOB, Notes TEXT,
+    ReportsTo INTEGER, PhotoPath TEXT,
+    FOREIGN KEY (ReportsTo) REFERENCES Employees (EmployeeID)
+);
+CREATE TABLE EmployeeTerritories (
+    EmployeeID INTEGER NOT NULL, TerritoryID TEXT NOT NULL,
+    PRIMARY KEY ("EmployeeID", "TerritoryID"),
+    FOREIGN KEY (EmployeeID) REFERENCES Employees (EmployeeID),
+    FOREIGN KEY (TerritoryID) REFERENCES Territories (TerritoryID)
+);
+CREATE TABLE "Order Details" (
+    OrderID INTEGER NOT NULL, ProductID INTEGER NOT NULL, UnitPrice NUMERIC NOT NULL DEFAULT 0,
+    Quantity INTEGER NOT NULL DEFAULT 1, Discount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY ("OrderID", "ProductID"),
+    CHECK (Discount >= (0) AND Discount <= (1)), CHECK (Quantity > (0)), CHECK (UnitPrice >= (0)),
+    FOREIGN KEY (OrderID) REFERENCES Orders (OrderID),
+    FOREIGN KEY (ProductID) REFERENCES Products (ProductID)
+);
+CREATE TABLE Orders (
+    OrderID INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, CustomerID TEXT, EmployeeID INTEGER,
+    OrderDate DATETIME, RequiredDate DATETIME, ShippedDate DATETIME, ShipVia INTEGER,
+    Freight NUMERIC DEFAULT 0, ShipName TEXT, ShipAddress TEXT, ShipCity TEXT, ShipRegion TEXT,
+    ShipPostalCode TEXT, ShipCountry TEXT,
+    FOREIGN KEY (EmployeeID) REFERENCES Employees (EmployeeID),
+    FOREIGN KEY (CustomerID) REFERENCES Customers (CustomerID),
+    FOREIGN KEY (ShipVia) REFERENCES Shippers (ShipperID)
+);
+CREATE TABLE Products (
+    ProductID INTEGER PRIMARY KEY AUTOINCREMENT, ProductName TEXT NOT NULL, SupplierID INTEGER,
+    CategoryID INTEGER, QuantityPerUnit TEXT, UnitPrice NUMERIC DEFAULT 0, UnitsInStock INTEGER DEFAULT 0,
+    UnitsOnOrder INTEGER DEFAULT 0, ReorderLevel INTEGER DEFAULT 0, Discontinued TEXT NOT NULL DEFAULT '0',
+    CHECK (UnitPrice >= (0)), CHECK (ReorderLevel >= (0)), CHECK (UnitsInStock >= (0)), CHECK (UnitsOnOrder >= (0)),
+    FOREIGN KEY (CategoryID) REFERENCES Categories (CategoryID),
+    FOREIGN KEY (SupplierID) REFERENCES Suppliers (SupplierID)
+);
+CREATE TABLE Regions (RegionID INTEGER NOT NULL PRIMARY KEY, RegionDescription TEXT NOT NULL);
+CREATE TABLE Shippers (ShipperID INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, CompanyName TEXT NOT NULL, Phone TEXT);
+CREATE TABLE Suppliers (
+    SupplierID INTEGER PRIMARY KEY AUTOINCREMENT, CompanyName TEXT NOT NULL, ContactName TEXT,
+    ContactTitle TEXT, Address TEXT, City TEXT, Region TEXT, PostalCode TEXT, Country TEXT, Phone TEXT,
+    Fax TEXT, HomePage TEXT
+);
+CREATE TABLE Territories (
+    TerritoryID TEXT NOT NULL, TerritoryDescription TEXT NOT NULL, RegionID INTEGER NOT NULL,
+    PRIMARY KEY ("TerritoryID"),
+    FOREIGN KEY (RegionID) REFERENCES Regions (RegionID)
+);
+"""
+
+# Secondary indexes for --indexes (the bundled database has none)
+INDEXES = [
+    'CREATE INDEX idx_orders_orderdate ON Orders (OrderDate)',
+    'CREATE INDEX idx_orders_customerid ON Orders (CustomerID)',
+    'CREATE INDEX idx_orders_employeeid ON Orders (EmployeeID)',
+    'CREATE INDEX idx_order_details_productid ON "Order Details" (ProductID)',
+    'CREATE INDEX idx_products_categoryid ON Products (CategoryID)',
+]
+
+CATEGORIES = [
+    ("Beverages", "Soft drinks, coffees, teas, beers, and ales"),
+    ("Condiments", "Sweet and savory sauces, relishes, spreads, and seasonings"),
+    ("Confections", "Desserts, candies, and sweet breads"),
+    ("Dairy Products", "Cheeses"),
+    ("Grains/Cereals", "Breads, crackers, pasta, and cereal"),
+    ("Meat/Poultry", "Prepared meats"),
+    ("Produce", "Dried fruit and bean curd"),
+    ("Seafood", "Seaweed and fish"),
+]
+SHIPPERS = [("Speedy Express", "(503) 555-9831"), ("United Package", "(503) 555-3199"),
+            ("Federal Shipping", "(503) 555-9931")]
+# (FirstName, LastName, Title, TitleOfCourtesy, ReportsTo, share of orders)
+EMPLOYEES = [
+    ("Nancy", "Davolio", "Sales Representative", "Ms.", 2, 0.15),
+    ("Andrew", "Fuller", "Vice President, Sales", "Dr.", None, 0.12),
+    ("Janet", "Leverling", "Sales Representative", "Ms.", 2, 0.15),
+    ("Margaret", "Peacock", "Sales Representative", "Mrs.", 2, 0.19),
+    ("Steven", "Buchanan", "Sales Manager", "Mr.", 2, 0.05),
+    ("Michael", "Suyama", "Sales Representative", "Mr.", 5, 0.08),
+    ("Robert", "King", "Sales Representative", "Mr.", 5, 0.09),
+    ("Laura", "Callahan", "Inside Sales Coordinator", "Ms.", 2, 0.12),
+    ("Anne", "Dodsworth", "Sales Representative", "Ms.", 5, 0.05),
+]
+REGIONS = ["Eastern", "Western", "Northern", "Southern"]
+# country -> (cities, share of customers)
+COUNTRIES: Dict[str, tuple] = {
+    "USA": (["Seattle", "Portland", "Boise", "Anchorage", "Albuquerque", "San Francisco"], 0.14),
+    "Germany": (["Berlin", "München", "Frankfurt a.M.", "Köln", "Stuttgart"], 0.12),
+    "France": (["Paris", "Lyon", "Marseille", "Nantes", "Strasbourg"], 0.12),
+    "Brazil": (["São Paulo", "Rio de Janeiro", "Resende", "Campinas"], 0.10),
+    "UK": (["London", "Cowes", "Manchester"], 0.08),
+    "Spain": (["Madrid", "Barcelona", "Sevilla"], 0.06),
+    "Mexico": (["México D.F.", "Monterrey"], 0.06),
+    "Venezuela": (["Caracas", "San Cristóbal"], 0.04),
+    "Argentina": (["Buenos Aires"], 0.03),
+    "Italy": (["Torino", "Bergamo", "Reggio Emilia"], 0.04),
+    "Canada": (["Montréal", "Tsawassen", "Vancouver"], 0.04),
+    "Sweden": (["Luleå", "Bräcke"], 0.03),
+    "Belgium": (["Bruxelles", "Charleroi"], 0.03),
+    "Switzerland": (["Genève", "Bern"], 0.03),
+    "Austria": (["Graz", "Salzburg"], 0.03),
+    "Portugal": (["Lisboa"], 0.02),
+    "Denmark": (["København", "Århus"], 0.02),
+    "Finland": (["Helsinki", "Oulu"], 0.02),
+    "Ireland": (["Cork"], 0.01),
+    "Norway": (["Stavern"], 0.01),
+    "Poland": (["Warszawa"], 0.01),
+}
+_SYLLABLES = ["ka", "lo", "mi", "ra", "su", "te", "vo", "ni", "da", "pe", "zu", "ko", "fa", "ri", "no", "be"]
+_SUFFIXES = ["Tea", "Sauce", "Cheese", "Chocolate", "Bread", "Sausage", "Fruit", "Herring", "Coffee", "Syrup", "Pasta"]
+
+
+def _zipf_weights(n: int, s: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _customer_ids(n: int) -> List[str]:
+    """Unique 5-letter IDs like ALFKI (26^5 > 11M)."""
+    ids, letters = [], np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    index = np.arange(n) * 7919 % 26 ** 5  # 7919 is coprime with 26: a permutation, so no repeats
+    for i in range(5):
+        ids.append(letters[(index // 26 ** (4 - i)) % 26])
+    return ["".join(t) for t in zip(*ids)]
+
+
+def _order_lines(rng: np.random.Generator, order_ids: np.ndarray, product_p: np.ndarray):
+    """(order id, product id) lines, 1 + Binomial(5, 0.3) per order, one per product as the primary key requires."""
+    lines = 1 + rng.binomial(5, 0.3, size=order_ids.size)
+    line_order = np.repeat(order_ids, lines)
+    line_product = rng.choice(product_p.size, size=line_order.size, p=product_p) + 1
+    _, keep = np.unique(line_order * (product_p.size + 1) + line_product, return_index=True)  # sorted by order
+    return line_order[keep], line_product[keep]
+
+
+def _lines_per_order(product_p: np.ndarray, seed: int) -> float:
+    """Mean lines per order after duplicate products are dropped, from a pilot sample."""
+    pilot = 20_000
+    line_order, _ = _order_lines(np.random.default_rng(seed + 1), np.arange(pilot), product_p)
+    return line_order.size / pilot
+
+
+def _day_weights(start: date, days: int, growth: float) -> np.ndarray:
+    offsets = np.arange(days)
+    dates = np.array([start + timedelta(days=int(d)) for d in offsets])
+    months = np.array([d.month for d in dates])
+    weekdays = np.array([d.weekday() for d in dates])
+    trend = (1 + growth) ** (offsets / 365.25)
+    season = 1 + 0.25 * np.cos((months - 11.5) / 12 * 2 * np.pi)  # peaks in Nov/Dec, low in May/Jun
+    weekly = np.where(weekdays >= 5, 0.4, 1.0)
+    w = trend * season * weekly
+    return w / w.sum()
+
+
+def _names(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n made-up brand-like words of two or three syllables."""
+    syllables = np.array(_SYLLABLES)
+    words = np.char.add(syllables[rng.integers(0, len(syllables), n)], syllables[rng.integers(0, len(syllables), n)])
+    third = np.where(rng.random(n) < 0.5, syllables[rng.integers(0, len(syllables), n)], "")
+    return np.char.capitalize(np.char.add(words, third))
+
+
+def _with_suffix(rng: np.random.Generator, names: np.ndarray, suffixes: List[str]) -> List[str]:
+    return np.char.add(np.char.add(names, " "), np.array(suffixes)[rng.integers(0, len(suffixes), names.size)]).tolist()
+
+
+def _places(rng: np.random.Generator, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """(country, city) for n addresses, countries weighted by their share of customers."""
+    countries = np.array(list(COUNTRIES))
+    shares = np.array([COUNTRIES[c][1] for c in countries])
+    country = rng.choice(len(countries), size=n, p=shares / shares.sum())
+    city = np.empty(n, dtype=object)
+    for i, name in enumerate(countries):
+        mask = country == i
+        city[mask] = np.array(COUNTRIES[name][0], dtype=object)[rng.integers(0, len(COUNTRIES[name][0]), mask.sum())]
+    return countries[country], city
+
+
+def _dimension_rows(rng: np.random.Generator, n_customers: int, n_products: int, n_suppliers: int):
+    country, city = _places(rng, n_suppliers)
+    suppliers = list(zip(range(1, n_suppliers + 1),
+                         _with_suffix(rng, _names(rng, n_suppliers), ["Ltd.", "Co.", "Inc.", "AB", "GmbH"]),
+                         [f"Contact {i}" for i in range(1, n_suppliers + 1)], ["Sales Representative"] * n_suppliers,
+                         [f"{n} Main St." for n in rng.integers(1, 999, n_suppliers).tolist()], city.tolist(),
+                         [None] * n_suppliers, rng.integers(10000, 99999, n_suppliers).astype(str).tolist(),
+                         country.tolist(), ["(555) 555-0100"] * n_suppliers, [None] * n_suppliers,
+                         [None] * n_suppliers))
+
+    prices = np.round(np.exp(rng.normal(3.0, 0.8, size=n_products)), 2).clip(2.5, 300)
+    stock = np.where(rng.random(n_products) < 0.07, 0, rng.integers(1, 125, size=n_products))
+    products = list(zip(range(1, n_products + 1), _with_suffix(rng, _names(rng, n_products), _SUFFIXES),
+                        rng.integers(1, n_suppliers + 1, n_products).tolist(),
+                        rng.integers(1, len(CATEGORIES) + 1, n_products).tolist(),
+                        [f"{n} units" for n in rng.integers(1, 48, n_products).tolist()],
+                        prices.tolist(), stock.tolist(), rng.choice([0, 0, 0, 10, 40], n_products).tolist(),
+                        rng.choice([0, 5, 10, 25], n_products).tolist(),
+                        np.where(rng.random(n_products) < 0.1, "1", "0").tolist()))
+
+    country, city = _places(rng, n_customers)
+    customers = list(zip(_customer_ids(n_customers),
+                         _with_suffix(rng, _names(rng, n_customers),
+                                      ["Markt", "Delikatessen", "Trading", "Imports", "Foods"]),
+                         [f"Contact {i}" for i in range(1, n_customers + 1)], ["Owner"] * n_customers,
+                         [f"{n} Market St." for n in rng.integers(1, 999, n_customers).tolist()], city.tolist(),
+                         [None] * n_customers, rng.integers(10000, 99999, n_customers).astype(str).tolist(),
+                         country.tolist(), ["(555) 555-0199"] * n_customers, [None] * n_customers))
+    return suppliers, products, customers, prices
+
+
+def _write_dimensions(conn: sqlite3.Connection, suppliers, products, customers) -> None:
+    conn.executemany("INSERT INTO Categories (CategoryID, CategoryName, Description) VALUES (?, ?, ?)",
+                     [(i + 1, n, d) for i, (n, d) in enumerate(CATEGORIES)])
+    conn.executemany("INSERT INTO Shippers VALUES (?, ?, ?)", [(i + 1, n, p) for i, (n, p) in enumerate(SHIPPERS)])
+    conn.executemany("INSERT INTO Regions VALUES (?, ?)", [(i + 1, r) for i, r in enumerate(REGIONS)])
+    conn.executemany(
+        "INSERT INTO Employees (EmployeeID, FirstName, LastName, Title, TitleOfCourtesy, BirthDate, HireDate, "
+        "City, Country, ReportsTo) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(i + 1, f, l, t, c, f"{1950 + 3 * i}-0{1 + i % 9}-15", f"{2010 + i % 4}-0{1 + i % 9}-01",
+          "Seattle" if i < 5 else "London", "USA" if i < 5 else "UK", r)
+         for i, (f, l, t, c, r, _) in enumerate(EMPLOYEES)])
+    territories = [(f"{10000 + i * 37:05d}", f"Territory {i + 1}", 1 + i % len(REGIONS)) for i in range(53)]
+    conn.executemany("INSERT INTO Territories VALUES (?, ?, ?)", territories)
+    conn.executemany("INSERT INTO EmployeeTerritories VALUES (?, ?)",
+                     [(1 + i % len(EMPLOYEES), t[0]) for i, t in enumerate(territories)])
+    conn.executemany("INSERT INTO Suppliers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", suppliers)
+    conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", products)
+    conn.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", customers)
+    conn.commit()
+
+
+def generate(out: Path, order_details: int, seed: int = 7, start: date = date(2016, 1, 1),
+             end: date = date(2023, 12, 31), growth: float = 0.15, customer_skew: float = 1.1,
+             product_skew: float = 0.8, customers: int | None = None, products: int = 77, suppliers: int = 29,
+             chunk_orders: int = 100_000, indexes: bool = False) -> Dict[str, object]:
+    """Build the database at `out`; returns row counts and timings."""
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    # popularity: shuffled so the heavy products/customers are not simply the first IDs
+    product_p = _zipf_weights(products, product_skew)[rng.permutation(products)]
+    n_orders = max(1, math.ceil(order_details / _lines_per_order(product_p, seed)))
+    n_customers = customers or max(91, n_orders // 40)
+
+    conn = sqlite3.connect(str(out))
+    for pragma in ("journal_mode = OFF", "synchronous = OFF", "locking_mode = EXCLUSIVE",
+                   "temp_store = MEMORY", "cache_size = -262144"):
+        conn.execute(f"PRAGMA {pragma}")
+    conn.executescript(SCHEMA)
+
+    supplier_rows, product_rows, customer_rows, prices = _dimension_rows(rng, n_customers, products, suppliers)
+    _write_dimensions(conn, supplier_rows, product_rows, customer_rows)
+    customer_ids = np.array([c[0] for c in customer_rows])
+    customer_names = np.array([c[1] for c in customer_rows])
+    customer_city = np.array([c[5] for c in customer_rows])
+    customer_country = np.array([c[8] for c in customer_rows])
+
+    # ~1% of customers never order
+    customer_p = _zipf_weights(n_customers, customer_skew)[rng.permutation(n_customers)]
+    customer_p[rng.random(n_customers) < 0.01] = 0.0
+    customer_p /= customer_p.sum()
+    employee_p = np.array([e[5] for e in EMPLOYEES])
+    employee_p /= employee_p.sum()
+
+    # orders per day, then OrderIDs handed out in date order
+    days = (end - start).days + 1
+    per_day = rng.multinomial(n_orders, _day_weights(start, days, growth))
+    day_end = np.cumsum(per_day)
+    day_text = np.array([(start + timedelta(days=d)).isoformat() for d in range(days + 40)], dtype=object)
+    midnight = day_text + " 00:00:00"
+    # order timestamps: business hours 08:00-18:00, looked up by day * 11 + hour offset
+    stamps = np.array([f"{d} {h:02d}:00:00" for d in day_text[:days] for h in range(8, 19)], dtype=object)
+
+    written = 0
+    for first in range(0, n_orders, chunk_orders):
+        if written >= order_details:
+            break
+        n = min(chunk_orders, n_orders - first)
+        order_ids = np.arange(first + 1, first + n + 1)
+        day = np.searchsorted(day_end, np.arange(first, first + n), side="right")
+        cust = rng.choice(n_customers, size=n, p=customer_p)
+        shipped = day + rng.integers(1, 11, size=n)
+        unshipped = day >= days - 14  # the most recent orders are still open
+        hour = rng.integers(0, 11, size=n)
+        order_rows = list(zip(
+            order_ids.tolist(), customer_ids[cust].tolist(),
+            (rng.choice(len(EMPLOYEES), size=n, p=employee_p) + 1).tolist(),
+            stamps[day * 11 + hour].tolist(),
+            midnight[day + 28].tolist(),
+            np.where(unshipped, None, midnight[shipped]).tolist(),
+            rng.integers(1, len(SHIPPERS) + 1, size=n).tolist(),
+            np.round(rng.gamma(1.5, 50.0, size=n), 2).tolist(),
+            customer_names[cust].tolist(), [None] * n, customer_city[cust].tolist(), [None] * n, [None] * n,
+            customer_country[cust].tolist(),
+        ))
+
+        line_order, line_product = _order_lines(rng, order_ids, product_p)
+        room = order_details - written
+        if line_order.size > room:
+            line_order, line_product = line_order[:room], line_product[:room]
+        m = line_order.size
+        quantity = np.minimum(1 + rng.geometric(0.06, size=m), 130)
+        discount = rng.choice([0.0, 0.05, 0.1, 0.15, 0.2, 0.25], size=m, p=[0.6, 0.1, 0.1, 0.08, 0.07, 0.05])
+        detail_rows = zip(line_order.tolist(), line_product.tolist(), prices[line_product - 1].tolist(),
+                          quantity.tolist(), discount.tolist())
+
+        with conn:
+            conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             order_rows[:int(line_order[-1]) - first] if m else [])
+            conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', detail_rows)
+        written += m
+        rate = written / (time.perf_counter() - t0)
+        logger.info(f"{written:,}/{order_details:,} order details ({rate:,.0f} rows/s)")
+
+    if indexes:
+        for sql in INDEXES:
+            conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+    counts = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0]
+              for t in ("Customers", "Products", "Orders", "Order Details")}
+    conn.close()
+    return {"database": str(out), "rows": counts, "bytes": out.stat().st_size,
+            "seconds": round(time.perf_counter() - t0, 2), "seed": seed}
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Northwind SQLite database.")
+    parser.add_argument("--order-details", type=int, default=1_000_000, help='approximate "Order Details" rows')
+    parser.add_argument("--out", required=True, help="database file to create")
+    parser.add_argument("--force", action="store_true", help="overwrite --out if it exists")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2016, 1, 1), help="first order date")
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2023, 12, 31), help="last order date")
+    parser.add_argument("--growth", type=float, default=0.15, help="yearly growth of the order volume")
+    parser.add_argument("--customers", type=int, help="customer count (default: one per ~40 orders, at least 91)")
+    parser.add_argument("--products", type=int, default=77)
+    parser.add_argument("--suppliers", type=int, default=29)
+    parser.add_argument("--customer-skew", type=float, default=1.1, help="Zipf exponent of customer popularity")
+    parser.add_argument("--product-skew", type=float, default=0.8, help="Zipf exponent of product popularity")
+    parser.add_argument("--chunk-orders", type=int, default=100_000, help="orders generated and inserted per batch")
+    parser.add_argument("--indexes", action="store_true", help="also create secondary indexes on the hot columns")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    out = Path(args.out)
+    if out.exists():
+        if not args.force:
+            print(f"{out} exists; pass --force to overwrite", file=sys.stderr)
+            return 1
+        out.unlink()
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    report = generate(out, args.order_details, seed=args.seed, start=args.start, end=args.end,
+                      growth=args.growth, customer_skew=args.customer_skew, product_skew=args.product_skew,
+                      customers=args.customers, products=args.products, suppliers=args.suppliers,
+                      chunk_orders=args.chunk_orders, indexes=args.indexes)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
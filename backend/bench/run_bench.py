@@ -0,0 +1,287 @@
+"""
+Offline throughput/latency benchmark for the query pipeline.
+
+Replays the questions of Query_NL2SQL.txt (plus the extra time-series and
+forecast questions in recorded_plans.json, and optional synthetic rewordings)
+through handle_sql / handle_sql_async with the Groq clients replaced by
+fake_groq.FakeGroq, so runs need no network or API key and are repeatable.
+For each concurrency level it reports p50/p95/p99 latency and throughput per
+pipeline stage (the metrics.py spans) and writes a JSON report; --compare
+flags stages whose p95 got worse than in an earlier report.
+
+Run from backend/:
+
+    python -m bench.run_bench --db ../data/northwind.db --concurrency 1,4,16 --passes 3
+    python -m bench.run_bench --compare bench/results/bench-20260101-120000.json
+
+Plan and result caches are cleared at the start of every level, so the
+first pass over the questions is cold and later passes are warm.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+PROJECT_ROOT = BACKEND_DIR.parent
+QUESTIONS_FILE = PROJECT_ROOT / "Query_NL2SQL.txt"
+PLANS_FILE = BENCH_DIR / "recorded_plans.json"
+RESULTS_DIR = BENCH_DIR / "results"
+
+# Rewordings for --variants: they miss the exact-match plan cache but map to the same recorded plan
+_PREFIXES = ["Please tell me: ", "Quick question - ", "I'd like to know: ", "Can you check: ", "For the report, "]
+
+
+def load_questions(path: Path = QUESTIONS_FILE) -> List[str]:
+    """The question lines of Query_NL2SQL.txt (section headings skipped)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip().endswith(("?", "."))]
+
+
+def make_variants(questions: List[str], per_question: int, seed: int) -> Dict[str, str]:
+    """variant text -> the question it rewords; deterministic for a given seed."""
+    rng = random.Random(seed)
+    variants = {}
+    for question in questions:
+        for _ in range(per_question):
+            text = rng.choice(_PREFIXES) + question
+            if rng.random() < 0.5:
+                text = text.lower()
+            if rng.random() < 0.5:
+                text = text.rstrip("?.")
+            variants[text] = question
+    return variants
+
+
+def _percentiles(values: List[float], wall: float) -> Dict[str, float]:
+    a = np.asarray(values, dtype=float)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {
+        "count": int(a.size),
+        "mean_ms": round(float(a.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(a.max()), 3),
+        "qps": round(a.size / wall, 2) if wall else 0.0,
+    }
+
+
+def summarize_level(concurrency: int, samples: List[tuple], wall: float) -> Dict[str, Any]:
+    """samples: (timings dict, response) per request."""
+    stages = sorted({stage for timings, _ in samples for stage in timings})
+    errors: Dict[str, int] = {}
+    for _, response in samples:
+        message = response.get("message") or ""
+        if not message.startswith("Query executed successfully"):
+            key = message.split(":", 1)[0][:60]
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "wall_s": round(wall, 3),
+        "qps": round(len(samples) / wall, 2) if wall else 0.0,
+        "errors": errors,
+        "stages": {s: _percentiles([t[s] for t, _ in samples if s in t], wall) for s in stages},
+    }
+
+
+def _clear_caches() -> None:
+    from app.plan_cache import plan_cache
+    from app.result_cache import result_cache
+    plan_cache.clear()
+    result_cache.clear()
+
+
+def run_sync_level(workload: List[str], concurrency: int) -> Dict[str, Any]:
+    from app import metrics
+    from app.pipeline import handle_sql
+
+    def one(question):
+        with metrics.collect_timings("bench") as timings:
+            response = handle_sql(question)
+        return timings, response
+
+    _clear_caches()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, workload))
+    return summarize_level(concurrency, samples, time.perf_counter() - start)
+
+
+async def run_async_levels(workload: List[str], levels: List[int]) -> List[Dict[str, Any]]:
+    # one event loop for every level: the pipeline's stage semaphores bind to the loop that first uses them
+    from app import metrics
+    from app.pipeline import handle_sql_async
+
+    reports = []
+    for concurrency in levels:
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(question):
+            async with gate:
+                with metrics.collect_timings("bench") as timings:
+                    response = await handle_sql_async(question)
+                return timings, response
+
+        _clear_caches()
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(one(q) for q in workload))
+        reports.append(summarize_level(concurrency, samples, time.perf_counter() - start))
+    return reports
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """Stages whose p95 grew by more than `threshold` (relative) and `min_delta_ms` (absolute)."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in report["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        for stage, stats in level["stages"].items():
+            before = old["stages"].get(stage)
+            if before is None:
+                continue
+            delta = stats["p95_ms"] - before["p95_ms"]
+            if delta > min_delta_ms and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"c={level['concurrency']} {stage}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+    return regressions
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _print_level(level: Dict[str, Any]) -> None:
+    print(f"\nconcurrency={level['concurrency']}  requests={level['requests']}  "
+          f"wall={level['wall_s']}s  qps={level['qps']}  errors={level['errors'] or 0}")
+    print(f"  {'stage':<11} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'qps':>9}")
+    for stage, s in level["stages"].items():
+        print(f"  {stage:<11} {s['count']:>6} {s['p50_ms']:>10} {s['p95_ms']:>10} {s['p99_ms']:>10} {s['qps']:>9}")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", help="SQLite database to query (default: DB_PATH or data/northwind.db)")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync",
+                        help="handle_sql on a thread pool, or handle_sql_async on one event loop")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--passes", type=int, default=3, help="times the workload is replayed per level")
+    parser.add_argument("--variants", type=int, default=0, help="synthetic rewordings per question")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--plan-latency-ms", type=float, default=0.0, help="simulated Groq latency of a plan call")
+    parser.add_argument("--summary-latency-ms", type=float, default=0.0, help="simulated Groq latency of a summary")
+    parser.add_argument("--no-templates", action="store_true", help="send every question to the (fake) LLM planner")
+    parser.add_argument("--llm-rpm", type=float, default=0, help="Groq requests/minute limit to simulate (0 = none)")
+    parser.add_argument("--llm-tpm", type=float, default=0, help="Groq tokens/minute limit to simulate (0 = none)")
+    parser.add_argument("--out", help="report path (default: bench/results/bench-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier report to check for p95 regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative p95 growth counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args(argv)
+
+    # app modules read their configuration at import time
+    if args.db:
+        os.environ["DB_PATH"] = str(Path(args.db).resolve())
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    from app import llm, warmup
+    from app.llm_gateway import RateLimiter, gateway
+    from app.db import DB_PATH
+    from app.pipeline import shutdown
+    from app.template_planner import template_planner
+    from bench.fake_groq import FakeGroq
+
+    with open(PLANS_FILE, "r", encoding="utf-8") as f:
+        recorded = json.load(f)
+    questions = load_questions()
+    missing = [q for q in questions if q not in recorded]
+    if missing:
+        print(f"No recorded plan for {len(missing)} question(s), they will fail: {missing}", file=sys.stderr)
+    questions += [q for q in recorded if q not in questions]
+    variants = make_variants(questions, args.variants, args.seed)
+    plans = {**recorded, **{v: recorded[q] for v, q in variants.items() if q in recorded}}
+
+    fake = FakeGroq(plans, latency_ms={"plan": args.plan_latency_ms, "summary": args.summary_latency_ms})
+    llm._client, llm._async_client = fake, fake.async_client()
+    gateway.limiter = RateLimiter(args.llm_rpm, args.llm_tpm)
+    if args.no_templates:
+        template_planner.enabled = False
+
+    startup = warmup.run()
+    workload = (questions + list(variants)) * args.passes
+    random.Random(args.seed).shuffle(workload)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    try:
+        if args.mode == "async":
+            reports = asyncio.run(run_async_levels(workload, levels))
+        else:
+            reports = [run_sync_level(workload, c) for c in levels]
+    finally:
+        shutdown()
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "db": str(DB_PATH),
+            "db_bytes": DB_PATH.stat().st_size if DB_PATH.exists() else None,
+            "questions": len(questions),
+            "variants": len(variants),
+            "args": vars(args),
+            "llm_calls": dict(fake.calls),
+            "llm_gateway": gateway.stats(),
+            "startup_ms": {name: c["duration_ms"] for name, c in startup["components"].items()},
+        },
+        "levels": reports,
+    }
+    for level in reports:
+        _print_level(level)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        workload_args = ("mode", "passes", "variants", "seed", "plan_latency_ms", "summary_latency_ms", "no_templates",
+                         "llm_rpm", "llm_tpm")
+        changed = [a for a in workload_args
+                   if baseline["meta"]["args"].get(a, report["meta"]["args"][a]) != report["meta"]["args"][a]]
+        if changed:
+            print(f"\nWarning: workload differs from the baseline in {changed}; timings may not be comparable")
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions (p95):\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo p95 regressions against", args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
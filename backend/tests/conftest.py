@@ -0,0 +1,38 @@
+"""
+Tests run against a small throwaway Northwind-shaped database. app.db reads
+DB_PATH at import time, so it is created and exported here, before any test
+module imports the app.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+_tmp = Path(tempfile.mkdtemp(prefix="salesbot-tests-"))
+TEST_DB = _tmp / "northwind.db"
+
+with sqlite3.connect(TEST_DB) as _conn:
+    _conn.executescript("""
+        CREATE TABLE Categories (CategoryID INTEGER PRIMARY KEY, CategoryName TEXT);
+        CREATE TABLE Products (ProductID INTEGER PRIMARY KEY, ProductName TEXT, CategoryID INTEGER,
+                               UnitPrice NUMERIC);
+        CREATE TABLE Customers (CustomerID TEXT PRIMARY KEY, CompanyName TEXT, Country TEXT);
+        CREATE TABLE Suppliers (SupplierID INTEGER PRIMARY KEY, CompanyName TEXT, Country TEXT);
+        CREATE TABLE Orders (OrderID INTEGER PRIMARY KEY, CustomerID TEXT, EmployeeID INTEGER, OrderDate DATETIME);
+        CREATE TABLE "Order Details" (OrderID INTEGER, ProductID INTEGER, UnitPrice NUMERIC, Quantity INTEGER,
+                                      Discount REAL, PRIMARY KEY (OrderID, ProductID));
+        INSERT INTO Categories VALUES (1, 'Beverages'), (2, 'Condiments');
+        INSERT INTO Products VALUES (1, 'Chai', 1, 18), (2, 'Chang', 1, 19), (3, 'Aniseed Syrup', 2, 10);
+        INSERT INTO Customers VALUES ('ALFKI', 'Alfreds Futterkiste', 'Germany'), ('ANATR', 'Ana Trujillo', 'Mexico');
+        INSERT INTO Suppliers VALUES (1, 'Exotic Liquids', 'UK'), (2, 'New Orleans Cajun Delights', 'USA');
+        INSERT INTO Orders VALUES (1, 'ALFKI', 1, '2016-07-04 00:00:00'), (2, 'ANATR', 1, '2016-08-01 00:00:00');
+        INSERT INTO "Order Details" VALUES (1, 1, 18, 2, 0), (1, 3, 10, 1, 0), (2, 2, 19, 5, 0.1);
+    """)
+
+os.environ["DB_PATH"] = str(TEST_DB)
+os.environ["ROLLUP_DB_PATH"] = str(_tmp / "northwind_rollups.db")
+os.environ.setdefault("GROQ_API_KEY", "test")
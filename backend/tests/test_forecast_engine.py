@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("statsmodels")
+
+from app.forecast_engine import ForecastEngine  # noqa: E402
+
+
+def _monthly(n: int):
+    rows = [(f"{2019 + i // 12}-{i % 12 + 1:02d}-01", 100.0 + 5 * i + (i % 12) * 3.0) for i in range(n)]
+    return {"columns": ["Month", "Sales"], "rows": rows, "truncated": False}
+
+
+def test_arima_fits_are_reused_across_worker_processes(monkeypatch):
+    # read when the worker imports forecast_service: no model selection, so ARIMA is always the fit
+    monkeypatch.setenv("FORECAST_MODEL", "arima")
+    engine = ForecastEngine(workers=1, timeout=120)
+    try:
+        # the backtest fit on the head of the series warm-starts the full fit
+        assert engine.forecast(_monthly(24), horizon=3)["model_cache"] == "warm_start"
+        # fresh worker processes: only the parent's copy of the cache can make these hits
+        engine.shutdown()
+        assert engine.forecast(_monthly(24), horizon=3)["model_cache"] == "hit"
+        engine.shutdown()
+        assert engine.forecast(_monthly(25), horizon=3)["model_cache"] == "warm_start"
+    finally:
+        engine.shutdown()
@@ -0,0 +1,46 @@
+from app.index_advisor import IndexAdvisor, explain
+
+SCHEMA = {
+    "Products": {"ProductID", "ProductName", "CategoryID", "UnitPrice"},
+    "Categories": {"CategoryID", "CategoryName"},
+}
+
+
+def test_full_scan_without_predicates_has_no_recommendations():
+    info = explain("SELECT ProductName, UnitPrice FROM Products ORDER BY UnitPrice DESC LIMIT 10", SCHEMA)
+    assert "Products" in info["full_scans"]
+    assert info["recommendations"] == []
+
+
+def test_report_with_query_without_where_clause():
+    advisor = IndexAdvisor()
+    advisor.record("SELECT ProductName, UnitPrice FROM Products ORDER BY UnitPrice DESC LIMIT 10")
+    advisor.record("SELECT ProductName FROM Products WHERE CategoryID = 1")
+
+    report = advisor.report(SCHEMA)
+
+    assert report["recorded_queries"] == 2
+    assert all("error" not in q for q in report["queries"])
+    assert [r["column"] for r in report["recommendations"]] == ["CategoryID"]
+
+
+def test_apply_attaches_rollup_database(tmp_path):
+    import sqlite3
+
+    from app.db import ROLLUP_DB_PATH, pool
+
+    with sqlite3.connect(ROLLUP_DB_PATH) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS sales_by_month (Month TEXT, Sales REAL)")
+    pool.recycle()  # pooled connections attach the rollup file when they are opened
+    try:
+        advisor = IndexAdvisor()
+        advisor.record("SELECT Month, Sales FROM rollup.sales_by_month ORDER BY Month")
+        advisor.record("SELECT ProductName FROM Products WHERE CategoryID = 1")
+
+        result = advisor.apply(SCHEMA, target=tmp_path / "indexed.db", repeat=1)
+
+        assert result["skipped"] == []
+        assert len(result["timings"]) == 2
+    finally:
+        ROLLUP_DB_PATH.unlink()
+        pool.recycle()
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics, pipeline, sql_generator
+from app.db import pool
+from app.plan_cache import plan_cache
+from app.schema_catalog import schema_catalog
+
+
+def test_fetch_batches_caps_rows_and_frees_the_sql_slot_before_the_reader():
+    async def run():
+        batches = asyncio.Queue()
+        truncated = await pipeline._fetch_batches('SELECT * FROM "Order Details"', batches, max_rows=2)
+        # nothing has been read yet, but the query is finished and its slot is free
+        assert pipeline._stage("sql")._value == pipeline.STAGE_LIMITS["sql"]
+        rows = []
+        while (batch := batches.get_nowait()) is not None:
+            rows.extend(batch[1])
+        return truncated, rows
+
+    truncated, rows = asyncio.run(run())
+    assert truncated
+    assert len(rows) == 2
+    assert pool.stats()["in_use"] == 0
+
+
+def test_handle_sql_runs_the_async_pipeline_for_blocking_callers(monkeypatch):
+    async def summary(user_prompt, rows, profile=None):
+        return "Two categories."
+
+    monkeypatch.setattr(pipeline, "summarize_async", summary)
+    monkeypatch.setattr(sql_generator, "INTENT_CLASSIFIER", False)
+    prompt = "categories by id"
+    plan_cache.put(prompt, sql_generator.plan_fingerprint(schema_catalog.current()),
+                   {"intent": "historical", "chart_type": "table",
+                    "sql": "SELECT CategoryID, CategoryName FROM Categories ORDER BY CategoryID"})
+
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        responses = list(threads.map(pipeline.handle_sql, [prompt] * 4))
+    assert all(r["data"] == [{"CategoryID": 1, "CategoryName": "Beverages"},
+                             {"CategoryID": 2, "CategoryName": "Condiments"}] for r in responses)
+    assert responses[0]["summary"] == "Two categories."
+
+
+def test_schema_pruning_runs_off_the_event_loop(monkeypatch):
+    threads = {}
+
+    def prune(question, context, fingerprint):
+        threads["prune"] = threading.current_thread()
+        return context
+
+    async def generate(user_query, **context):
+        return None
+
+    monkeypatch.setattr(pipeline.schema_retriever, "prune", prune)
+    monkeypatch.setattr(pipeline, "generate_plan_async", generate)
+
+    async def run():
+        threads["loop"] = threading.current_thread()
+        await pipeline._llm_plan_async("top products", schema_catalog.current(), "fp")
+
+    asyncio.run(run())
+    assert threads["prune"] is not threads["loop"]
+
+
+def test_llm_planned_request_observes_plan_once(monkeypatch):
+    async def generate(user_query, **context):
+        return None
+
+    monkeypatch.setattr(pipeline, "generate_plan_async", generate)
+
+    async def run():
+        with metrics.collect_timings("query") as timings:
+            await pipeline._get_plan_async("which shipper is the slowest")
+        return timings
+
+    def plan_count():
+        return metrics.STAGE_SECONDS._series.get(("plan",), [None, 0.0, 0])[2]
+
+    before = plan_count()
+    timings = asyncio.run(run())
+    assert plan_count() == before + 1
+    assert {"plan", "plan_lookup"} <= set(timings)
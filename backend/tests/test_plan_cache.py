@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.plan_cache import PlanCache, entity_slots, normalize_prompt, schema_vocabulary
+
+SCHEMA = {"Customers": {"CustomerID", "CompanyName", "Country"}, "Orders": {"OrderID", "OrderDate"}}
+
+
+def _semantic_cache() -> PlanCache:
+    cache = PlanCache(semantic=True)
+    # every prompt embeds the same, so only the slot and number checks can tell them apart
+    cache._embed = lambda text: np.ones(4) / 2
+    return cache
+
+
+def test_entity_slots_skip_filler_and_schema_words():
+    vocabulary = schema_vocabulary(SCHEMA)
+    assert entity_slots(normalize_prompt("Show me the customers from Germany"), vocabulary) == {"germany"}
+    assert entity_slots(normalize_prompt("monthly orders by country in 1997"), vocabulary) == set()
+
+
+def test_semantic_hit_needs_the_same_entity_slots():
+    cache = _semantic_cache()
+    cache.put("customers from Germany", "fp", {"sql": "SELECT * FROM Customers WHERE Country = 'Germany'"})
+
+    assert cache.get("customers from France", "fp", SCHEMA) is None
+    assert cache.get("list all customers", "fp", SCHEMA) is None
+    assert cache.get("show me the customers in germany", "fp", SCHEMA)["sql"].endswith("'Germany'")
+    assert cache.stats()["semantic_hits"] == 1
@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import rollups
+from app.db import DB_PATH, ROLLUP_DB_PATH, pool
+
+
+@pytest.fixture
+def source():
+    """Writable connection to the test database; rows added by a test are removed again."""
+    conn = sqlite3.connect(DB_PATH)
+    yield conn
+    conn.execute('DELETE FROM "Order Details" WHERE OrderID > 2')
+    conn.execute("DELETE FROM Orders WHERE OrderID > 2")
+    conn.execute("UPDATE \"Order Details\" SET Quantity = 2 WHERE OrderID = 1 AND ProductID = 1")
+    conn.execute("UPDATE Orders SET OrderDate = '2016-07-04 00:00:00' WHERE OrderID = 1")
+    conn.commit()
+    conn.close()
+    ROLLUP_DB_PATH.unlink(missing_ok=True)
+    pool.recycle()
+
+
+def _monthly_sales():
+    with pool.connection() as conn:
+        return dict(conn.execute("SELECT Month, Sales FROM rollup.sales_by_month").fetchall())
+
+
+def test_append_is_incremental_and_edits_rebuild(source):
+    assert rollups.refresh(full=True)["mode"] == "full"
+    assert rollups.refresh()["mode"] == "unchanged"
+    assert rollups.current()
+
+    source.execute("INSERT INTO Orders VALUES (3, 'ALFKI', 1, '2016-09-02 00:00:00')")
+    source.execute('INSERT INTO "Order Details" VALUES (3, 1, 18, 1, 0)')
+    source.commit()
+    report = rollups.refresh()
+    assert report["mode"] == "incremental"
+    assert report["months_refreshed"] == ["2016-09"]
+
+    # an edit to an old order alongside a new one is not append-only
+    source.execute("UPDATE \"Order Details\" SET Quantity = 10 WHERE OrderID = 1 AND ProductID = 1")
+    source.execute("INSERT INTO Orders VALUES (4, 'ANATR', 1, '2016-09-03 00:00:00')")
+    source.execute('INSERT INTO "Order Details" VALUES (4, 2, 19, 1, 0)')
+    source.commit()
+    assert rollups.refresh()["mode"] == "full"
+    assert _monthly_sales()["2016-07"] == pytest.approx(10 * 18 + 10)
+
+
+def test_order_moved_to_another_month_rebuilds(source):
+    rollups.refresh(full=True)
+    # same lines and sums, different bucket
+    source.execute("UPDATE Orders SET OrderDate = '2016-08-04 00:00:00' WHERE OrderID = 1")
+    source.commit()
+    assert rollups.refresh()["mode"] == "full"
+    assert "2016-07" not in _monthly_sales()
+
+
+def test_stale_rollups_are_withheld(source):
+    rollups.refresh(full=True)
+    assert rollups.describe()["schema"]
+
+    source.execute("UPDATE \"Order Details\" SET Quantity = 3 WHERE OrderID = 1 AND ProductID = 1")
+    source.commit()
+    stale = rollups.describe()
+    # the background refresh may already have caught up; otherwise nothing is offered
+    assert stale["schema"] == "" or rollups.current()
+
+    deadline = time.monotonic() + 5
+    while not rollups.current() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert rollups.describe()["schema"]
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import pipeline, sql_generator
+from app.plan_cache import plan_cache
+from app.routes import router
+from app.schema_catalog import schema_catalog
+
+PROMPT = "list the categories"
+PLAN = {"intent": "historical", "chart_type": "table",
+        "sql": "SELECT CategoryID, CategoryName FROM Categories ORDER BY CategoryID"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def summary(user_prompt, rows, profile=None):
+        return "Two categories."
+
+    monkeypatch.setattr(pipeline, "summarize_async", summary)
+    monkeypatch.setattr(sql_generator, "INTENT_CLASSIFIER", False)
+    plan_cache.put(PROMPT, sql_generator.plan_fingerprint(schema_catalog.current()), PLAN)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_query_returns_the_response_model(client):
+    body = client.post("/query", json={"prompt": PROMPT, "format": "columnar"}).json()
+    assert body["columns"] == ["CategoryID", "CategoryName"]
+    assert body["column_data"] == [[1, 2], ["Beverages", "Condiments"]]
+    assert body["data"] is None
+
+
+def test_stream_row_batches_follow_the_body_format(client):
+    lines = client.post("/query/stream?transport=ndjson", json={"prompt": PROMPT}).text.splitlines()
+    rows = [e for e in map(json.loads, lines) if e["event"] == "rows"]
+    assert rows[0]["data"] == [{"CategoryID": 1, "CategoryName": "Beverages"},
+                               {"CategoryID": 2, "CategoryName": "Condiments"}]
+
+    text = client.post("/query/stream?transport=sse", json={"prompt": PROMPT, "format": "columnar"}).text
+    assert text.startswith("event: plan\n")
+    rows = [json.loads(line[len("data: "):]) for line in text.splitlines()
+            if line.startswith("data: ") and '"event": "rows"' in line]
+    assert rows[0]["column_data"] == [[1, 2], ["Beverages", "Condiments"]]
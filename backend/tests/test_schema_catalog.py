@@ -0,0 +1,50 @@
+import sqlite3
+
+from app.db import DB_PATH
+from app.schema_catalog import SchemaCatalog
+
+
+def _set_order_date(order_id: int, date: str) -> None:
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("UPDATE Orders SET OrderDate = ? WHERE OrderID = ?", (date, order_id))
+
+
+def test_in_place_update_moves_date_ranges_after_background_refresh(tmp_path):
+    catalog = SchemaCatalog(snapshot_dir=tmp_path, check_interval=0)
+    before = catalog.current()["date_ranges"]["Orders"]["OrderDate"]
+    try:
+        # not an append: the row count and MAX(rowid) stay the same
+        _set_order_date(1, "2018-05-06 00:00:00")
+        assert catalog.current()["date_ranges"]["Orders"]["OrderDate"] == before
+        with catalog._refreshing:
+            pass
+        assert catalog.current()["date_ranges"]["Orders"]["OrderDate"]["max"] == "2018-05-06 00:00:00"
+    finally:
+        _set_order_date(1, "2016-07-04 00:00:00")
+
+
+def test_stale_snapshot_is_served_while_refreshing(tmp_path):
+    SchemaCatalog(snapshot_dir=tmp_path).refresh()
+    try:
+        _set_order_date(2, "2019-01-01 00:00:00")
+        catalog = SchemaCatalog(snapshot_dir=tmp_path)
+        assert catalog.current()["date_ranges"]["Orders"]["OrderDate"]["max"] == "2016-08-01 00:00:00"
+        with catalog._refreshing:
+            pass
+        assert catalog.current()["date_ranges"]["Orders"]["OrderDate"]["max"] == "2019-01-01 00:00:00"
+    finally:
+        _set_order_date(2, "2016-08-01 00:00:00")
+
+
+def test_append_rescans_only_that_table(tmp_path):
+    catalog = SchemaCatalog(snapshot_dir=tmp_path)
+    catalog.refresh()
+    try:
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("INSERT INTO Orders VALUES (9, 'ALFKI', 1, '2017-02-03 00:00:00')")
+        report = catalog.refresh()
+        assert report["refreshed_tables"] == ["Orders"]
+        assert catalog.current()["date_ranges"]["Orders"]["OrderDate"]["max"] == "2017-02-03 00:00:00"
+    finally:
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("DELETE FROM Orders WHERE OrderID = 9")
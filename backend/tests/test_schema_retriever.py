@@ -0,0 +1,58 @@
+from app.schema_retriever import SchemaRetriever
+
+SCHEMA = {
+    "Categories": {"CategoryID", "CategoryName", "Description"},
+    "Customers": {"CustomerID", "CompanyName", "City", "Country"},
+    "Employees": {"EmployeeID", "LastName", "FirstName", "HireDate"},
+    "Order Details": {"OrderID", "ProductID", "UnitPrice", "Quantity", "Discount"},
+    "Orders": {"OrderID", "CustomerID", "EmployeeID", "OrderDate", "ShipVia", "Freight"},
+    "Products": {"ProductID", "ProductName", "SupplierID", "CategoryID", "UnitPrice"},
+    "Shippers": {"ShipperID", "CompanyName", "Phone"},
+    "Suppliers": {"SupplierID", "CompanyName", "Country"},
+}
+FKS = [("Order Details", "OrderID", "Orders"), ("Order Details", "ProductID", "Products"),
+       ("Orders", "CustomerID", "Customers"), ("Orders", "EmployeeID", "Employees"),
+       ("Orders", "ShipVia", "Shippers"), ("Products", "SupplierID", "Suppliers"),
+       ("Products", "CategoryID", "Categories")]
+CONTEXT = {
+    "schema": "\n".join(f"{t}({', '.join(sorted(c))})" for t, c in SCHEMA.items()),
+    "schema_dict": SCHEMA,
+    "relationships": [{"from_table": a, "from_col": col, "to_table": b, "to_col": col} for a, col, b in FKS],
+    "date_ranges": {},
+    "hints": "",
+}
+
+
+def _lexical_retriever() -> SchemaRetriever:
+    retriever = SchemaRetriever(top_k=3)
+    index = retriever._build_index(CONTEXT, "fp")
+    index["matrix"] = None  # as without sentence-transformers
+    return retriever
+
+
+def test_time_questions_keep_a_table_with_dates():
+    tables = _lexical_retriever().select_tables("monthly sales for beverages", CONTEXT, "fp")
+    assert {"Order Details", "Orders"} <= set(tables)
+
+
+def test_table_notes_words_select_the_table():
+    tables = _lexical_retriever().select_tables("products supplied by exotic liquids", CONTEXT, "fp")
+    assert {"Products", "Suppliers"} <= set(tables)
+
+
+def test_full_prompt_is_measured_once_per_fingerprint(monkeypatch):
+    from app import llm
+
+    retriever = _lexical_retriever()
+    built = []
+    original = llm._build_plan_prompt
+
+    def counting(**context):
+        built.append(len(context["schema_dict"]))
+        return original(**context)
+
+    monkeypatch.setattr(llm, "_build_plan_prompt", counting)
+    retriever.prune("monthly sales", CONTEXT, "fp")
+    retriever.prune("top customers", CONTEXT, "fp")
+    assert built.count(len(SCHEMA)) == 1
+    assert retriever.stats()["requests"] == 2
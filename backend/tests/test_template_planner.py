@@ -0,0 +1,36 @@
+import pytest
+
+from app.template_planner import TemplatePlanner
+
+FINGERPRINT = "test-schema"
+
+
+@pytest.fixture
+def planner():
+    return TemplatePlanner(enabled=True)
+
+
+def test_country_slot_resolves_to_stored_value(planner):
+    plan = planner.match("List all suppliers based in the USA.", FINGERPRINT)
+    assert plan["template"] == "suppliers_in_country"
+    assert "Country = 'USA'" in plan["sql"]
+
+    plan = planner.match("customers from germany", FINGERPRINT)
+    assert "Country = 'Germany'" in plan["sql"]
+
+
+@pytest.mark.parametrize("prompt", [
+    "customers from germany sorted by name",
+    "forecast sales for next year",
+    "suppliers in atlantis",
+])
+def test_unknown_slot_values_fall_through_to_llm(planner, prompt):
+    assert planner.match(prompt, FINGERPRINT) is None
+    assert planner.stats()["unknown_slot_values"] == 1
+
+
+def test_category_slot_and_forecast_horizon(planner):
+    plan = planner.match("Forecast sales for beverages for the next six months", FINGERPRINT)
+    assert plan["intent"] == "forecast"
+    assert "c.CategoryName = 'Beverages'" in plan["sql"]
+    assert plan["horizon"] == 6